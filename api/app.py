@@ -1,20 +1,31 @@
 import os
-import json
 import time
-import requests
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 
+from guardian_common import metrics
 from db.mongo import db
+from db.indexes import ensure_indexes
 from core.redis_client import redis_client
+from core import cv_client
+from core.events import (
+    BACKPRESSURE_RETRY_AFTER_SECONDS, EVENT_BACKPRESSURE, EVENT_LAG_MAX, EVENT_LAG_MAX_SECONDS, admission,
+    event_streams, overloaded, publish_surplus_event, stream_lag,
+)
+from core.jobs import create_job
 
 from routes.auth import auth_bp
 from routes.me import me_bp
 from routes.prefs import prefs_bp
 from routes.stores import stores_bp
 from routes.email import email_bp
+from routes.ingest import ingest_bp
+from routes.jobs import jobs_bp
 
-CV_URL = os.getenv("CV_URL", "http://cv:8002")
+# "sync" waits for the CV result; "async" queues a job (cv_jobs.py) and returns 202 with its id.
+UPLOAD_MODE = os.getenv("UPLOAD_MODE", "sync")
+
+REQUEST_SECONDS = metrics.histogram("api_request_seconds", "HTTP request time", ["method", "route", "status"])
 
 
 def create_app():
@@ -28,6 +39,30 @@ def create_app():
         methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     )
 
+    ensure_indexes(db)
+
+    @app.before_request
+    def start_timer():
+        g.started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        if "started" in g:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - g.started, method=request.method, route=route,
+                                    status=response.status_code)
+        return response
+
+    @app.get("/metrics")
+    def metrics_endpoint():
+        return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+    @app.get("/debug/profile")
+    def debug_profile():
+        status, body = metrics.profile(request.args.get("seconds", 10), request.args.get("interval_ms", 5),
+                                       request.headers.get("X-Profile-Token", ""))
+        return Response(body, status=status, mimetype="text/plain")
+
     @app.get("/health")
     def health():
         return jsonify({"status": "ok"})
@@ -43,6 +78,17 @@ def create_app():
         doc = db["test"].find_one(sort=[("_id", -1)])
         return jsonify({"last_doc": {"hello": doc.get("hello")}})
 
+    @app.get("/health/events")
+    def events_health():
+        streams = [stream_lag(s) for s in event_streams()]
+        behind = [s["stream"] for s in streams if overloaded(s)]
+        return jsonify({
+            "status": "overloaded" if behind else "ok",
+            "overloaded": behind,
+            "limits": {"lag": EVENT_LAG_MAX, "oldest_seconds": EVENT_LAG_MAX_SECONDS},
+            "streams": streams,
+        })
+
     @app.post("/upload-test")
     def upload_test():
         store_id = None
@@ -60,26 +106,34 @@ def create_app():
         if not store_id:
             store_id = body.get("store_id", "store_123")
 
-        if "image" in request.files:
-            img = request.files["image"]
-            files = {"image": (img.filename or "image.jpg", img.stream, img.content_type or "application/octet-stream")}
-            cv_resp = requests.post(f"{CV_URL}/infer", files=files, timeout=30)
-        else:
-            cv_resp = requests.post(f"{CV_URL}/infer", timeout=10)
-
-        if cv_resp.status_code != 200:
-            print(f"CV error: {cv_resp.status_code} - {cv_resp.text}")
-            return jsonify({"error": f"CV service error: {cv_resp.text}"}), 500
+        if "image" not in request.files:
+            return jsonify({"error": "image file required (form field name: 'image')"}), 400
+        img = request.files["image"]
+        filename = img.filename or "image.jpg"
+        content_type = img.content_type or "application/octet-stream"
+        image_bytes = img.read()
+
+        mode = request.args.get("mode") or request.form.get("mode") or body.get("mode") or UPLOAD_MODE
+        backlog = admission(store_id) if EVENT_BACKPRESSURE != "off" else None
+        if backlog and EVENT_BACKPRESSURE == "reject":
+            return (jsonify({"error": "event processing is behind, retry later", "backlog": backlog}), 429,
+                    {"Retry-After": str(BACKPRESSURE_RETRY_AFTER_SECONDS)})
+        if backlog:
+            mode = "async"
+
+        if mode == "async":
+            job_id = create_job(store_id, image_bytes, filename, content_type)
+            return jsonify({"ok": True, "store_id": store_id, "job_id": job_id, "status": "queued",
+                            "status_url": f"/jobs/{job_id}", "degraded": bool(backlog)}), 202
 
-        cv_resp.raise_for_status()
-        detections = cv_resp.json()
+        try:
+            detections = cv_client.infer(image_bytes, filename, content_type)
+        except cv_client.CVError as e:
+            print(f"CV error: {e}")
+            return jsonify({"error": str(e)}), e.status
         items = [x["label"] for x in detections.get("items", [])]
 
-        redis_client.xadd("events:surplus", {
-            "store_id": store_id,
-            "items": json.dumps(items),
-            "timestamp": int(time.time())
-        })
+        publish_surplus_event(store_id, items)
 
         return jsonify({"ok": True, "store_id": store_id, "items": items})
 
@@ -88,6 +142,8 @@ def create_app():
     app.register_blueprint(prefs_bp)
     app.register_blueprint(stores_bp)
     app.register_blueprint(email_bp)
+    app.register_blueprint(ingest_bp)
+    app.register_blueprint(jobs_bp)
 
     return app
 
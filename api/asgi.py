@@ -0,0 +1,96 @@
+"""ASGI serving mode for the user-facing API routes (auth, me, prefs, stores, email), plus the
+live match stream (GET /me/stream, Server-Sent Events) that only this app serves.
+
+Same URLs and JSON as app.py, served by Quart on one event loop per process
+with Motor and redis.asyncio; bcrypt runs on a bounded thread pool
+(core/auth_async.py). Uploads, video ingestion and jobs stay on the Flask app.
+
+    hypercorn asgi:app --bind 0.0.0.0:5000 --workers 2
+"""
+import asyncio
+import time
+
+from quart import Quart, Response, g, jsonify, request
+from quart_cors import cors
+
+from guardian_common import metrics
+from core.auth_async import shutdown_pool
+from core.redis_async import redis_client
+from db.indexes import ensure_indexes_async
+from db.mongo_async import client as mongo_client, db
+
+from async_routes.auth import auth_bp
+from async_routes.me import me_bp
+from async_routes.prefs import prefs_bp
+from async_routes.stores import stores_bp
+from async_routes.email import email_bp
+from async_routes.feed import feed_bp, dispatcher
+
+REQUEST_SECONDS = metrics.histogram("api_request_seconds", "HTTP request time", ["method", "route", "status"])
+
+
+def create_app():
+    app = Quart(__name__)
+    app = cors(
+        app,
+        allow_origin=["http://localhost:3000", "http://localhost:5173", "http://localhost"],
+        allow_credentials=True,
+        allow_headers=["Content-Type", "Authorization", "Last-Event-ID"],
+        allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    )
+
+    @app.before_request
+    async def start_timer():
+        g.started = time.perf_counter()
+
+    @app.after_request
+    async def record_request(response):
+        # For /me/stream this is when the headers go out, not when the connection closes.
+        if "started" in g:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - g.started, method=request.method, route=route,
+                                    status=response.status_code)
+        return response
+
+    @app.get("/metrics")
+    async def metrics_endpoint():
+        return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+    @app.get("/debug/profile")
+    async def debug_profile():
+        # Sampled from a thread so the event loop keeps running (and shows up in the stacks).
+        status, body = await asyncio.to_thread(
+            metrics.profile, request.args.get("seconds", 10), request.args.get("interval_ms", 5),
+            request.headers.get("X-Profile-Token", ""))
+        return Response(body, status=status, mimetype="text/plain")
+
+    @app.get("/health")
+    async def health():
+        return jsonify({"status": "ok"})
+
+    @app.before_serving
+    async def ensure_indexes():
+        await ensure_indexes_async(db)
+
+    @app.before_serving
+    async def start_feed():
+        await dispatcher.start()
+
+    @app.after_serving
+    async def close_clients():
+        await dispatcher.stop()
+        await redis_client.aclose()
+        mongo_client.close()
+        shutdown_pool()
+
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(me_bp)
+    app.register_blueprint(prefs_bp)
+    app.register_blueprint(stores_bp)
+    app.register_blueprint(email_bp)
+    app.register_blueprint(feed_bp)
+
+    return app
+
+
+app = create_app()
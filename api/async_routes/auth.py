@@ -0,0 +1,56 @@
+from pymongo.errors import DuplicateKeyError
+from quart import Blueprint, request, jsonify
+
+from db.mongo_async import db
+from core.auth import create_token
+from core.auth_async import HashPoolBusy, busy_response, hash_password_async, verify_password_async
+from core.users import parse_credentials, new_user
+
+auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
+
+
+@auth_bp.post("/signup")
+async def signup():
+    email, password = parse_credentials(await request.get_json(force=True) or {})
+
+    if not email or "@" not in email:
+        return jsonify({"error": "Valid email required"}), 400
+
+    existing = await db["users"].find_one({"email": email}, {"_id": 1})
+    if existing:
+        return jsonify({"error": "Email already in use"}), 409
+
+    try:
+        password_hash = await hash_password_async(password)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except HashPoolBusy:
+        return busy_response()
+
+    try:
+        res = await db["users"].insert_one(new_user(email, password_hash))
+    except DuplicateKeyError:  # a concurrent signup got past the find_one first
+        return jsonify({"error": "Email already in use"}), 409
+    user_id = str(res.inserted_id)
+    token = create_token(user_id)
+    return jsonify({"token": token, "user_id": user_id})
+
+
+@auth_bp.post("/login")
+async def login():
+    email, password = parse_credentials(await request.get_json(force=True) or {})
+
+    user = await db["users"].find_one({"email": email}, {"password_hash": 1})
+    if not user:
+        return jsonify({"error": "Invalid credentials"}), 401
+
+    try:
+        ok = await verify_password_async(password, user.get("password_hash", ""))
+    except HashPoolBusy:
+        return busy_response()
+    if not ok:
+        return jsonify({"error": "Invalid credentials"}), 401
+
+    user_id = str(user["_id"])
+    token = create_token(user_id)
+    return jsonify({"token": token, "user_id": user_id})
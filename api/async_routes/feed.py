@@ -0,0 +1,29 @@
+from quart import Blueprint, jsonify, make_response, request
+
+from core.auth_async import require_auth
+from core.feed import SSE_MAX_CONNECTIONS, STREAM_ID, FeedDispatcher, stream_events
+from core.redis_async import redis_client
+
+feed_bp = Blueprint("feed", __name__)
+
+# Started and stopped with the app (asgi.py).
+dispatcher = FeedDispatcher(redis_client)
+
+
+@feed_bp.get("/me/stream")
+@require_auth(query_token=True)
+async def stream():
+    if dispatcher.connections >= SSE_MAX_CONNECTIONS:
+        return jsonify({"error": "Too many live connections, retry shortly"}), 503, {"Retry-After": "5"}
+
+    # EventSource resends the last id it saw as Last-Event-ID when it reconnects.
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    if last_id is not None and not STREAM_ID.match(last_id):
+        return jsonify({"error": "invalid Last-Event-ID"}), 400
+
+    response = await make_response(
+        stream_events(redis_client, dispatcher, request.user_id, last_id),
+        {"Content-Type": "text/event-stream", "Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    response.timeout = None  # open until the client goes away
+    return response
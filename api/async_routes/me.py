@@ -0,0 +1,61 @@
+from quart import Blueprint, jsonify, request
+
+from db.mongo_async import db
+from core.auth_async import require_auth
+from core.profiles_async import get_profile
+from core.redis_async import redis_client
+from core.notifications import (
+    DECR_IF_EXISTS, FEED_PROJECTION, FEED_SORT, UNREAD_TTL_SECONDS, feed_filter, feed_page, parse_feed_query,
+    parse_mark_read, unread_filter, unread_key,
+)
+
+me_bp = Blueprint("me", __name__)
+decr_unread = redis_client.register_script(DECR_IF_EXISTS)
+
+
+@me_bp.get("/me")
+@require_auth
+async def me():
+    user = await get_profile(request.user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    return jsonify({"user": user})
+
+
+@me_bp.get("/me/notifications")
+@require_auth
+async def notifications():
+    query, error = parse_feed_query(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    limit, after = query
+
+    cursor = db["notifications"].find(feed_filter(request.user_id, after), FEED_PROJECTION).sort(FEED_SORT)
+    body = feed_page(await cursor.to_list(length=limit + 1), limit)
+    body["unread"] = await unread_count(request.user_id)
+    return jsonify(body)
+
+
+@me_bp.post("/me/notifications/read")
+@require_auth
+async def mark_read():
+    selector, error = parse_mark_read(await request.get_json(force=True) or {})
+    if error:
+        return jsonify({"error": error}), 400
+
+    res = await db["notifications"].update_many({**unread_filter(request.user_id), **selector},
+                                                {"$set": {"read": True}})
+    unread = None
+    if res.modified_count:
+        unread = await decr_unread(keys=[unread_key(request.user_id)], args=[res.modified_count])
+    if unread is None:
+        unread = await unread_count(request.user_id)
+    return jsonify({"ok": True, "marked": res.modified_count, "unread": int(unread)})
+
+
+async def unread_count(user_id: str) -> int:
+    count = await redis_client.get(unread_key(user_id))
+    if count is None:
+        count = await db["notifications"].count_documents(unread_filter(user_id))
+        await redis_client.set(unread_key(user_id), count, ex=UNREAD_TTL_SECONDS, nx=True)
+    return int(count)
@@ -0,0 +1,45 @@
+from quart import Blueprint, request, jsonify
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from db.mongo_async import db
+from core.auth_async import require_auth
+from core.profiles_async import get_profile, invalidate_profile
+from core.redis_async import redis_client
+from core.redis_client import USER_CHANGES_CHANNEL
+from core.users import PROFILE_PROJECTION, parse_prefs, prefs_of, prefs_update, serialize_user
+
+prefs_bp = Blueprint("prefs", __name__)
+
+
+@prefs_bp.get("/prefs")
+@require_auth
+async def get_prefs():
+    user = await get_profile(request.user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    return jsonify({"prefs": prefs_of(user)})
+
+
+@prefs_bp.post("/prefs")
+@require_auth
+async def set_prefs():
+    update, error = parse_prefs(await request.get_json(force=True) or {})
+    if error:
+        return jsonify({"error": error}), 400
+
+    user = await db["users"].find_one_and_update(
+        {"_id": ObjectId(request.user_id)},
+        prefs_update(update),
+        projection=PROFILE_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    user = serialize_user(user)
+    await invalidate_profile(request.user_id)
+
+    # Lets workers update their in-memory user snapshot without a full reload
+    await redis_client.publish(USER_CHANGES_CHANNEL, request.user_id)
+
+    return jsonify({"ok": True, "user": user})
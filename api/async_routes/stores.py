@@ -0,0 +1,46 @@
+import json
+
+from quart import Blueprint, Response, request, jsonify
+
+from db.mongo_async import db
+from core.redis_async import redis_client
+from core.stores import (
+    STORES_CACHE_TTL_SECONDS, STORES_VERSION_KEY, etag_for, etag_matches, list_cache_key, list_filter,
+    list_page, list_projection, parse_list_query, parse_store,
+)
+
+stores_bp = Blueprint("stores", __name__)
+
+
+@stores_bp.post("/stores")
+async def create_store():
+    doc, error = parse_store(await request.get_json(force=True) or {})
+    if error:
+        return jsonify({"error": error}), 400
+    store_id = doc["_id"]
+
+    res = await db["stores"].update_one({"_id": store_id}, {"$set": doc}, upsert=True)
+    await redis_client.incr(STORES_VERSION_KEY)
+    if res.upserted_id is None:
+        return jsonify({"ok": True, "store_id": store_id, "updated": True})
+    return jsonify({"ok": True, "store_id": store_id, "created": True})
+
+
+@stores_bp.get("/stores")
+async def list_stores():
+    spec, error = parse_list_query(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+
+    key = list_cache_key(await redis_client.get(STORES_VERSION_KEY), spec)
+    payload = await redis_client.get(key)
+    if payload is None:
+        cursor = db["stores"].find(list_filter(spec), list_projection(spec)).sort("_id", 1)
+        payload = json.dumps(list_page(await cursor.to_list(length=spec["limit"] + 1), spec))
+        await redis_client.set(key, payload, ex=STORES_CACHE_TTL_SECONDS)
+
+    etag = etag_for(payload)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response("", status=304, headers=headers)
+    return Response(payload, mimetype="application/json", headers=headers)
@@ -0,0 +1,124 @@
+"""GET /me/notifications query cost at millions of notifications: skip/limit vs. keyset pages,
+and count_documents vs. the Redis unread counter.
+
+Seeds a scratch database (BENCH_DB) with N notifications spread over --users users, building the
+same indexes the worker creates, then times page fetches at increasing depth for one heavy user.
+
+    python bench_notifications.py --sizes 1000000 5000000 --users 2000 --depths 0 10 100 500
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from core.notifications import FEED_PROJECTION, FEED_SORT, feed_filter, unread_filter, unread_key
+from core.redis_client import redis_client
+from db.mongo import client
+
+BENCH_DB = os.getenv("BENCH_DB", "guardian_bench")
+ITEMS = ["apple", "bread", "cake", "banana", "tomato", "cookie"]
+LIMIT = 20
+
+
+def seed(db, n: int, users: list, batch: int = 20000):
+    db["notifications"].drop()
+    rnd = random.Random(n)
+    now = int(time.time())
+    # Zipf-ish: a few users get most notifications, like dense neighbourhoods do.
+    weights = [1 / (i + 1) for i in range(len(users))]
+    for start in range(0, n, batch):
+        picks = rnd.choices(users, weights, k=min(batch, n - start))
+        docs = []
+        for user_id in picks:
+            ts = now - rnd.randint(0, 90 * 86400)
+            docs.append({
+                "user_id": user_id,
+                "store_id": f"store_{rnd.randint(0, 999)}",
+                "item": rnd.choice(ITEMS),
+                "event_id": f"{ts * 1000}-0",
+                "timestamp": ts,
+                "distance_km": round(rnd.uniform(0, 25), 3),
+                "read": rnd.random() < 0.8,
+                "created_at": datetime.fromtimestamp(ts, timezone.utc),
+            })
+        db["notifications"].insert_many(docs, ordered=False)
+
+
+def build_indexes(db):
+    db["notifications"].create_index([("user_id", 1), ("timestamp", -1), ("_id", -1)], name="user_feed")
+    db["notifications"].create_index([("user_id", 1), ("read", 1)], name="user_unread")
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def skip_page(db, user_id: str, depth: int):
+    return list(db["notifications"].find({"user_id": user_id}, FEED_PROJECTION)
+                .sort(FEED_SORT).skip(depth * LIMIT).limit(LIMIT + 1))
+
+
+def keyset_cursor(db, user_id: str, depth: int):
+    """(timestamp, _id) of the last row before page `depth`, as a client would hold it."""
+    if depth == 0:
+        return None
+    doc = next(db["notifications"].find({"user_id": user_id}, {"timestamp": 1})
+               .sort(FEED_SORT).skip(depth * LIMIT - 1).limit(1), None)
+    return (doc["timestamp"], doc["_id"]) if doc else None
+
+
+def keyset_page(db, user_id: str, after):
+    return list(db["notifications"].find(feed_filter(user_id, after), FEED_PROJECTION)
+                .sort(FEED_SORT).limit(LIMIT + 1))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000000])
+    ap.add_argument("--users", type=int, default=2000)
+    ap.add_argument("--depths", type=int, nargs="+", default=[0, 10, 100, 500], help="page numbers to fetch")
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    db = client[BENCH_DB]
+    users = [str(ObjectId()) for _ in range(args.users)]
+    heavy = users[0]
+
+    for n in args.sizes:
+        seed(db, n, users)
+        # Without indexes the feed and the unread count both scan the whole collection.
+        scan_count = timed(lambda: db["notifications"].count_documents(unread_filter(heavy)), 3)
+        build_indexes(db)
+        total = db["notifications"].count_documents({"user_id": heavy})
+        print(f"\n{n} notifications, heaviest user has {total}")
+
+        print(f"{'page':>5} | {'skip ms':>8} | {'keyset ms':>9}")
+        for depth in args.depths:
+            if depth * LIMIT >= total:
+                break
+            after = keyset_cursor(db, heavy, depth)
+            skip = timed(lambda: skip_page(db, heavy, depth), args.repeat)
+            keyset = timed(lambda: keyset_page(db, heavy, after), args.repeat)
+            print(f"{depth:>5} | {skip:>8.2f} | {keyset:>9.2f}")
+
+        indexed_count = timed(lambda: db["notifications"].count_documents(unread_filter(heavy)), args.repeat)
+        redis_client.set(unread_key(heavy), db["notifications"].count_documents(unread_filter(heavy)))
+        counter = timed(lambda: int(redis_client.get(unread_key(heavy))), args.repeat)
+        redis_client.delete(unread_key(heavy))
+        print(f"unread: count_documents unindexed {scan_count:.2f} ms | indexed {indexed_count:.2f} ms | "
+              f"redis counter {counter:.3f} ms")
+
+    client.drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Explain every production Mongo query and fail if any of them would scan a whole collection.
+
+Builds the indexes from db/indexes.py in a scratch database (or checks --db as it is), seeds
+a few documents so the planner has something to choose between, then runs explain() on the
+filters the API, worker and mailer send. Exits 1 if a winning plan contains a COLLSCAN, so it
+can gate a deploy:
+
+    MONGO_URI=mongodb://localhost:27017 python check_query_plans.py
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from guardian_common.queries import (
+    CANDIDATE_PROJECTION, USER_PROJECTION, by_ids, candidate_users_filter, snapshot_filter,
+)
+from core.geohash import USER_PRECISION, encode
+from core.notifications import FEED_PROJECTION, FEED_SORT, feed_filter, unread_filter
+from core.stores import list_filter, list_projection, parse_list_query
+from db.indexes import INDEXES, ensure_indexes
+from db.mongo import client
+
+PLAN_CHECK_DB = os.getenv("PLAN_CHECK_DB", "guardian_plancheck")
+
+
+def seed(db):
+    now = int(time.time())
+    users = []
+    for i in range(50):
+        lat, lng = 37.0 + i * 0.01, -122.0 - i * 0.01
+        users.append({"email": f"user{i}@plancheck.local", "notify": i % 3 != 0, "radius_km": 5,
+                      "location": {"lat": lat, "lng": lng}, "geo": {"type": "Point", "coordinates": [lng, lat]},
+                      "geohash": encode(lat, lng, USER_PRECISION), "item_filters": []})
+    db["users"].insert_many(users)
+    db["stores"].insert_many([{"_id": f"store_{i}", "name": f"Store {i}", "location": {"lat": 37.0, "lng": -122.0},
+                               "geo": {"type": "Point", "coordinates": [-122.0, 37.0]}} for i in range(50)])
+    db["notifications"].insert_many([{"user_id": str(users[i % 5]["_id"]), "store_id": "store_1", "item": "cake",
+                                      "timestamp": now - i, "read": i % 2 == 0,
+                                      "created_at": datetime.now(timezone.utc)} for i in range(200)])
+
+
+def production_queries(db):
+    """(name, cursor) for every query shape the services send, built from the same helpers."""
+    user = db["users"].find_one({}, {"_id": 1}) or {"_id": ObjectId()}
+    user_id = str(user["_id"])
+    oid = user["_id"]
+    stores, _ = parse_list_query({})
+    stores_next, _ = parse_list_query({"cursor": "c3RvcmVfMTA"})
+    stores_near, _ = parse_list_query({"near": "37.0,-122.0", "radius_km": "10"})
+    newest = (db["notifications"].find_one({"user_id": user_id}, sort=FEED_SORT)
+              or {"_id": ObjectId(), "timestamp": int(time.time())})
+
+    return [
+        # api: auth
+        ("signup/login users.email", db["users"].find({"email": "user1@plancheck.local"})),
+        ("/me, /prefs users._id", db["users"].find({"_id": oid}, {"password_hash": 0})),
+        # api: stores
+        ("GET /stores", db["stores"].find(list_filter(stores), list_projection(stores)).sort("_id", 1).limit(51)),
+        ("GET /stores?cursor=", db["stores"].find(list_filter(stores_next), list_projection(stores_next))
+         .sort("_id", 1).limit(51)),
+        ("GET /stores?near=", db["stores"].find(list_filter(stores_near), list_projection(stores_near))
+         .sort("_id", 1).limit(51)),
+        ("POST /stores, worker get_store", db["stores"].find({"_id": "store_1"})),
+        # api: notifications
+        ("GET /me/notifications", db["notifications"].find(feed_filter(user_id, None), FEED_PROJECTION)
+         .sort(FEED_SORT).limit(21)),
+        ("GET /me/notifications?cursor=", db["notifications"].find(
+            feed_filter(user_id, (newest["timestamp"], newest["_id"])), FEED_PROJECTION).sort(FEED_SORT).limit(21)),
+        ("unread recount", db["notifications"].find(unread_filter(user_id))),
+        ("mark read", db["notifications"].find({**unread_filter(user_id), "_id": {"$in": [newest["_id"]]}})),
+        # worker (guardian_common.queries, as worker.py and user_snapshot.py build them)
+        ("worker candidate_users", db["users"].find(candidate_users_filter(37.0, -122.0, 100), CANDIDATE_PROJECTION)),
+        ("worker candidate_users, one cell", db["users"].find(candidate_users_filter(37.0, -122.0, 100, "9q"),
+                                                              CANDIDATE_PROJECTION)),
+        ("worker snapshot load", db["users"].find(snapshot_filter(), USER_PROJECTION)),
+        ("regional snapshot load", db["users"].find(snapshot_filter(["9q", "9r"]), USER_PROJECTION)),
+        ("worker snapshot apply", db["users"].find(by_ids([oid]), USER_PROJECTION)),
+        # mailer
+        ("mailer emailed_at", db["notifications"].find(by_ids([newest["_id"]]))),
+    ]
+
+
+def stages(plan: dict):
+    """Every stage name in an explain plan tree (classic and slot-based engine layouts)."""
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("queryPlan", "inputStage"):
+        yield from stages(plan.get(key))
+    for child in plan.get("inputStages", []):
+        yield from stages(child)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", help="check this database as-is instead of a seeded scratch one")
+    args = ap.parse_args()
+
+    db = client[args.db or PLAN_CHECK_DB]
+    if not args.db:
+        client.drop_database(PLAN_CHECK_DB)
+        ensure_indexes(db)
+        seed(db)
+
+    queries = production_queries(db)
+    failures = 0
+    for name, cursor in queries:
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        used = list(stages(plan))
+        ok = "COLLSCAN" not in used
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name:<36} {' <- '.join(used)}")
+
+    if not args.db:
+        client.drop_database(PLAN_CHECK_DB)
+    if failures:
+        print(f"\n{failures} of {len(queries)} queries scan a collection; add or fix an index in db/indexes.py")
+    else:
+        print(f"\nNo collection scans in {len(queries)} queries "
+              f"({sum(len(m) for m in INDEXES.values())} declared indexes)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,14 @@ import os
 import time
 import bcrypt
 import jwt
-from functools import wraps
+from functools import lru_cache, wraps
 from flask import request, jsonify
 from bson import ObjectId
 
 JWT_SECRET = os.getenv("JWT_SECRET")
 JWT_EXPIRES_SECONDS = int(os.getenv("JWT_EXPIRES_SECONDS", "604800"))
+# Tokens whose decoded claims are kept in-process (0 disables the cache).
+CLAIMS_CACHE_SIZE = int(os.getenv("CLAIMS_CACHE_SIZE", "10000"))
 
 # Hash password using bcrypt
 def hash_password(password: str) -> str:
@@ -40,6 +42,22 @@ def create_token(user_id: str) -> str:
 def decode_token(token: str) -> dict:
     return jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
 
+# A token's signature only needs checking once; failures raise and are never cached.
+@lru_cache(maxsize=CLAIMS_CACHE_SIZE)
+def _verified_claims(token: str) -> dict:
+    claims = decode_token(token)
+    if not claims.get("sub"):
+        raise jwt.InvalidTokenError("Token has no subject")
+    ObjectId(claims["sub"])
+    return claims
+
+# Claims of a valid token, verified on first use and served from memory until it expires
+def token_claims(token: str) -> dict:
+    claims = _verified_claims(token)
+    if "exp" in claims and claims["exp"] <= time.time():
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    return claims
+
 #Helper to extract Bearer token from Authorization header
 def get_bearer_token() -> str | None:
     auth = request.headers.get("Authorization", "")
@@ -55,11 +73,7 @@ def require_auth(fn):
         if not token:
             return jsonify({"error": "Missing Bearer token"}), 401
         try:
-            claims = decode_token(token)
-            request.user_id = claims.get("sub")
-            if not request.user_id:
-                return jsonify({"error": "Invalid token"}), 401
-            ObjectId(request.user_id)
+            request.user_id = token_claims(token)["sub"]
         except Exception:
             return jsonify({"error": "Invalid or expired token"}), 401
         return fn(*args, **kwargs)
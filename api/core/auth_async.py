@@ -0,0 +1,69 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from quart import request, jsonify
+
+from core.auth import hash_password, verify_password, token_claims
+
+# bcrypt releases the GIL, so a few threads hash in parallel while the event loop keeps serving.
+BCRYPT_THREADS = int(os.getenv("BCRYPT_THREADS", str(os.cpu_count() or 2)))
+# Hashes waiting for a thread beyond this are refused (503) instead of queueing without bound.
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "64"))
+
+_pool = ThreadPoolExecutor(max_workers=BCRYPT_THREADS, thread_name_prefix="bcrypt")
+_pending = 0
+
+
+class HashPoolBusy(Exception):
+    pass
+
+
+async def _run_bcrypt(fn, *args):
+    global _pending
+    if _pending >= BCRYPT_MAX_PENDING:
+        raise HashPoolBusy()
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_pool, fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_bcrypt(hash_password, password)
+
+
+async def verify_password_async(password: str, password_hash: str) -> bool:
+    return await _run_bcrypt(verify_password, password, password_hash)
+
+
+def busy_response():
+    return jsonify({"error": "Too many concurrent logins, retry shortly"}), 503, {"Retry-After": "1"}
+
+
+def shutdown_pool():
+    _pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Same checks as core.auth.require_auth, for async views. With query_token=True the token may also
+# come from ?access_token=, since browsers' EventSource can't send an Authorization header.
+def require_auth(fn=None, *, query_token: bool = False):
+    if fn is None:
+        return lambda f: require_auth(f, query_token=query_token)
+
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        auth = request.headers.get("Authorization", "")
+        token = auth.split(" ", 1)[1].strip() if auth.startswith("Bearer ") else None
+        if not token and query_token:
+            token = request.args.get("access_token")
+        if not token:
+            return jsonify({"error": "Missing Bearer token"}), 401
+        try:
+            request.user_id = token_claims(token)["sub"]
+        except Exception:
+            return jsonify({"error": "Invalid or expired token"}), 401
+        return await fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,58 @@
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from guardian_common import metrics
+
+CV_URL = os.getenv("CV_URL", "http://cv:8002")
+CV_TIMEOUT_SECONDS = float(os.getenv("CV_TIMEOUT_SECONDS", "30"))
+CV_CONNECT_TIMEOUT_SECONDS = float(os.getenv("CV_CONNECT_TIMEOUT_SECONDS", "3"))
+# Keep-alive connections kept per API process; size it to the number of request threads.
+CV_POOL_SIZE = int(os.getenv("CV_POOL_SIZE", "16"))
+
+CV_SECONDS = metrics.histogram("api_cv_call_seconds", "Round-trip to the CV service", ["path", "outcome"])
+
+
+class CVError(Exception):
+    def __init__(self, message: str, status: int = 502):
+        super().__init__(message)
+        self.status = status
+
+
+def _make_session() -> requests.Session:
+    s = requests.Session()
+    # Retry only failed connects: a POST that reached the CV service is not replayed.
+    retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.1, allowed_methods=None)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CV_POOL_SIZE, max_retries=retry)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
+session = _make_session()
+
+
+def _post(path: str, files) -> dict:
+    started = time.perf_counter()
+    try:
+        resp = session.post(f"{CV_URL}{path}", files=files, timeout=(CV_CONNECT_TIMEOUT_SECONDS, CV_TIMEOUT_SECONDS))
+    except requests.RequestException as e:
+        CV_SECONDS.observe(time.perf_counter() - started, path=path, outcome="unreachable")
+        raise CVError(f"CV service unreachable: {e}")
+    CV_SECONDS.observe(time.perf_counter() - started, path=path, outcome=resp.status_code)
+    if resp.status_code != 200:
+        raise CVError(f"CV service error: {resp.text}", 500)
+    return resp.json()
+
+
+def infer(image_bytes: bytes, filename: str = "image.jpg", content_type: str = "application/octet-stream") -> dict:
+    """POST one image to /infer over the pooled keep-alive session."""
+    return _post("/infer", {"image": (filename, image_bytes, content_type)})
+
+
+def infer_batch(images: list) -> list:
+    """POST [(filename, bytes, content_type)] to /infer/batch; one result per image, in order."""
+    return _post("/infer/batch", [("images", img) for img in images]).get("results", [])
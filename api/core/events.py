@@ -0,0 +1,188 @@
+import os
+import json
+import time
+
+import redis
+
+from db.mongo import db
+from guardian_common import metrics
+from core.geohash import covering_cells
+from core.redis_client import redis_client
+
+# Consumed by worker/worker.py (EVENT_STREAM there).
+SURPLUS_STREAM = os.getenv("SURPLUS_STREAM", "events:surplus")
+# Events go to one stream per geohash cell of this length, <SURPLUS_STREAM>:<cell>
+# (2 = about 1250 x 625 km at the equator); workers own cells (WORKER_REGIONS).
+# 0 sends everything to SURPLUS_STREAM.
+GEO_SHARD_PRECISION = int(os.getenv("GEO_SHARD_PRECISION", "2"))
+# Largest radius_km a user can set (core/users.parse_prefs): an event is published to
+# every cell within it of the store, so users across a cell boundary still see it.
+MAX_RADIUS_KM = float(os.getenv("MAX_RADIUS_KM", "100"))
+# Cells that have ever received an event; "*" workers read all of them.
+REGIONS_KEY = f"{SURPLUS_STREAM}:regions"
+STORE_LOCATION_TTL_SECONDS = int(os.getenv("STORE_LOCATION_TTL_SECONDS", "60"))
+
+# Retention: every XADD trims its stream to about EVENT_STREAM_MAXLEN entries and drops
+# entries older than EVENT_RETENTION_SECONDS (both approximate, so Redis frees whole
+# macro-nodes). Trimmed entries are gone even if a lagging group never read them; the
+# worker trims idle region streams by age too.
+EVENT_STREAM_MAXLEN = int(os.getenv("EVENT_STREAM_MAXLEN", "100000"))
+EVENT_RETENTION_SECONDS = int(os.getenv("EVENT_RETENTION_SECONDS", "86400"))
+
+# Backpressure: a stream is overloaded when the worker group (EVENT_GROUP there) has more
+# than EVENT_LAG_MAX entries undelivered or unacked, or the oldest of them was added more
+# than EVENT_LAG_MAX_SECONDS ago. Checked at most every LAG_CHECK_SECONDS per stream.
+EVENT_GROUP = os.getenv("EVENT_GROUP", "worker-group")
+EVENT_LAG_MAX = int(os.getenv("EVENT_LAG_MAX", "5000"))
+EVENT_LAG_MAX_SECONDS = float(os.getenv("EVENT_LAG_MAX_SECONDS", "60"))
+LAG_CHECK_SECONDS = float(os.getenv("LAG_CHECK_SECONDS", "2"))
+# What an upload does when admission() finds its streams overloaded: "reject" answers 429
+# with Retry-After, "async" queues it as a job (cv_jobs.py holds jobs until the backlog
+# drains; /upload-video has no job mode and rejects), "off" publishes regardless.
+EVENT_BACKPRESSURE = os.getenv("EVENT_BACKPRESSURE", "reject")
+BACKPRESSURE_RETRY_AFTER_SECONDS = int(os.getenv("BACKPRESSURE_RETRY_AFTER_SECONDS", "10"))
+
+PUBLISH_SECONDS = metrics.histogram("api_event_publish_seconds", "XADD of one surplus event to all its streams")
+EVENT_STREAMS = metrics.histogram("api_event_streams", "Region streams one event is published to",
+                                  buckets=metrics.COUNT_BUCKETS)
+ADMISSION = metrics.counter("api_event_admission_total", "Backpressure checks by result (ok, overloaded)",
+                            ["result"])
+
+_store_locations = {}
+_lag_cache = {}
+
+
+def store_location(store_id: str):
+    cached = _store_locations.get(store_id)
+    if cached and time.time() - cached[0] < STORE_LOCATION_TTL_SECONDS:
+        return cached[1]
+    store = db["stores"].find_one({"_id": store_id}, {"location": 1})
+    location = (store or {}).get("location")
+    _store_locations[store_id] = (time.time(), location)
+    return location
+
+
+def event_cells(store_id: str) -> list:
+    """Cells whose users may be in range of the store, its own cell first; [] if unsharded or unknown."""
+    if not GEO_SHARD_PRECISION:
+        return []
+    location = store_location(store_id)
+    if not location:
+        return []
+    return covering_cells(float(location["lat"]), float(location["lng"]), MAX_RADIUS_KM, GEO_SHARD_PRECISION)
+
+
+def publish_surplus_event(store_id: str, items: list, source: str = "upload", **extra) -> str:
+    """XADD one surplus event; extra fields are stored as strings alongside the required ones.
+
+    Returns the entry id in the store's own region stream. Stores without a known
+    location go to the unsharded SURPLUS_STREAM.
+    """
+    fields = {
+        "store_id": store_id,
+        "items": json.dumps(items),
+        "timestamp": int(time.time()),
+        "source": source,
+    }
+    for key, value in extra.items():
+        fields[key] = value if isinstance(value, (str, int, float)) else json.dumps(value)
+
+    started = time.perf_counter()
+    cells = event_cells(store_id)
+    minid = retention_minid()
+    pipe = redis_client.pipeline(transaction=False)
+    if not cells:
+        append(pipe, SURPLUS_STREAM, fields, minid)
+    for cell in cells:
+        append(pipe, f"{SURPLUS_STREAM}:{cell}", {**fields, "cell": cell}, minid)
+    if cells:
+        pipe.sadd(REGIONS_KEY, *cells)
+    event_id = pipe.execute()[0]
+    PUBLISH_SECONDS.observe(time.perf_counter() - started)
+    EVENT_STREAMS.observe(len(cells) or 1)
+    return event_id
+
+
+def retention_minid() -> str:
+    return f"{int((time.time() - EVENT_RETENTION_SECONDS) * 1000)}-0"
+
+
+def append(pipe, stream: str, fields: dict, minid: str):
+    # XADD takes MAXLEN or MINID, not both; the second trim is a separate command.
+    pipe.xadd(stream, fields, maxlen=EVENT_STREAM_MAXLEN, approximate=True)
+    pipe.xtrim(stream, minid=minid, approximate=True)
+
+
+def event_streams() -> list:
+    """The unsharded stream and every registered region stream."""
+    return [SURPLUS_STREAM] + [f"{SURPLUS_STREAM}:{cell}" for cell in sorted(redis_client.smembers(REGIONS_KEY))]
+
+
+def entry_age_seconds(entry_id: str, now: float) -> float:
+    return max(0.0, now - int(entry_id.split("-")[0]) / 1000)
+
+
+def group_lag(stream: str) -> dict:
+    """Backlog of the worker group on one stream, from XINFO GROUPS and XPENDING.
+
+    lag: entries not yet delivered to the group (None when Redis can't tell, e.g. before 7.0);
+    pending: delivered but not acked; oldest_seconds: age of the oldest of either, from its id.
+    A stream with no group yet counts every entry as lag.
+    """
+    now = time.time()
+    info = {"stream": stream, "lag": 0, "pending": 0, "oldest_seconds": 0.0}
+    try:
+        groups = redis_client.xinfo_groups(stream)
+    except redis.exceptions.ResponseError:
+        return info  # stream doesn't exist yet
+    group = next((g for g in groups if g["name"] == EVENT_GROUP), None)
+    if group is None:
+        first = redis_client.xrange(stream, count=1)
+        info["lag"] = redis_client.xlen(stream)
+        info["oldest_seconds"] = entry_age_seconds(first[0][0], now) if first else 0.0
+        return info
+
+    info["lag"] = group.get("lag")
+    info["pending"] = group["pending"]
+    ages = []
+    if info["pending"]:
+        oldest_pending = redis_client.xpending(stream, EVENT_GROUP)["min"]  # None if acked meanwhile
+        if oldest_pending:
+            ages.append(entry_age_seconds(oldest_pending, now))
+    if info["lag"] != 0:
+        undelivered = redis_client.xrange(stream, min=f"({group['last-delivered-id']}", count=1)
+        if undelivered:
+            ages.append(entry_age_seconds(undelivered[0][0], now))
+    info["oldest_seconds"] = round(max(ages, default=0.0), 3)
+    return info
+
+
+def stream_lag(stream: str) -> dict:
+    cached = _lag_cache.get(stream)
+    if cached and time.time() - cached[0] < LAG_CHECK_SECONDS:
+        return cached[1]
+    info = group_lag(stream)
+    _lag_cache[stream] = (time.time(), info)
+    return info
+
+
+def overloaded(info: dict) -> bool:
+    return (info["lag"] or 0) + info["pending"] > EVENT_LAG_MAX or info["oldest_seconds"] > EVENT_LAG_MAX_SECONDS
+
+
+def admission(store_id: str = None):
+    """Backlog of the first overloaded stream an event from this store would go to, or None.
+
+    Without a store_id every event stream is checked (cv_jobs.py batches many stores).
+    """
+    if store_id is None:
+        streams = event_streams()
+    else:
+        streams = [f"{SURPLUS_STREAM}:{cell}" for cell in event_cells(store_id)] or [SURPLUS_STREAM]
+    for stream in streams:
+        info = stream_lag(stream)
+        if overloaded(info):
+            ADMISSION.inc(result="overloaded")
+            return info
+    ADMISSION.inc(result="ok")
+    return None
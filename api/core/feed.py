@@ -0,0 +1,148 @@
+"""Live match feed behind the ASGI app's GET /me/stream (Server-Sent Events).
+
+The worker appends every notification to the user's stream feed:<user_id> (trimmed to
+FEED_MAXLEN) and publishes the user id on FEED_CHANNEL. Each process runs one FeedDispatcher
+holding the only pub/sub subscription; it wakes that user's open connections, which then
+XRANGE their stream past the last id they sent. An idle connection is an asyncio.Event, not a
+Redis connection, and the stream (not pub/sub) is the source of truth, so a client that
+reconnects with Last-Event-ID gets exactly what it missed.
+"""
+import os
+import re
+import json
+import asyncio
+
+from redis.exceptions import ResponseError
+
+FEED_CHANNEL = os.getenv("FEED_CHANNEL", "feed:events")
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+SSE_MAX_CONNECTIONS = int(os.getenv("SSE_MAX_CONNECTIONS", "10000"))
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "3000"))
+FEED_READ_COUNT = 100
+
+STREAM_ID = re.compile(r"^\d+-\d+$")
+
+
+def feed_key(user_id: str) -> str:
+    return f"feed:{user_id}"
+
+
+def stream_id(value: str) -> tuple:
+    ms, seq = value.split("-")
+    return int(ms), int(seq)
+
+
+def format_event(entry_id: str, fields: dict) -> str:
+    data = dict(fields)
+    if "distance_km" in data:
+        data["distance_km"] = float(data["distance_km"])
+    if "timestamp" in data:
+        data["timestamp"] = int(data["timestamp"])
+    return f"id: {entry_id}\nevent: match\ndata: {json.dumps(data)}\n\n"
+
+
+class FeedDispatcher:
+    """One pub/sub subscription per process, fanned out to the connections waiting on it."""
+
+    def __init__(self, r, channel: str = FEED_CHANNEL):
+        self.r = r
+        self.channel = channel
+        self.waiters = {}  # user_id -> set of asyncio.Event, one per open connection
+        self.connections = 0
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def register(self, user_id: str) -> asyncio.Event:
+        event = asyncio.Event()
+        self.waiters.setdefault(user_id, set()).add(event)
+        self.connections += 1
+        return event
+
+    def unregister(self, user_id: str, event: asyncio.Event):
+        events = self.waiters.get(user_id)
+        if events is not None:
+            events.discard(event)
+            if not events:
+                del self.waiters[user_id]
+        self.connections -= 1
+
+    def _wake(self, user_id: str):
+        for event in self.waiters.get(user_id, ()):
+            event.set()
+
+    def _wake_all(self):
+        for events in self.waiters.values():
+            for event in events:
+                event.set()
+
+    async def _run(self):
+        while True:
+            pubsub = self.r.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                # Anything published while we were (re)subscribing is still in the streams.
+                self._wake_all()
+                async for message in pubsub.listen():
+                    self._wake(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[feed] pub/sub lost, resubscribing: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+async def missed_entries_trimmed(r, key: str, last_id: str) -> bool:
+    """True if entries after last_id may have been trimmed or expired away before the client saw them."""
+    try:
+        info = await r.xinfo_stream(key)
+    except ResponseError:
+        return True  # the whole stream expired (FEED_TTL_SECONDS without a match)
+    first = info.get("first-entry")
+    if info.get("entries-added", 0) <= info.get("length", 0):
+        return False  # nothing has been trimmed yet
+    return first is None or stream_id(last_id) < stream_id(first[0])
+
+
+async def stream_events(r, dispatcher: FeedDispatcher, user_id: str, last_id: str | None):
+    """SSE body: entries after last_id (or only new ones), then each match as the worker writes it.
+
+    Sends `event: reset` when the entries a reconnecting client missed are no longer kept, so it
+    reloads GET /me/notifications instead of silently skipping them.
+    """
+    key = feed_key(user_id)
+    wake = dispatcher.register(user_id)
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        if last_id is not None and await missed_entries_trimmed(r, key, last_id):
+            yield "event: reset\ndata: {}\n\n"
+            last_id = None
+        if last_id is None:
+            tail = await r.xrevrange(key, count=1)
+            last_id = tail[0][0] if tail else "0-0"
+
+        while True:
+            wake.clear()
+            entries = await r.xrange(key, min=f"({last_id}", count=FEED_READ_COUNT)
+            for entry_id, fields in entries:
+                last_id = entry_id
+                yield format_event(entry_id, fields)
+            if len(entries) == FEED_READ_COUNT:
+                continue
+            try:
+                await asyncio.wait_for(wake.wait(), SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+    finally:
+        dispatcher.unregister(user_id, wake)
@@ -0,0 +1,79 @@
+"""Geohash encoding and the cells a radius around a point touches.
+
+Surplus events are routed to per-region streams keyed by a geohash prefix
+(core/events.py), and users carry the full geohash of their location so a
+worker can select the ones in the regions it owns.
+"""
+import math
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS_KM = 6371.0
+USER_PRECISION = 9  # ~5 m; any shorter region prefix is a substring
+
+
+def encode(lat: float, lng: float, precision: int) -> str:
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    ch = 0
+    even = True  # geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                ch = (ch << 1) | 1
+                lng_lo = mid
+            else:
+                ch <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[ch])
+            bits = 0
+            ch = 0
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> tuple:
+    """(degrees of latitude, degrees of longitude) covered by one cell."""
+    lng_bits = math.ceil(5 * precision / 2)
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def covering_cells(lat: float, lng: float, radius_km: float, precision: int) -> list:
+    """Every cell that intersects the bounding box of the circle, the point's own cell first.
+
+    Cells shrink in km towards the poles, so this is not just the 8 neighbours: the box
+    is walked cell by cell. Longitudes wrap at the antimeridian; latitudes clamp at the poles.
+    """
+    dlat_cell, dlng_cell = cell_size(precision)
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(min(89.9, abs(lat) + dlat)))
+    dlng = min(180.0, math.degrees(radius_km / EARTH_RADIUS_KM) / max(cos_lat, 1e-6))
+
+    lat_lo = max(-90.0, lat - dlat)
+    lat_hi = min(90.0, lat + dlat)
+    home = encode(lat, lng, precision)
+    cells = {home: None}
+    row = math.floor(lat_lo / dlat_cell)
+    while row * dlat_cell < lat_hi:
+        c_lat = min(89.999999, (row + 0.5) * dlat_cell)
+        col = math.floor((lng - dlng) / dlng_cell)
+        while col * dlng_cell < lng + dlng:
+            c_lng = (col + 0.5) * dlng_cell
+            c_lng = (c_lng + 180.0) % 360.0 - 180.0
+            cells.setdefault(encode(c_lat, c_lng, precision), None)
+            col += 1
+        row += 1
+    return list(cells)
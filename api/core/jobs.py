@@ -0,0 +1,53 @@
+import os
+import json
+import time
+import uuid
+
+from core.redis_client import redis_bytes, redis_client
+
+# Async uploads: the API stores the image and queues a job; cv_jobs.py runs it.
+CV_JOB_STREAM = os.getenv("CV_JOB_STREAM", "jobs:cv")
+CV_JOB_TTL_SECONDS = int(os.getenv("CV_JOB_TTL_SECONDS", "3600"))
+
+
+def job_key(job_id: str) -> str:
+    return f"cvjob:{job_id}"
+
+
+def image_key(job_id: str) -> str:
+    return f"cvjob:{job_id}:image"
+
+
+def create_job(store_id: str, image_bytes: bytes, filename: str, content_type: str) -> str:
+    job_id = uuid.uuid4().hex
+    pipe = redis_bytes.pipeline()
+    pipe.set(image_key(job_id), image_bytes, ex=CV_JOB_TTL_SECONDS)
+    pipe.hset(job_key(job_id), mapping={
+        "status": "queued",
+        "store_id": store_id,
+        "filename": filename,
+        "content_type": content_type,
+        "created_at": time.time(),
+    })
+    pipe.expire(job_key(job_id), CV_JOB_TTL_SECONDS)
+    pipe.xadd(CV_JOB_STREAM, {"job_id": job_id})
+    pipe.execute()
+    return job_id
+
+
+def get_job(job_id: str):
+    job = redis_client.hgetall(job_key(job_id))
+    if not job:
+        return None
+    out = {"job_id": job_id, "status": job["status"], "store_id": job.get("store_id")}
+    if "items" in job:
+        out["items"] = json.loads(job["items"])
+    for field in ("error", "event_id"):
+        if field in job:
+            out[field] = job[field]
+    created = float(job["created_at"])
+    if "started_at" in job:
+        out["queued_ms"] = round((float(job["started_at"]) - created) * 1000, 1)
+    if "finished_at" in job:
+        out["total_ms"] = round((float(job["finished_at"]) - created) * 1000, 1)
+    return out
@@ -0,0 +1,98 @@
+import os
+import base64
+
+from bson import ObjectId
+
+NOTIFICATIONS_PAGE_DEFAULT = int(os.getenv("NOTIFICATIONS_PAGE_DEFAULT", "20"))
+NOTIFICATIONS_PAGE_MAX = int(os.getenv("NOTIFICATIONS_PAGE_MAX", "100"))
+# The unread counter caches count_documents(unread_filter) for this long, then is recounted.
+# Notifications removed by the retention TTL index are never decremented, so this bounds how
+# long they (or any increment lost to a crash) can show up in the count.
+UNREAD_TTL_SECONDS = int(os.getenv("UNREAD_TTL_SECONDS", "300"))
+
+# DECRBY, floored at 0, only on an existing counter; nil when it is missing (recount instead).
+DECR_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+local n = redis.call('DECRBY', KEYS[1], ARGV[1])
+if n < 0 then
+  redis.call('SET', KEYS[1], 0, 'KEEPTTL')
+  return 0
+end
+return n
+"""
+
+
+def unread_key(user_id: str) -> str:
+    # Seeded here from Mongo; the worker only increments it while it exists (worker.announce).
+    return f"notif:unread:{user_id}"
+
+
+def unread_filter(user_id: str) -> dict:
+    return {"user_id": user_id, "read": False}
+
+
+def encode_cursor(doc: dict) -> str:
+    raw = f"{doc['timestamp']}:{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def parse_feed_query(args):
+    """(limit, (timestamp, ObjectId) to continue after or None), or (None, error message)."""
+    try:
+        limit = int(args.get("limit", NOTIFICATIONS_PAGE_DEFAULT))
+    except ValueError:
+        return None, "limit must be an integer"
+    if limit < 1 or limit > NOTIFICATIONS_PAGE_MAX:
+        return None, f"limit must be between 1 and {NOTIFICATIONS_PAGE_MAX}"
+
+    after = None
+    cursor = args.get("cursor")
+    if cursor:
+        try:
+            ts, oid = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(":")
+            after = (int(ts), ObjectId(oid))
+        except Exception:
+            return None, "invalid cursor"
+    return (limit, after), None
+
+
+def feed_filter(user_id: str, after) -> dict:
+    """Newest first on (timestamp, _id), served by the user_feed index without a skip."""
+    query = {"user_id": user_id}
+    if after:
+        ts, oid = after
+        query["$or"] = [{"timestamp": {"$lt": ts}}, {"timestamp": ts, "_id": {"$lt": oid}}]
+    return query
+
+
+FEED_SORT = [("timestamp", -1), ("_id", -1)]
+FEED_PROJECTION = {"user_id": 0, "event_id": 0}
+
+
+def feed_page(docs: list, limit: int) -> dict:
+    """Response body for up to limit + 1 docs fetched in FEED_SORT order."""
+    page = docs[:limit]
+    notifications = []
+    for n in page:
+        n = dict(n)
+        n["notification_id"] = str(n.pop("_id"))
+        n["read"] = bool(n.get("read"))
+        created_at = n.pop("created_at", None)
+        if created_at is not None:
+            n["created_at"] = created_at.isoformat()
+        notifications.append(n)
+    next_cursor = encode_cursor(page[-1]) if len(docs) > limit else None
+    return {"notifications": notifications, "next_cursor": next_cursor}
+
+
+def parse_mark_read(body: dict):
+    """({"_id": {"$in": [...]}} or {} for all, None), or (None, error message)."""
+    if body.get("all"):
+        return {}, None
+    ids = body.get("ids")
+    if not isinstance(ids, list) or not ids:
+        return None, "ids (list) or all=true required"
+    try:
+        return {"_id": {"$in": [ObjectId(i) for i in ids]}}, None
+    except Exception:
+        return None, "invalid notification id"
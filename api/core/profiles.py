@@ -0,0 +1,40 @@
+import json
+
+from bson import ObjectId
+
+from db.mongo import db
+from core.redis_client import redis_client
+from core.users import (
+    PROFILE_CACHE_TTL_SECONDS, PROFILE_PROJECTION, PROFILE_VERSION_TTL_SECONDS, SET_PROFILE_IF_VERSION, profile_key,
+    profile_version_key, serialize_user,
+)
+
+set_profile_if_version = redis_client.register_script(SET_PROFILE_IF_VERSION)
+
+
+def get_profile(user_id: str):
+    """User document without password_hash, from the Redis profile cache when it's there."""
+    keys = [profile_key(user_id), profile_version_key(user_id)]
+    if PROFILE_CACHE_TTL_SECONDS:
+        cached, version = redis_client.mget(keys)
+        if cached is not None:
+            return json.loads(cached)
+
+    user = db["users"].find_one({"_id": ObjectId(user_id)}, PROFILE_PROJECTION)
+    if not user:
+        return None
+    user = serialize_user(user)
+    if PROFILE_CACHE_TTL_SECONDS:
+        set_profile_if_version(keys=keys, args=[version or "", json.dumps(user), PROFILE_CACHE_TTL_SECONDS])
+    return user
+
+
+def invalidate_profile(user_id: str):
+    """Call after a write to the user has committed: drops the cached profile and makes reads
+    already in flight skip re-caching what they read."""
+    if PROFILE_CACHE_TTL_SECONDS:
+        pipe = redis_client.pipeline()
+        pipe.incr(profile_version_key(user_id))
+        pipe.expire(profile_version_key(user_id), PROFILE_VERSION_TTL_SECONDS)
+        pipe.delete(profile_key(user_id))
+        pipe.execute()
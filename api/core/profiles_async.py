@@ -0,0 +1,38 @@
+import json
+
+from bson import ObjectId
+
+from db.mongo_async import db
+from core.redis_async import redis_client
+from core.users import (
+    PROFILE_CACHE_TTL_SECONDS, PROFILE_PROJECTION, PROFILE_VERSION_TTL_SECONDS, SET_PROFILE_IF_VERSION, profile_key,
+    profile_version_key, serialize_user,
+)
+
+set_profile_if_version = redis_client.register_script(SET_PROFILE_IF_VERSION)
+
+
+# Same as core/profiles.py, for the ASGI app.
+async def get_profile(user_id: str):
+    keys = [profile_key(user_id), profile_version_key(user_id)]
+    if PROFILE_CACHE_TTL_SECONDS:
+        cached, version = await redis_client.mget(keys)
+        if cached is not None:
+            return json.loads(cached)
+
+    user = await db["users"].find_one({"_id": ObjectId(user_id)}, PROFILE_PROJECTION)
+    if not user:
+        return None
+    user = serialize_user(user)
+    if PROFILE_CACHE_TTL_SECONDS:
+        await set_profile_if_version(keys=keys, args=[version or "", json.dumps(user), PROFILE_CACHE_TTL_SECONDS])
+    return user
+
+
+async def invalidate_profile(user_id: str):
+    if PROFILE_CACHE_TTL_SECONDS:
+        pipe = redis_client.pipeline()
+        pipe.incr(profile_version_key(user_id))
+        pipe.expire(profile_version_key(user_id), PROFILE_VERSION_TTL_SECONDS)
+        pipe.delete(profile_key(user_id))
+        await pipe.execute()
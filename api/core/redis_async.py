@@ -0,0 +1,5 @@
+import redis.asyncio as redis
+from core.config import REDIS_HOST, REDIS_PORT
+
+# Async counterpart of core/redis_client.py for the ASGI app.
+redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
@@ -1,4 +1,10 @@
+import os
 import redis
 from core.config import REDIS_HOST, REDIS_PORT
 
-redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
\ No newline at end of file
+redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+# For binary values (queued job images).
+redis_bytes = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+
+# Published with a user id whenever matching-relevant prefs change (see worker/user_snapshot.py)
+USER_CHANGES_CHANNEL = os.getenv("USER_CHANGES_CHANNEL", "users:changed")
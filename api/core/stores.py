@@ -0,0 +1,170 @@
+import os
+import math
+import base64
+import hashlib
+import json
+
+EARTH_RADIUS_KM = 6371.0
+
+STORES_PAGE_DEFAULT = int(os.getenv("STORES_PAGE_DEFAULT", "50"))
+STORES_PAGE_MAX = int(os.getenv("STORES_PAGE_MAX", "200"))
+STORES_MAX_RADIUS_KM = float(os.getenv("STORES_MAX_RADIUS_KM", "100"))
+STORES_CACHE_TTL_SECONDS = int(os.getenv("STORES_CACHE_TTL_SECONDS", "300"))
+# Bumped by every create/update; cached pages live under the version they were built from.
+STORES_VERSION_KEY = "stores:list:version"
+
+LIST_FIELDS = ("name", "location", "email", "phone")
+DEFAULT_FIELDS = ("name", "location")
+
+
+def store_summary(s: dict, fields=DEFAULT_FIELDS) -> dict:
+    summary = {"store_id": s["_id"]}
+    for f in fields:
+        summary[f] = s.get(f)
+    return summary
+
+
+def parse_store(body: dict):
+    """Store document from a POST /stores body, or (None, error message)."""
+    store_id = (body.get("store_id") or "").strip()
+    name = (body.get("name") or "").strip()
+    email = (body.get("email") or "").strip()
+    phone = (body.get("phone") or "").strip()
+    location = body.get("location")
+
+    if not store_id:
+        return None, "store_id required"
+    if not name:
+        return None, "name required"
+    if not isinstance(location, dict) or "lat" not in location or "lng" not in location:
+        return None, "location must be {lat, lng}"
+
+    try:
+        lat = float(location["lat"])
+        lng = float(location["lng"])
+    except Exception:
+        return None, "lat/lng must be numbers"
+    if lat < -90 or lat > 90 or lng < -180 or lng > 180:
+        return None, "lat/lng out of range"
+
+    doc = {
+        "_id": store_id,  # use store_id as Mongo _id
+        "name": name,
+        "email": email,
+        "phone": phone,
+        "location": {"lat": lat, "lng": lng},
+        "geo": {"type": "Point", "coordinates": [lng, lat]},  # served by the 2dsphere index for ?near=
+    }
+    return doc, None
+
+
+def encode_cursor(store_id: str) -> str:
+    return base64.urlsafe_b64encode(store_id.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+
+
+def parse_list_query(args):
+    """Listing spec from GET /stores query args, or (None, error message).
+
+    ?limit=&cursor=&fields=name,location&near=lat,lng&radius_km=
+    """
+    try:
+        limit = int(args.get("limit", STORES_PAGE_DEFAULT))
+    except ValueError:
+        return None, "limit must be an integer"
+    if limit < 1 or limit > STORES_PAGE_MAX:
+        return None, f"limit must be between 1 and {STORES_PAGE_MAX}"
+
+    after = None
+    if args.get("cursor"):
+        try:
+            after = decode_cursor(args["cursor"])
+        except Exception:
+            return None, "invalid cursor"
+
+    fields = DEFAULT_FIELDS
+    if args.get("fields"):
+        fields = tuple(dict.fromkeys(f.strip() for f in args["fields"].split(",") if f.strip()))
+        unknown = [f for f in fields if f not in LIST_FIELDS]
+        if unknown or not fields:
+            return None, f"fields must be a subset of {','.join(LIST_FIELDS)}"
+
+    near = None
+    if args.get("near"):
+        try:
+            lat, lng = (float(x) for x in args["near"].split(","))
+        except ValueError:
+            return None, "near must be lat,lng"
+        if lat < -90 or lat > 90 or lng < -180 or lng > 180:
+            return None, "lat/lng out of range"
+        try:
+            radius_km = float(args.get("radius_km", 10))
+        except ValueError:
+            return None, "radius_km must be a number"
+        if radius_km <= 0 or radius_km > STORES_MAX_RADIUS_KM:
+            return None, f"radius_km must be between 0 and {STORES_MAX_RADIUS_KM:g}"
+        near = (lat, lng, radius_km)
+
+    return {"limit": limit, "after": after, "fields": fields, "near": near}, None
+
+
+def list_filter(spec: dict) -> dict:
+    """Keyset page on _id, optionally limited to a radius (uses the geo 2dsphere index)."""
+    query = {}
+    if spec["after"] is not None:
+        query["_id"] = {"$gt": spec["after"]}
+    if spec["near"]:
+        lat, lng, radius_km = spec["near"]
+        query["geo"] = {"$geoWithin": {"$centerSphere": [[lng, lat], radius_km / EARTH_RADIUS_KM]}}
+    return query
+
+
+def list_projection(spec: dict) -> dict:
+    projection = {f: 1 for f in spec["fields"]}
+    if spec["near"]:
+        projection["location"] = 1  # for distance_km
+    return projection
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> float:
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+    a = (math.sin(dphi / 2) ** 2
+         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlambda / 2) ** 2)
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def list_page(docs: list, spec: dict) -> dict:
+    """Response body for up to limit + 1 docs fetched in _id order."""
+    page = docs[:spec["limit"]]
+    stores = [store_summary(s, spec["fields"]) for s in page]
+    if spec["near"]:
+        lat, lng, _ = spec["near"]
+        for summary, s in zip(stores, page):
+            loc = s.get("location") or {}
+            summary["distance_km"] = round(haversine_km(lat, lng, loc["lat"], loc["lng"]), 3) if loc else None
+    body = {"stores": stores, "next_cursor": None}
+    if len(docs) > spec["limit"]:
+        body["next_cursor"] = encode_cursor(page[-1]["_id"])
+    return body
+
+
+def list_cache_key(version, spec: dict) -> str:
+    canonical = json.dumps(spec, sort_keys=True, default=list)
+    return f"stores:list:{version or 0}:{hashlib.sha1(canonical.encode()).hexdigest()}"
+
+
+def etag_for(payload: str) -> str:
+    return '"' + hashlib.sha1(payload.encode()).hexdigest()[:20] + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return any(t.removeprefix("W/") == etag for t in tags)
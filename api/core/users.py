@@ -0,0 +1,111 @@
+import os
+import time
+
+from core.geohash import USER_PRECISION, encode
+
+# /me and GET /prefs read the profile from Redis for this long; POST /prefs drops it (0 disables).
+PROFILE_CACHE_TTL_SECONDS = int(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60"))
+# geo and geohash are the worker's copies of location, not part of the profile.
+PROFILE_PROJECTION = {"password_hash": 0, "geo": 0, "geohash": 0}
+# Outlives any read in flight, so an expired version can't match one read before it expired.
+PROFILE_VERSION_TTL_SECONDS = 86400
+PREFS_FIELDS = ("notify", "radius_km", "location", "item_filters")
+
+# Cache a profile read from Mongo only if no prefs write has bumped the version since the read
+# began; otherwise a read that started before the write could put the old profile back.
+SET_PROFILE_IF_VERSION = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then return 0 end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+def parse_credentials(body: dict):
+    email = (body.get("email") or "").strip().lower()
+    password = body.get("password") or ""
+    return email, password
+
+
+def new_user(email: str, password_hash: str) -> dict:
+    return {
+        "email": email,
+        "password_hash": password_hash,
+        "notify": True,
+        "location": None,
+        "radius_km": 5,
+        "item_filters": [],
+        "created_at": int(time.time())
+    }
+
+
+def parse_prefs(body: dict):
+    """Validated $set fields from a /prefs body, or (None, error message)."""
+    notify = body.get("notify", True)
+    radius_km = body.get("radius_km", 5)
+    location = body.get("location")  # {"lat":..., "lng":...}
+    item_filters = body.get("item_filters", [])
+
+    # Validate basics
+    if radius_km is not None:
+        try:
+            radius_km = float(radius_km)
+            if radius_km <= 0 or radius_km > 100:
+                return None, "radius_km must be between 0 and 100"
+        except Exception:
+            return None, "radius_km must be a number"
+
+    if location is not None:
+        if not isinstance(location, dict) or "lat" not in location or "lng" not in location:
+            return None, "location must be {lat, lng}"
+        try:
+            lat = float(location["lat"])
+            lng = float(location["lng"])
+        except Exception:
+            return None, "lat/lng must be numbers"
+        if lat < -90 or lat > 90 or lng < -180 or lng > 180:
+            return None, "lat/lng out of range"
+        location = {"lat": lat, "lng": lng}
+
+    if item_filters is None:
+        item_filters = []
+    if not isinstance(item_filters, list):
+        return None, "item_filters must be a list"
+    item_filters = [str(x).strip().lower() for x in item_filters if str(x).strip()]
+
+    update = {
+        "notify": bool(notify),
+        "radius_km": radius_km,
+        "location": location,
+        "item_filters": item_filters
+    }
+    return update, None
+
+
+def prefs_update(update: dict) -> dict:
+    """Mongo update for parsed prefs, keeping the GeoJSON copy and geohash of location in sync.
+
+    The worker's 2dsphere candidate query reads `geo`, not `location`; regional workers
+    select their users by `geohash` prefix.
+    """
+    if update["location"] is not None:
+        lat, lng = update["location"]["lat"], update["location"]["lng"]
+        geo = {"type": "Point", "coordinates": [lng, lat]}
+        return {"$set": {**update, "geo": geo, "geohash": encode(lat, lng, USER_PRECISION)}}
+    return {"$set": update, "$unset": {"geo": "", "geohash": ""}}
+
+
+def profile_key(user_id: str) -> str:
+    return f"user:profile:{user_id}"
+
+
+def profile_version_key(user_id: str) -> str:
+    return f"user:profile:version:{user_id}"
+
+
+def serialize_user(user: dict) -> dict:
+    user["_id"] = str(user["_id"])
+    return user
+
+
+def prefs_of(user: dict) -> dict:
+    return {f: user.get(f) for f in PREFS_FIELDS}
@@ -0,0 +1,234 @@
+"""Surplus detection from a shelf camera: a video file, an MJPEG stream, or a capture URL.
+
+Frames pass through three stages:
+
+1. FrameSampler keeps a frame only when it differs enough from the last kept
+   frame (or when nothing has been kept for a while), using a tiny grayscale
+   thumbnail so rejected frames cost almost nothing.
+2. Kept frames are JPEG-encoded and sent to the CV service's /infer/batch in
+   groups of VIDEO_BATCH_SIZE.
+3. WindowAggregator tracks which labels appear in most frames of the last
+   VIDEO_WINDOW_SECONDS. A surplus event is published only when that set
+   changes and is non-empty.
+
+Nothing here talks to Redis directly; the caller passes `publish`.
+"""
+import os
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+import requests
+
+from core.cv_client import CV_URL, session as cv_session
+
+VIDEO_DIFF_THRESHOLD = float(os.getenv("VIDEO_DIFF_THRESHOLD", "0.02"))  # share of thumbnail pixels that changed
+VIDEO_PIXEL_DELTA = int(os.getenv("VIDEO_PIXEL_DELTA", "25"))            # grey levels for a pixel to count as changed
+VIDEO_MIN_INTERVAL_S = float(os.getenv("VIDEO_MIN_INTERVAL_S", "0.5"))
+VIDEO_MAX_INTERVAL_S = float(os.getenv("VIDEO_MAX_INTERVAL_S", "2"))
+VIDEO_BATCH_SIZE = int(os.getenv("VIDEO_BATCH_SIZE", "8"))
+VIDEO_MAX_BATCH_DELAY_S = float(os.getenv("VIDEO_MAX_BATCH_DELAY_S", "1"))
+VIDEO_WINDOW_SECONDS = float(os.getenv("VIDEO_WINDOW_SECONDS", "10"))
+VIDEO_MIN_PRESENCE = float(os.getenv("VIDEO_MIN_PRESENCE", "0.5"))
+VIDEO_MIN_FRAMES = int(os.getenv("VIDEO_MIN_FRAMES", "3"))
+
+THUMB_SIZE = (64, 48)
+JPEG_QUALITY = 90
+
+
+def thumbnail_from_frame(frame: np.ndarray) -> np.ndarray:
+    small = cv2.resize(frame, THUMB_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+
+def thumbnail_from_jpeg(data: bytes):
+    # libjpeg decodes at 1/8 scale here, so a rejected frame is never fully decoded.
+    small = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if small is None:
+        return None
+    return cv2.resize(small, THUMB_SIZE, interpolation=cv2.INTER_AREA)
+
+
+class FrameSampler:
+    """Decides which frames are worth running through the detector."""
+
+    def __init__(self, diff_threshold: float = VIDEO_DIFF_THRESHOLD, pixel_delta: int = VIDEO_PIXEL_DELTA,
+                 min_interval: float = VIDEO_MIN_INTERVAL_S, max_interval: float = VIDEO_MAX_INTERVAL_S):
+        self.diff_threshold = diff_threshold
+        self.pixel_delta = pixel_delta
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.last_thumb = None
+        self.last_t = None
+
+    def difference(self, thumb: np.ndarray) -> float:
+        changed = cv2.absdiff(thumb, self.last_thumb) > self.pixel_delta
+        return float(np.count_nonzero(changed)) / changed.size
+
+    def should_sample(self, t: float, thumb: np.ndarray) -> bool:
+        if self.last_thumb is None:
+            keep = True
+        else:
+            elapsed = t - self.last_t
+            if elapsed < self.min_interval:
+                return False
+            keep = elapsed >= self.max_interval or self.difference(thumb) >= self.diff_threshold
+        if keep:
+            self.last_thumb = thumb
+            self.last_t = t
+        return keep
+
+
+class WindowAggregator:
+    """Labels present in at least `min_presence` of the sampled frames in the last `window` seconds."""
+
+    def __init__(self, window: float = VIDEO_WINDOW_SECONDS, min_presence: float = VIDEO_MIN_PRESENCE,
+                 min_frames: int = VIDEO_MIN_FRAMES):
+        self.window = window
+        self.min_presence = min_presence
+        self.min_frames = min_frames
+        self.frames = deque()
+        self.current = frozenset()
+
+    def add(self, t: float, labels: set):
+        """Record one frame; returns (added, removed) when the consensus set changes, else None."""
+        self.frames.append((t, frozenset(labels)))
+        while self.frames and self.frames[0][0] < t - self.window:
+            self.frames.popleft()
+        if len(self.frames) < self.min_frames:
+            return None
+
+        counts = {}
+        for _, frame_labels in self.frames:
+            for label in frame_labels:
+                counts[label] = counts.get(label, 0) + 1
+        needed = self.min_presence * len(self.frames)
+        consensus = frozenset(label for label, n in counts.items() if n >= needed)
+        if consensus == self.current:
+            return None
+        added, removed = consensus - self.current, self.current - consensus
+        self.current = consensus
+        return added, removed
+
+
+class VideoIngestor:
+    """Feeds sampled frames to the CV service in batches and publishes item-set changes."""
+
+    def __init__(self, store_id: str, publish, cv_url: str = CV_URL, sampler: FrameSampler = None,
+                 aggregator: WindowAggregator = None, batch_size: int = VIDEO_BATCH_SIZE,
+                 max_batch_delay: float = VIDEO_MAX_BATCH_DELAY_S, http=None):
+        self.store_id = store_id
+        self.publish = publish
+        self.cv_url = cv_url
+        self.sampler = sampler or FrameSampler()
+        self.aggregator = aggregator or WindowAggregator()
+        self.batch_size = batch_size
+        self.max_batch_delay = max_batch_delay
+        self.http = http or cv_session
+        self.pending = []  # [(t, jpeg_bytes)]
+        self.pending_since = 0.0
+        self.stats = {"frames": 0, "sampled": 0, "batches": 0, "inferred": 0, "errors": 0, "events": []}
+
+    def feed(self, t: float, thumb: np.ndarray, jpeg):
+        """One decoded frame. `jpeg` is bytes, or a callable producing them (only called if sampled)."""
+        self.stats["frames"] += 1
+        if thumb is None or not self.sampler.should_sample(t, thumb):
+            return
+        self.stats["sampled"] += 1
+        if not self.pending:
+            self.pending_since = time.monotonic()
+        self.pending.append((t, jpeg() if callable(jpeg) else jpeg))
+        if len(self.pending) >= self.batch_size or time.monotonic() - self.pending_since >= self.max_batch_delay:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        files = [("images", (f"frame_{i}.jpg", data, "image/jpeg")) for i, (_, data) in enumerate(batch)]
+        self.stats["batches"] += 1
+        try:
+            resp = self.http.post(f"{self.cv_url}/infer/batch", files=files, timeout=60)
+            resp.raise_for_status()
+            results = resp.json().get("results", [])
+        except (requests.RequestException, ValueError) as e:
+            print(f"[video-ingest] CV batch of {len(batch)} failed: {e}")
+            self.stats["errors"] += len(batch)
+            return
+
+        for (t, _), result in zip(batch, results):
+            if not result or "error" in result:
+                self.stats["errors"] += 1
+                continue
+            self.stats["inferred"] += 1
+            change = self.aggregator.add(t, {x["label"] for x in result.get("items", [])})
+            if change is not None:
+                self._on_change(t, *change)
+
+    def _on_change(self, t: float, added: frozenset, removed: frozenset):
+        items = sorted(self.aggregator.current)
+        event = {"video_ts": round(t, 2), "items": items, "added": sorted(added), "removed": sorted(removed)}
+        if items:
+            event["event_id"] = self.publish(self.store_id, items, source="video",
+                                             added=event["added"], removed=event["removed"])
+        self.stats["events"].append(event)
+
+    def close(self) -> dict:
+        self.flush()
+        return {**self.stats, "items": sorted(self.aggregator.current)}
+
+
+def ingest_capture(source, ingestor: VideoIngestor, max_seconds: float = 0) -> dict:
+    """Frames from anything cv2.VideoCapture opens: a file path, an HTTP MJPEG/RTSP URL, or a camera index.
+
+    Files are timed by their own timestamps, so a recording is processed as fast
+    as the CV service allows while windows still cover real video seconds.
+    """
+    is_file = isinstance(source, str) and os.path.exists(source)
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise ValueError(f"could not open video source {source!r}")
+    started = time.monotonic()
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            t = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0 if is_file else time.monotonic() - started
+            if max_seconds and t > max_seconds:
+                break
+            ingestor.feed(t, thumbnail_from_frame(frame),
+                          lambda: cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])[1].tobytes())
+    finally:
+        cap.release()
+    return ingestor.close()
+
+
+def iter_mjpeg(chunks):
+    """Split a byte stream of concatenated JPEGs (e.g. a multipart/x-mixed-replace body) into frames."""
+    buf = bytearray()
+    for chunk in chunks:
+        buf += chunk
+        while True:
+            start = buf.find(b"\xff\xd8")
+            if start < 0:
+                del buf[:-1]
+                break
+            end = buf.find(b"\xff\xd9", start + 2)
+            if end < 0:
+                del buf[:start]
+                break
+            yield bytes(buf[start:end + 2])
+            del buf[:end + 2]
+
+
+def ingest_mjpeg(chunks, ingestor: VideoIngestor, max_seconds: float = 0) -> dict:
+    """Frames pushed as an MJPEG byte stream; timed by arrival, and JPEGs are forwarded without re-encoding."""
+    started = time.monotonic()
+    for data in iter_mjpeg(chunks):
+        t = time.monotonic() - started
+        if max_seconds and t > max_seconds:
+            break
+        ingestor.feed(t, thumbnail_from_jpeg(data), data)
+    return ingestor.close()
@@ -0,0 +1,166 @@
+"""Runs async upload jobs: reads jobs:cv, sends the stored images to the CV service in
+batches over the pooled client, publishes events:surplus, and records the result on the
+job hash that GET /jobs/<id> reads. While the workers are behind on events:surplus it
+stops taking new jobs, so the backlog waits here instead of in the event streams.
+
+    python cv_jobs.py
+"""
+import os
+import json
+import socket
+import threading
+import time
+
+import redis
+
+from guardian_common import metrics
+from core import cv_client
+from core.events import admission, publish_surplus_event
+from core.jobs import CV_JOB_STREAM, CV_JOB_TTL_SECONDS, image_key, job_key
+from core.redis_client import redis_bytes, redis_client as r
+
+GROUP = os.getenv("CV_JOB_GROUP", "cv-jobs")
+CONSUMER = os.getenv("CV_JOB_CONSUMER") or f"{socket.gethostname()}-{os.getpid()}"
+CV_JOB_CONCURRENCY = int(os.getenv("CV_JOB_CONCURRENCY", "2"))
+# Jobs per /infer/batch call; several queued uploads share one model run.
+CV_JOB_BATCH = int(os.getenv("CV_JOB_BATCH", "8"))
+BLOCK_MS = int(os.getenv("BLOCK_MS", "5000"))
+CLAIM_IDLE_MS = int(os.getenv("CLAIM_IDLE_MS", "60000"))
+CLAIM_INTERVAL_SECONDS = int(os.getenv("CLAIM_INTERVAL_SECONDS", "30"))
+MAX_DELIVERIES = int(os.getenv("MAX_DELIVERIES", "3"))
+# Hold new jobs while any event stream is over the lag limits (core/events.admission); 0 = never.
+CV_JOB_BACKPRESSURE = os.getenv("CV_JOB_BACKPRESSURE", "1") == "1"
+BACKPRESSURE_PAUSE_SECONDS = float(os.getenv("BACKPRESSURE_PAUSE_SECONDS", "2"))
+# GET /metrics and /debug/profile (guardian_common/metrics.py); 0 = off.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9102"))
+
+JOBS = metrics.counter("cv_jobs_total", "Upload jobs by outcome (done, failed, expired)", ["status"])
+QUEUED_SECONDS = metrics.histogram("cv_jobs_queued_seconds", "Time from upload to a job starting")
+PAUSED_SECONDS = metrics.counter("cv_jobs_backpressure_seconds_total", "Time spent holding jobs for event backlog")
+
+
+def ensure_group():
+    try:
+        r.xgroup_create(CV_JOB_STREAM, GROUP, id="0", mkstream=True)
+        print(f"[cv-jobs] Created group={GROUP} stream={CV_JOB_STREAM}")
+    except redis.exceptions.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def finish(job_id: str, **fields):
+    pipe = r.pipeline()
+    pipe.hset(job_key(job_id), mapping={**fields, "finished_at": time.time()})
+    pipe.expire(job_key(job_id), CV_JOB_TTL_SECONDS)
+    pipe.delete(image_key(job_id))
+    pipe.execute()
+
+
+def run_jobs(messages: list):
+    """Infer and publish one batch of job entries. Raises if the CV call fails (entries stay pending)."""
+    job_ids = [fields["job_id"] for _, fields in messages]
+    pipe = r.pipeline()
+    for job_id in job_ids:
+        pipe.hgetall(job_key(job_id))
+    jobs = pipe.execute()
+    images = redis_bytes.mget([image_key(job_id) for job_id in job_ids])
+
+    runnable = []
+    for job_id, job, image in zip(job_ids, jobs, images):
+        if not job or image is None:
+            print(f"[cv-jobs] Job {job_id} expired before it ran")
+            JOBS.inc(status="expired")
+            continue
+        if job["status"] in ("done", "failed"):
+            continue  # redelivered after it already finished
+        runnable.append((job_id, job, image))
+    if not runnable:
+        return
+
+    started = time.time()
+    pipe = r.pipeline()
+    for job_id, job, _ in runnable:
+        pipe.hset(job_key(job_id), mapping={"status": "running", "started_at": started})
+        QUEUED_SECONDS.observe(started - float(job["created_at"]))
+    pipe.execute()
+
+    results = cv_client.infer_batch([(job["filename"], image, job["content_type"]) for _, job, image in runnable])
+    for (job_id, job, _), result in zip(runnable, results):
+        if "error" in result:
+            finish(job_id, status="failed", error=result["error"])
+            JOBS.inc(status="failed")
+            continue
+        items = [x["label"] for x in result.get("items", [])]
+        event_id = publish_surplus_event(job["store_id"], items, source="job", job_id=job_id)
+        finish(job_id, status="done", items=json.dumps(items), event_id=event_id)
+        JOBS.inc(status="done")
+
+
+def handle(name: str, messages: list) -> bool:
+    try:
+        run_jobs(messages)
+    except Exception as e:
+        print(f"[cv-jobs] {name}: batch of {len(messages)} failed, leaving pending: {e}")
+        return False
+    r.xack(CV_JOB_STREAM, GROUP, *[entry_id for entry_id, _ in messages])
+    return True
+
+
+def reclaim(name: str):
+    """Retry jobs whose consumer died; give up on those delivered more than MAX_DELIVERIES times."""
+    cursor = "0-0"
+    while True:
+        cursor, messages, *_ = r.xautoclaim(CV_JOB_STREAM, GROUP, name, min_idle_time=CLAIM_IDLE_MS,
+                                            start_id=cursor, count=CV_JOB_BATCH)
+        messages = [(i, f) for i, f in messages if i and f]
+        if messages:
+            ids = [i for i, _ in messages]
+            pending = r.xpending_range(CV_JOB_STREAM, GROUP, min=ids[0], max=ids[-1], count=len(ids),
+                                       consumername=name)
+            deliveries = {p["message_id"]: p["times_delivered"] for p in pending}
+            poison = [(i, f) for i, f in messages if deliveries.get(i, 0) > MAX_DELIVERIES]
+            for _, fields in poison:
+                finish(fields["job_id"], status="failed", error="CV service unavailable")
+                JOBS.inc(status="failed")
+            if poison:
+                r.xack(CV_JOB_STREAM, GROUP, *[i for i, _ in poison])
+            retry = [(i, f) for i, f in messages if deliveries.get(i, 0) <= MAX_DELIVERIES]
+            if retry:
+                handle(name, retry)
+        if cursor == "0-0":
+            return
+
+
+def consume(name: str, stop: threading.Event):
+    next_claim = 0.0
+    while not stop.is_set():
+        if time.time() >= next_claim:
+            reclaim(name)
+            next_claim = time.time() + CLAIM_INTERVAL_SECONDS
+        if CV_JOB_BACKPRESSURE and admission():
+            stop.wait(BACKPRESSURE_PAUSE_SECONDS)
+            PAUSED_SECONDS.inc(BACKPRESSURE_PAUSE_SECONDS)
+            continue
+        resp = r.xreadgroup(GROUP, name, {CV_JOB_STREAM: ">"}, count=CV_JOB_BATCH, block=BLOCK_MS)
+        for _, messages in resp or []:
+            handle(name, messages)
+
+
+def main():
+    metrics.serve(METRICS_PORT)
+    ensure_group()
+    stop = threading.Event()
+    names = [CONSUMER] if CV_JOB_CONCURRENCY == 1 else [f"{CONSUMER}-{i}" for i in range(CV_JOB_CONCURRENCY)]
+    threads = [threading.Thread(target=consume, args=(name, stop), daemon=True) for name in names]
+    for t in threads:
+        t.start()
+    print(f"[cv-jobs] consumers={names} group={GROUP} stream={CV_JOB_STREAM}")
+    try:
+        while any(t.is_alive() for t in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop.set()
+
+
+if __name__ == "__main__":
+    main()
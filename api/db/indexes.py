@@ -0,0 +1,143 @@
+"""Every index the API, worker and mailer queries rely on, declared in one place.
+
+Created idempotently at API startup (app.py, asgi.py) and by hand before a deploy:
+
+    python -m db.indexes
+
+An index whose options changed here (say a new TTL) is dropped and rebuilt under the
+same name. check_query_plans.py fails if a production query stops using these.
+"""
+import os
+
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import OperationFailure
+
+from core.geohash import USER_PRECISION, encode
+
+# Counted from notifications.created_at, which the worker must write as a datetime (a TTL
+# index skips anything else).
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))
+
+INDEXES = {
+    "users": [
+        # signup / login lookups
+        IndexModel([("email", ASCENDING)], name="email", unique=True),
+        # worker: per-event candidate query (notify + $geoWithin)
+        IndexModel([("notify", ASCENDING), ("geo", "2dsphere")], name="notify_geo"),
+        # worker: user snapshot load ({notify: true, location: {$ne: null}})
+        IndexModel([("notify", ASCENDING), ("location", ASCENDING)], name="notify_location"),
+        # regional worker: snapshot load by geohash prefix of its WORKER_REGIONS
+        IndexModel([("notify", ASCENDING), ("geohash", ASCENDING)], name="notify_geohash"),
+    ],
+    "stores": [
+        # GET /stores?near=
+        IndexModel([("geo", "2dsphere")], name="geo"),
+    ],
+    "notifications": [
+        # GET /me/notifications keyset pages
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="user_feed"),
+        # unread recount and mark-as-read
+        IndexModel([("user_id", ASCENDING), ("read", ASCENDING)], name="user_unread"),
+        IndexModel([("created_at", ASCENDING)], name="retention",
+                   expireAfterSeconds=NOTIFICATION_RETENTION_DAYS * 86400),
+    ],
+}
+
+GEO_FROM_LOCATION = [{"$set": {"geo": {"type": "Point", "coordinates": ["$location.lng", "$location.lat"]}}}]
+
+# (collection, filter, update) run before the indexes so older documents are covered by them.
+BACKFILLS = [
+    # GeoJSON point for users and stores saved before `geo` existed
+    ("users", {"geo": {"$exists": False}, "location.lat": {"$exists": True}}, GEO_FROM_LOCATION),
+    ("stores", {"geo": {"$exists": False}, "location.lat": {"$exists": True}}, GEO_FROM_LOCATION),
+    # read flag and TTL date for notifications written before the feed existed
+    ("notifications",
+     {"created_at": {"$exists": False}},
+     [{"$set": {"created_at": {"$toDate": {"$multiply": ["$timestamp", 1000]}},
+                "read": {"$ifNull": ["$read", False]}}}]),
+]
+
+# Users saved before regional sharding get a geohash (computed here; Mongo has no operator for it).
+GEOHASH_BACKFILL_QUERY = {"geohash": {"$exists": False}, "location.lat": {"$exists": True}}
+GEOHASH_BACKFILL_BATCH = 1000
+
+
+def geohash_update(user: dict) -> UpdateOne:
+    loc = user["location"]
+    return UpdateOne({"_id": user["_id"]}, {"$set": {"geohash": encode(loc["lat"], loc["lng"], USER_PRECISION)}})
+
+
+# IndexOptionsConflict, IndexKeySpecsConflict: same name, different definition.
+CONFLICT_CODES = (85, 86)
+
+
+def ensure_indexes(db):
+    for collection, query, update in BACKFILLS:
+        res = db[collection].update_many(query, update)
+        if res.modified_count:
+            print(f"[indexes] Backfilled {res.modified_count} {collection}")
+
+    batch, filled = [], 0
+    for user in db["users"].find(GEOHASH_BACKFILL_QUERY, {"location": 1}):
+        batch.append(geohash_update(user))
+        if len(batch) == GEOHASH_BACKFILL_BATCH:
+            filled += db["users"].bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        filled += db["users"].bulk_write(batch, ordered=False).modified_count
+    if filled:
+        print(f"[indexes] Backfilled geohash for {filled} users")
+
+    for collection, models in INDEXES.items():
+        for model in models:
+            name = model.document["name"]
+            try:
+                db[collection].create_indexes([model])
+            except OperationFailure as e:
+                if e.code not in CONFLICT_CODES:
+                    # e.g. duplicate emails blocking the unique index: report, keep serving
+                    print(f"[indexes] {collection}.{name} not created: {e}")
+                    continue
+                print(f"[indexes] Rebuilding {collection}.{name} with its new definition")
+                db[collection].drop_index(name)
+                db[collection].create_indexes([model])
+
+
+# Same as ensure_indexes, for Motor (asgi.py).
+async def ensure_indexes_async(db):
+    for collection, query, update in BACKFILLS:
+        res = await db[collection].update_many(query, update)
+        if res.modified_count:
+            print(f"[indexes] Backfilled {res.modified_count} {collection}")
+
+    batch, filled = [], 0
+    async for user in db["users"].find(GEOHASH_BACKFILL_QUERY, {"location": 1}):
+        batch.append(geohash_update(user))
+        if len(batch) == GEOHASH_BACKFILL_BATCH:
+            filled += (await db["users"].bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        filled += (await db["users"].bulk_write(batch, ordered=False)).modified_count
+    if filled:
+        print(f"[indexes] Backfilled geohash for {filled} users")
+
+    for collection, models in INDEXES.items():
+        for model in models:
+            name = model.document["name"]
+            try:
+                await db[collection].create_indexes([model])
+            except OperationFailure as e:
+                if e.code not in CONFLICT_CODES:
+                    print(f"[indexes] {collection}.{name} not created: {e}")
+                    continue
+                print(f"[indexes] Rebuilding {collection}.{name} with its new definition")
+                await db[collection].drop_index(name)
+                await db[collection].create_indexes([model])
+
+
+if __name__ == "__main__":
+    from db.mongo import db
+
+    ensure_indexes(db)
+    for collection in INDEXES:
+        print(f"{collection}: {sorted(db[collection].index_information())}")
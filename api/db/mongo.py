@@ -1,5 +1,8 @@
 from pymongo import MongoClient
+from guardian_common import metrics
 from core.config import MONGO_URI, MONGO_DB
 
-client = MongoClient(MONGO_URI)
+MONGO_SECONDS = metrics.histogram("api_mongo_seconds", "Mongo command round-trip", ["command", "collection"])
+
+client = MongoClient(MONGO_URI, event_listeners=[metrics.mongo_listener(MONGO_SECONDS)])
 db = client[MONGO_DB]
\ No newline at end of file
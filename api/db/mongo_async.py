@@ -0,0 +1,9 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+from guardian_common import metrics
+from core.config import MONGO_URI, MONGO_DB
+
+MONGO_SECONDS = metrics.histogram("api_mongo_seconds", "Mongo command round-trip", ["command", "collection"])
+
+# Used by the ASGI app (asgi.py); Motor binds to the running event loop on first use.
+client = AsyncIOMotorClient(MONGO_URI, event_listeners=[metrics.mongo_listener(MONGO_SECONDS)])
+db = client[MONGO_DB]
@@ -0,0 +1,65 @@
+"""Point a shelf camera (or a recording of one) at the surplus pipeline.
+
+    # a local recording, printing events instead of publishing them
+    python ingest_camera.py shelf.mp4 --store-id store_123 --cv-url http://localhost:8002 --dry-run
+
+    # a live camera: HTTP MJPEG, RTSP, or a local device index
+    python ingest_camera.py http://10.0.0.12/video.mjpg --store-id store_123 --mjpeg
+    python ingest_camera.py rtsp://10.0.0.12/stream1 --store-id store_123
+    python ingest_camera.py 0 --store-id store_123
+
+Publishing uses REDIS_HOST/REDIS_PORT like the API.
+"""
+import argparse
+import json
+
+import requests
+
+from core.video_ingest import CV_URL, FrameSampler, VideoIngestor, WindowAggregator, ingest_capture, ingest_mjpeg
+
+
+def print_event(store_id: str, items: list, **fields) -> str:
+    print(f"[dry-run] events:surplus store_id={store_id} items={json.dumps(items)} {fields}")
+    return "dry-run"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("source", help="video file, capture URL, or camera index")
+    ap.add_argument("--store-id", required=True)
+    ap.add_argument("--cv-url", default=CV_URL)
+    ap.add_argument("--mjpeg", action="store_true", help="read the URL as a raw multipart MJPEG stream over HTTP")
+    ap.add_argument("--max-seconds", type=float, default=0, help="stop after this much video (0 = until it ends)")
+    ap.add_argument("--dry-run", action="store_true", help="print events instead of publishing them")
+    ap.add_argument("--diff-threshold", type=float, default=FrameSampler().diff_threshold)
+    ap.add_argument("--window", type=float, default=WindowAggregator().window)
+    args = ap.parse_args()
+
+    if args.dry_run:
+        publish = print_event
+    else:
+        from core.events import publish_surplus_event as publish
+
+    ingestor = VideoIngestor(
+        args.store_id, publish, cv_url=args.cv_url,
+        sampler=FrameSampler(diff_threshold=args.diff_threshold),
+        aggregator=WindowAggregator(window=args.window),
+    )
+
+    if args.mjpeg:
+        with requests.get(args.source, stream=True, timeout=30) as resp:
+            resp.raise_for_status()
+            summary = ingest_mjpeg(resp.iter_content(64 * 1024), ingestor, args.max_seconds)
+    else:
+        source = int(args.source) if args.source.isdigit() else args.source
+        summary = ingest_capture(source, ingestor, args.max_seconds)
+
+    for event in summary["events"]:
+        print(f"t={event['video_ts']:>7.2f}s items={event['items']} +{event['added']} -{event['removed']}")
+    print(f"{summary['frames']} frames, {summary['sampled']} sampled "
+          f"({summary['sampled'] / max(summary['frames'], 1):.1%}), {summary['batches']} CV batches, "
+          f"{summary['errors']} errors, {sum(1 for e in summary['events'] if 'event_id' in e)} events published")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Requests/sec and latency for /me, /prefs and /auth/login across API targets.
+
+    python loadtest_api.py --target flask=http://localhost:5001 --target asgi=http://localhost:5002 \\
+        --concurrency 1 16 64 --requests 1000
+
+Signs up (or logs in) a throwaway user on each target first. /auth/login is
+dominated by bcrypt, so its numbers show how hashing shares the CPU with
+other requests. /me and GET /prefs are served from the profile cache after the
+first request; POST /prefs is one find_one_and_update. For a before/after of
+the claims and profile caches, point a second target at an API started with
+CLAIMS_CACHE_SIZE=0 PROFILE_CACHE_TTL_SECONDS=0:
+
+    python loadtest_api.py --target cached=http://localhost:5001 --target uncached=http://localhost:5003 \\
+        --endpoints /me "GET /prefs" "POST /prefs"
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+import requests
+
+EMAIL = "loadtest@example.com"
+PASSWORD = "loadtest-password"
+PREFS = {"notify": True, "radius_km": 5, "location": {"lat": 37.77, "lng": -122.42}, "item_filters": ["bread"]}
+
+
+def get_token(base: str) -> str:
+    creds = {"email": EMAIL, "password": PASSWORD}
+    resp = requests.post(f"{base}/auth/signup", json=creds, timeout=30)
+    if resp.status_code == 409:
+        resp = requests.post(f"{base}/auth/login", json=creds, timeout=30)
+    resp.raise_for_status()
+    return resp.json()["token"]
+
+
+def hammer(call, concurrency: int, total: int) -> dict:
+    latencies, errors = [], []
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def client():
+        http = requests.Session()
+        local = []
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    break
+            t0 = time.perf_counter()
+            try:
+                status = call(http)
+            except requests.RequestException as e:
+                status = str(e)
+            if status == 200:
+                local.append((time.perf_counter() - t0) * 1000)
+            else:
+                with lock:
+                    errors.append(status)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    a = np.asarray(latencies or [0.0])
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": float(np.percentile(a, 50)),
+        "p99": float(np.percentile(a, 99)),
+        "errors": len(errors),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--target", action="append", default=[], help="name=base_url, repeatable")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    ap.add_argument("--requests", type=int, default=500, help="per endpoint and concurrency level")
+    ap.add_argument("--endpoints", nargs="+", default=["/me", "GET /prefs", "POST /prefs", "/auth/login"])
+    args = ap.parse_args()
+    targets = [t.split("=", 1) for t in args.target] or [["flask", "http://localhost:5001"]]
+
+    print(f"{'target':>8} | {'endpoint':>12} | {'conc':>4} | {'req/s':>8} | {'p50 ms':>8} | {'p99 ms':>8} | errors")
+    for name, base in targets:
+        base = base.rstrip("/")
+        token = get_token(base)
+        auth = {"Authorization": f"Bearer {token}"}
+        endpoints = {
+            "/me": lambda http: http.get(f"{base}/me", headers=auth, timeout=30).status_code,
+            "GET /prefs": lambda http: http.get(f"{base}/prefs", headers=auth, timeout=30).status_code,
+            "POST /prefs": lambda http: http.post(f"{base}/prefs", headers=auth, json=PREFS, timeout=30).status_code,
+            "/auth/login": lambda http: http.post(f"{base}/auth/login", json={"email": EMAIL, "password": PASSWORD},
+                                                  timeout=30).status_code,
+        }
+        for endpoint in args.endpoints:
+            call = endpoints[endpoint]
+            for c in args.concurrency:
+                r = hammer(call, c, args.requests)
+                print(f"{name:>8} | {endpoint:>12} | {c:>4} | {r['rps']:>8.1f} | {r['p50']:>8.1f} | "
+                      f"{r['p99']:>8.1f} | {r['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Sustained overload of events:surplus against a local Redis: producers publish faster than
+a simulated worker group can consume, with the same admission check /upload-test applies.
+
+    REDIS_HOST=localhost REDIS_PORT=6379 python loadtest_overload.py --produce 2000 --consume 500 --seconds 60
+
+Prints stream length, group lag, pending count and oldest-entry age once a second, then
+lets the consumers drain. Exits 1 if the stream outgrew EVENT_STREAM_MAXLEN, the backlog
+ran past EVENT_LAG_MAX by more than one LAG_CHECK_SECONDS of production, or uploads were
+still refused once the backlog had drained. Uses its own stream and group names.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+os.environ.setdefault("REDIS_HOST", "localhost")
+os.environ.setdefault("REDIS_PORT", "6379")
+os.environ.setdefault("SURPLUS_STREAM", "overload:events:surplus")
+os.environ.setdefault("EVENT_GROUP", "overload-group")
+os.environ.setdefault("GEO_SHARD_PRECISION", "0")  # one stream; no store lookups in Mongo
+os.environ.setdefault("EVENT_STREAM_MAXLEN", "20000")
+os.environ.setdefault("EVENT_LAG_MAX", "5000")
+os.environ.setdefault("EVENT_LAG_MAX_SECONDS", "30")
+
+from core import events  # noqa: E402
+from core.redis_client import redis_client as r  # noqa: E402
+
+# XADD ... MAXLEN ~ trims whole macro-nodes (stream-node-max-entries, 100 by default).
+TRIM_SLACK = 100
+
+
+def reset():
+    r.delete(events.SURPLUS_STREAM)
+    r.xgroup_create(events.SURPLUS_STREAM, events.EVENT_GROUP, id="0", mkstream=True)
+    events._lag_cache.clear()
+
+
+def producer(rate: float, stop: threading.Event, counts: dict, lock: threading.Lock):
+    interval = 1 / rate
+    next_at = time.perf_counter()
+    while not stop.is_set():
+        shed = events.admission("overload_store") is not None
+        if not shed:
+            events.publish_surplus_event("overload_store", ["bread"], source="overload")
+        with lock:
+            counts["shed" if shed else "published"] += 1
+        next_at += interval
+        time.sleep(max(0.0, next_at - time.perf_counter()))
+
+
+def consumer(name: str, rate: float, stop: threading.Event, counts: dict, lock: threading.Lock):
+    """Reads and acks at most `rate` events/sec, standing in for a worker that can't keep up."""
+    batch = max(1, int(rate / 10))
+    while not stop.is_set():
+        started = time.perf_counter()
+        resp = r.xreadgroup(events.EVENT_GROUP, name, {events.SURPLUS_STREAM: ">"}, count=batch, block=100)
+        for _, messages in resp or []:
+            r.xack(events.SURPLUS_STREAM, events.EVENT_GROUP, *[i for i, _ in messages])
+            with lock:
+                counts["consumed"] += len(messages)
+        time.sleep(max(0.0, batch / rate - (time.perf_counter() - started)))
+
+
+def sample() -> dict:
+    info = events.group_lag(events.SURPLUS_STREAM)
+    return {**info, "length": r.xlen(events.SURPLUS_STREAM)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--produce", type=float, default=2000, help="attempted uploads/sec")
+    ap.add_argument("--consume", type=float, default=500, help="events/sec the consumers keep up with")
+    ap.add_argument("--producers", type=int, default=4)
+    ap.add_argument("--consumers", type=int, default=2)
+    ap.add_argument("--seconds", type=int, default=60)
+    ap.add_argument("--drain-seconds", type=int, default=120)
+    args = ap.parse_args()
+
+    reset()
+    counts = {"published": 0, "shed": 0, "consumed": 0}
+    lock = threading.Lock()
+    stop_producers, stop_consumers = threading.Event(), threading.Event()
+    producers = [threading.Thread(target=producer, args=(args.produce / args.producers, stop_producers, counts, lock),
+                                  daemon=True) for _ in range(args.producers)]
+    consumers = [threading.Thread(target=consumer, args=(f"overload-{i}", args.consume / args.consumers,
+                                                         stop_consumers, counts, lock), daemon=True)
+                 for i in range(args.consumers)]
+    for t in producers + consumers:
+        t.start()
+
+    print(f"{'t':>4} {'length':>8} {'lag':>8} {'pending':>8} {'oldest_s':>9} {'published':>10} {'shed':>8}")
+    peak_length = peak_backlog = 0
+    started = time.time()
+    while time.time() - started < args.seconds:
+        time.sleep(1)
+        s = sample()
+        peak_length = max(peak_length, s["length"])
+        peak_backlog = max(peak_backlog, (s["lag"] or 0) + s["pending"])
+        print(f"{time.time() - started:>4.0f} {s['length']:>8} {str(s['lag']):>8} {s['pending']:>8} "
+              f"{s['oldest_seconds']:>9.1f} {counts['published']:>10} {counts['shed']:>8}")
+    stop_producers.set()
+
+    drained_at = None
+    while time.time() - started < args.seconds + args.drain_seconds:
+        s = sample()
+        if not events.overloaded(s):
+            drained_at = time.time() - started
+            break
+        time.sleep(0.5)
+    stop_consumers.set()
+    events._lag_cache.clear()
+    admitted_after = drained_at is not None and events.admission("overload_store") is None
+
+    attempted = counts["published"] + counts["shed"]
+    print(f"\nattempted={attempted} published={counts['published']} shed={counts['shed']} "
+          f"({counts['shed'] / max(attempted, 1):.0%}) consumed={counts['consumed']}")
+    print(f"peak length={peak_length} (maxlen {events.EVENT_STREAM_MAXLEN}) "
+          f"peak backlog={peak_backlog} (limit {events.EVENT_LAG_MAX})")
+    print(f"drained below the limits at t={drained_at:.0f}s" if drained_at is not None
+          else f"still overloaded {args.drain_seconds}s after producers stopped")
+
+    failures = []
+    if peak_length > events.EVENT_STREAM_MAXLEN + TRIM_SLACK:
+        failures.append("stream grew past EVENT_STREAM_MAXLEN")
+    if peak_backlog > events.EVENT_LAG_MAX + args.produce * events.LAG_CHECK_SECONDS + TRIM_SLACK:
+        failures.append("admission control let the backlog run past EVENT_LAG_MAX")
+    if not admitted_after:
+        failures.append("uploads still refused after the backlog drained")
+    r.delete(events.SURPLUS_STREAM)
+    for f in failures:
+        print(f"FAIL {f}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Idle-connection and fan-out test for GET /me/stream on the ASGI app.
+
+Opens --connections SSE connections spread over --users users, then writes --events
+matches straight to the users' feed streams (as the worker does) and reports how long
+each took to reach its connections. Needs the same JWT_SECRET and Redis as the API:
+
+    JWT_SECRET=... python loadtest_sse.py --url http://localhost:5002 --connections 5000 --users 1000
+
+Watch the API container's memory (docker stats) while the connections sit idle.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+from bson import ObjectId
+
+from core.auth import create_token
+from core.feed import FEED_CHANNEL, feed_key
+from core.redis_async import redis_client
+
+
+async def open_stream(host: str, port: int, token: str):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write((f"GET /me/stream?access_token={token} HTTP/1.1\r\nHost: {host}\r\n"
+                  "Accept: text/event-stream\r\n\r\n").encode())
+    await writer.drain()
+    status = await reader.readline()
+    if b" 200 " not in status:
+        raise RuntimeError(status.decode().strip())
+    while (await reader.readline()) not in (b"\r\n", b""):
+        pass
+    return reader, writer
+
+
+async def listen(reader, latencies: list):
+    """Record the delivery latency of every match event; chunked framing lines are skipped."""
+    while True:
+        line = await reader.readline()
+        if not line:
+            return
+        if line.startswith(b"data: "):
+            data = json.loads(line[6:])
+            if "sent_at" in data:
+                latencies.append((time.time() - float(data["sent_at"])) * 1000)
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://localhost:5002")
+    ap.add_argument("--connections", type=int, default=1000)
+    ap.add_argument("--users", type=int, default=500)
+    ap.add_argument("--events", type=int, default=200)
+    ap.add_argument("--rate", type=float, default=50, help="events/sec")
+    ap.add_argument("--idle-seconds", type=float, default=30)
+    args = ap.parse_args()
+
+    url = urlparse(args.url)
+    users = [str(ObjectId()) for _ in range(args.users)]
+    tokens = {u: create_token(u) for u in users}
+    per_user = {u: 0 for u in users}
+
+    t0 = time.perf_counter()
+    streams, failures = [], 0
+    for i in range(0, args.connections, 200):
+        opened = await asyncio.gather(*[open_stream(url.hostname, url.port or 80, tokens[users[j % len(users)]])
+                                        for j in range(i, min(args.connections, i + 200))], return_exceptions=True)
+        for j, s in enumerate(opened, start=i):
+            if isinstance(s, Exception):
+                failures += 1
+            else:
+                streams.append(s)
+                per_user[users[j % len(users)]] += 1
+    print(f"opened {len(streams)} connections in {time.perf_counter() - t0:.1f}s ({failures} failed)")
+
+    latencies = []
+    listeners = [asyncio.create_task(listen(reader, latencies)) for reader, _ in streams]
+    print(f"idling {args.idle_seconds:.0f}s")
+    await asyncio.sleep(args.idle_seconds)
+
+    expected = 0
+    for _ in range(args.events):
+        user_id = random.choice(users)
+        expected += per_user[user_id]
+        await redis_client.xadd(feed_key(user_id), {"item": "loadtest", "sent_at": time.time()}, maxlen=200)
+        await redis_client.publish(FEED_CHANNEL, user_id)
+        await asyncio.sleep(1 / args.rate)
+    await asyncio.sleep(2)
+
+    a = np.asarray(latencies or [0.0])
+    print(f"delivered {len(latencies)}/{expected} events | p50 {np.percentile(a, 50):.1f} ms | "
+          f"p99 {np.percentile(a, 99):.1f} ms | max {a.max():.1f} ms")
+
+    for task in listeners:
+        task.cancel()
+    for _, writer in streams:
+        writer.close()
+    for user_id in users:
+        await redis_client.delete(feed_key(user_id))
+    await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
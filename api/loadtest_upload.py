@@ -0,0 +1,95 @@
+"""Load test for /upload-test: synchronous CV calls vs. queued async jobs.
+
+Needs the API, CV service, Redis and (for async) cv_jobs.py running:
+
+    python loadtest_upload.py --url http://localhost:5001 --image ../test_images/cake.jpg --clients 32 --requests 500
+
+For async, "accept" is the time to get the 202 and "done" is the time until
+GET /jobs/<id> reports done or failed. The CV result cache would turn repeated
+uploads into cache hits, so run the CV service with CACHE_ENABLED=0.
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+import requests
+
+
+def percentiles(samples: list) -> str:
+    if not samples:
+        return "-"
+    a = np.asarray(samples)
+    return " / ".join(f"{np.percentile(a, q):.0f}" for q in (50, 95, 99))
+
+
+def run(url: str, image: bytes, mode: str, clients: int, total: int, poll_interval: float):
+    accept, done, errors = [], [], []
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def client():
+        http = requests.Session()
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            t0 = time.perf_counter()
+            try:
+                resp = http.post(f"{url}/upload-test", params={"mode": mode}, timeout=120,
+                                 data={"store_id": "loadtest"}, files={"image": ("load.jpg", image, "image/jpeg")})
+                t1 = time.perf_counter()
+                if resp.status_code not in (200, 202):
+                    raise RuntimeError(f"HTTP {resp.status_code}")
+                if mode == "async":
+                    job_id = resp.json()["job_id"]
+                    while True:
+                        time.sleep(poll_interval)
+                        status = http.get(f"{url}/jobs/{job_id}", timeout=10).json().get("status")
+                        if status in ("done", "failed"):
+                            break
+                t2 = time.perf_counter()
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                accept.append((t1 - t0) * 1000)
+                done.append((t2 - t0) * 1000)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "rps": len(done) / elapsed,
+        "accept": percentiles(accept),
+        "done": percentiles(done),
+        "errors": len(errors),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://localhost:5001")
+    ap.add_argument("--image", default="../test_images/cake.jpg")
+    ap.add_argument("--clients", type=int, default=16)
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--modes", nargs="+", default=["sync", "async"])
+    ap.add_argument("--poll-interval", type=float, default=0.05)
+    args = ap.parse_args()
+
+    image = open(args.image, "rb").read()
+    print(f"{args.clients} clients, {args.requests} uploads per mode")
+    print(f"{'mode':>6} | {'uploads/s':>9} | {'accept p50/p95/p99 ms':>22} | {'done p50/p95/p99 ms':>22} | errors")
+    for mode in args.modes:
+        res = run(args.url.rstrip("/"), image, mode, args.clients, args.requests, args.poll_interval)
+        print(f"{res['mode']:>6} | {res['rps']:>9.1f} | {res['accept']:>22} | {res['done']:>22} | {res['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,16 @@
 from flask import Blueprint, request, jsonify
 from bson import ObjectId
-import time
+from pymongo.errors import DuplicateKeyError
 
 from db.mongo import db
 from core.auth import hash_password, verify_password, create_token
+from core.users import parse_credentials, new_user
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
 
 @auth_bp.post("/signup")
 def signup():
-    body = request.get_json(force=True) or {}
-    email = (body.get("email") or "").strip().lower()
-    password = body.get("password") or ""
+    email, password = parse_credentials(request.get_json(force=True) or {})
 
     if not email or "@" not in email:
         return jsonify({"error": "Valid email required"}), 400
@@ -25,17 +24,12 @@ def signup():
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
-    doc = {
-        "email": email,
-        "password_hash": password_hash,
-        "notify": True,
-        "location": None,            
-        "radius_km": 5,
-        "item_filters": [], 
-        "created_at": int(time.time())
-    }
-
-    res = db["users"].insert_one(doc)
+    doc = new_user(email, password_hash)
+
+    try:
+        res = db["users"].insert_one(doc)
+    except DuplicateKeyError:  # a concurrent signup got past the find_one first
+        return jsonify({"error": "Email already in use"}), 409
     user_id = str(res.inserted_id)
     token = create_token(user_id)
     return jsonify({"token": token, "user_id": user_id})
@@ -43,9 +37,7 @@ def signup():
 
 @auth_bp.post("/login")
 def login():
-    body = request.get_json(force=True) or {}
-    email = (body.get("email") or "").strip().lower()
-    password = body.get("password") or ""
+    email, password = parse_credentials(request.get_json(force=True) or {})
 
     user = db["users"].find_one({"email": email})
     if not user:
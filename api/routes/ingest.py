@@ -0,0 +1,65 @@
+import os
+import tempfile
+
+from flask import Blueprint, jsonify, request
+
+from core.events import BACKPRESSURE_RETRY_AFTER_SECONDS, EVENT_BACKPRESSURE, admission, publish_surplus_event
+from core.video_ingest import VideoIngestor, ingest_capture, ingest_mjpeg
+
+ingest_bp = Blueprint("ingest", __name__)
+
+# Upper bound on how much of an upload or pushed stream one request processes.
+VIDEO_MAX_SECONDS = float(os.getenv("VIDEO_MAX_SECONDS", "600"))
+
+
+@ingest_bp.post("/upload-video")
+def upload_video():
+    """Detect surplus in a shelf-camera recording or a pushed MJPEG stream.
+
+    Either a multipart upload (field 'video', plus 'store_id'), or a raw
+    multipart/x-mixed-replace body with ?store_id=... that is read until the
+    client closes it. Refused with 429 while the store's event streams are
+    behind, unless EVENT_BACKPRESSURE=off.
+    """
+    store_id = request.args.get("store_id")
+
+    if request.mimetype.startswith("multipart/x-mixed-replace"):
+        if not store_id:
+            return jsonify({"error": "store_id query parameter required"}), 400
+        busy = backpressure(store_id)
+        if busy:
+            return busy
+        chunks = iter(lambda: request.stream.read(64 * 1024), b"")
+        summary = ingest_mjpeg(chunks, VideoIngestor(store_id, publish_surplus_event), VIDEO_MAX_SECONDS)
+        return jsonify({"ok": True, "store_id": store_id, **summary})
+
+    if "video" not in request.files:
+        return jsonify({"error": "video file required (form field name: 'video')"}), 400
+    store_id = request.form.get("store_id") or store_id
+    if not store_id:
+        return jsonify({"error": "store_id required"}), 400
+    busy = backpressure(store_id)
+    if busy:
+        return busy
+
+    video = request.files["video"]
+    suffix = os.path.splitext(video.filename or "")[1] or ".mp4"
+    # VideoCapture needs a real file to seek in.
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        video.save(tmp)
+        tmp.flush()
+        try:
+            summary = ingest_capture(tmp.name, VideoIngestor(store_id, publish_surplus_event), VIDEO_MAX_SECONDS)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    return jsonify({"ok": True, "store_id": store_id, **summary})
+
+
+def backpressure(store_id: str):
+    """429 response while the store's event streams are overloaded, else None."""
+    backlog = admission(store_id) if EVENT_BACKPRESSURE != "off" else None
+    if not backlog:
+        return None
+    return (jsonify({"error": "event processing is behind, retry later", "backlog": backlog}), 429,
+            {"Retry-After": str(BACKPRESSURE_RETRY_AFTER_SECONDS)})
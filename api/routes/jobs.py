@@ -0,0 +1,13 @@
+from flask import Blueprint, jsonify
+
+from core.jobs import get_job
+
+jobs_bp = Blueprint("jobs", __name__)
+
+
+@jobs_bp.get("/jobs/<job_id>")
+def job_status(job_id):
+    job = get_job(job_id)
+    if not job:
+        return jsonify({"error": "job not found or expired"}), 404
+    return jsonify(job)
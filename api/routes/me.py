@@ -1,17 +1,63 @@
 from flask import Blueprint, jsonify, request
-from bson import ObjectId
 
 from db.mongo import db
 from core.auth import require_auth
+from core.profiles import get_profile
+from core.redis_client import redis_client
+from core.notifications import (
+    DECR_IF_EXISTS, FEED_PROJECTION, FEED_SORT, UNREAD_TTL_SECONDS, feed_filter, feed_page, parse_feed_query,
+    parse_mark_read, unread_filter, unread_key,
+)
 
 me_bp = Blueprint("me", __name__)
+decr_unread = redis_client.register_script(DECR_IF_EXISTS)
 
 
 @me_bp.get("/me")
 @require_auth
 def me():
-    user = db["users"].find_one({"_id": ObjectId(request.user_id)}, {"password_hash": 0})
+    user = get_profile(request.user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
-    user["_id"] = str(user["_id"])
     return jsonify({"user": user})
+
+
+@me_bp.get("/me/notifications")
+@require_auth
+def notifications():
+    query, error = parse_feed_query(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    limit, after = query
+
+    cursor = (db["notifications"].find(feed_filter(request.user_id, after), FEED_PROJECTION)
+              .sort(FEED_SORT).limit(limit + 1))
+    body = feed_page(list(cursor), limit)
+    body["unread"] = unread_count(request.user_id)
+    return jsonify(body)
+
+
+@me_bp.post("/me/notifications/read")
+@require_auth
+def mark_read():
+    selector, error = parse_mark_read(request.get_json(force=True) or {})
+    if error:
+        return jsonify({"error": error}), 400
+
+    res = db["notifications"].update_many({**unread_filter(request.user_id), **selector}, {"$set": {"read": True}})
+    unread = None
+    if res.modified_count:
+        unread = decr_unread(keys=[unread_key(request.user_id)], args=[res.modified_count])
+    if unread is None:
+        unread = unread_count(request.user_id)
+    return jsonify({"ok": True, "marked": res.modified_count, "unread": int(unread)})
+
+
+def unread_count(user_id: str) -> int:
+    """Unread count from the Redis counter; recounted (user_unread index) when the key is missing,
+    which it is at least every UNREAD_TTL_SECONDS."""
+    count = redis_client.get(unread_key(user_id))
+    if count is None:
+        count = db["notifications"].count_documents(unread_filter(user_id))
+        redis_client.set(unread_key(user_id), count, ex=UNREAD_TTL_SECONDS, nx=True)
+    return int(count)
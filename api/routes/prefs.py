@@ -1,58 +1,44 @@
 from flask import Blueprint, request, jsonify
 from bson import ObjectId
+from pymongo import ReturnDocument
 
 from db.mongo import db
 from core.auth import require_auth
+from core.profiles import get_profile, invalidate_profile
+from core.redis_client import redis_client, USER_CHANGES_CHANNEL
+from core.users import PROFILE_PROJECTION, parse_prefs, prefs_of, prefs_update, serialize_user
 
 prefs_bp = Blueprint("prefs", __name__)
 
 
+@prefs_bp.get("/prefs")
+@require_auth
+def get_prefs():
+    user = get_profile(request.user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    return jsonify({"prefs": prefs_of(user)})
+
+
 @prefs_bp.post("/prefs")
 @require_auth
 def set_prefs():
-    body = request.get_json(force=True) or {}
-
-    notify = body.get("notify", True)
-    radius_km = body.get("radius_km", 5)
-    location = body.get("location")  # {"lat":..., "lng":...}
-    item_filters = body.get("item_filters", [])
-
-    # Validate basics
-    if radius_km is not None:
-        try:
-            radius_km = float(radius_km)
-            if radius_km <= 0 or radius_km > 100:
-                return jsonify({"error": "radius_km must be between 0 and 100"}), 400
-        except Exception:
-            return jsonify({"error": "radius_km must be a number"}), 400
-
-    if location is not None:
-        if not isinstance(location, dict) or "lat" not in location or "lng" not in location:
-            return jsonify({"error": "location must be {lat, lng}"}), 400
-        try:
-            lat = float(location["lat"])
-            lng = float(location["lng"])
-        except Exception:
-            return jsonify({"error": "lat/lng must be numbers"}), 400
-        if lat < -90 or lat > 90 or lng < -180 or lng > 180:
-            return jsonify({"error": "lat/lng out of range"}), 400
-        location = {"lat": lat, "lng": lng}
-
-    if item_filters is None:
-        item_filters = []
-    if not isinstance(item_filters, list):
-        return jsonify({"error": "item_filters must be a list"}), 400
-    item_filters = [str(x).strip().lower() for x in item_filters if str(x).strip()]
-
-    update = {
-        "notify": bool(notify),
-        "radius_km": radius_km,
-        "location": location,
-        "item_filters": item_filters
-    }
-
-    db["users"].update_one({"_id": ObjectId(request.user_id)}, {"$set": update})
-
-    user = db["users"].find_one({"_id": ObjectId(request.user_id)}, {"password_hash": 0})
-    user["_id"] = str(user["_id"])
+    update, error = parse_prefs(request.get_json(force=True) or {})
+    if error:
+        return jsonify({"error": error}), 400
+
+    user = db["users"].find_one_and_update(
+        {"_id": ObjectId(request.user_id)},
+        prefs_update(update),
+        projection=PROFILE_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    user = serialize_user(user)
+    invalidate_profile(request.user_id)
+
+    # Lets workers update their in-memory user snapshot without a full reload
+    redis_client.publish(USER_CHANGES_CHANNEL, request.user_id)
+
     return jsonify({"ok": True, "user": user})
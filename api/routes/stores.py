@@ -1,56 +1,50 @@
-from flask import Blueprint, request, jsonify
+import json
+
+from flask import Blueprint, Response, request, jsonify
 
 from db.mongo import db
+from core.redis_client import redis_client
+from core.stores import (
+    STORES_CACHE_TTL_SECONDS, STORES_VERSION_KEY, etag_for, etag_matches, list_cache_key, list_filter,
+    list_page, list_projection, parse_list_query, parse_store,
+)
 
 stores_bp = Blueprint("stores", __name__)
 
+
 @stores_bp.post("/stores")
 def create_store():
-    body = request.get_json(force=True) or {}
-    store_id = (body.get("store_id") or "").strip()
-    name = (body.get("name") or "").strip()
-    email = (body.get("email") or "").strip()
-    phone = (body.get("phone") or "").strip()
-    location = body.get("location")
-
-    if not store_id:
-        return jsonify({"error": "store_id required"}), 400
-    if not name:
-        return jsonify({"error": "name required"}), 400
-    if not isinstance(location, dict) or "lat" not in location or "lng" not in location:
-        return jsonify({"error": "location must be {lat, lng}"}), 400
-
-    try:
-        lat = float(location["lat"])
-        lng = float(location["lng"])
-    except Exception:
-        return jsonify({"error": "lat/lng must be numbers"}), 400
-
-    doc = {
-        "_id": store_id,  # use store_id as Mongo _id
-        "name": name,
-        "email": email,
-        "phone": phone,
-        "location": {"lat": lat, "lng": lng}
-    }
+    doc, error = parse_store(request.get_json(force=True) or {})
+    if error:
+        return jsonify({"error": error}), 400
+    store_id = doc["_id"]
 
     existing = db["stores"].find_one({"_id": store_id})
     if existing:
         db["stores"].update_one({"_id": store_id}, {"$set": doc})
+        redis_client.incr(STORES_VERSION_KEY)
         return jsonify({"ok": True, "store_id": store_id, "updated": True})
 
     db["stores"].insert_one(doc)
+    redis_client.incr(STORES_VERSION_KEY)
     return jsonify({"ok": True, "store_id": store_id, "created": True})
 
 
 @stores_bp.get("/stores")
 def list_stores():
-    stores = list(db["stores"].find({}))
-    out = []
-    for s in stores:
-        out.append({
-            "store_id": s["_id"],
-            "name": s.get("name"),
-            "location": s.get("location")
-        })
-    return jsonify({"stores": out})
+    spec, error = parse_list_query(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+
+    key = list_cache_key(redis_client.get(STORES_VERSION_KEY), spec)
+    payload = redis_client.get(key)
+    if payload is None:
+        cursor = db["stores"].find(list_filter(spec), list_projection(spec)).sort("_id", 1).limit(spec["limit"] + 1)
+        payload = json.dumps(list_page(list(cursor), spec))
+        redis_client.set(key, payload, ex=STORES_CACHE_TTL_SECONDS)
+
+    etag = etag_for(payload)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status=304, headers=headers)
+    return Response(payload, mimetype="application/json", headers=headers)
@@ -0,0 +1,5 @@
+"""Modules shared by the api, cv and worker services.
+
+Each service's Dockerfile installs this package (the compose build context is the repo
+root), so there is one copy to change. Locally: pip install -e common
+"""
@@ -0,0 +1,378 @@
+"""Counters, gauges and latency histograms in the Prometheus text format, plus an on-demand
+sampling profiler, with no client library.
+
+    from guardian_common import metrics
+
+    EVENTS = counter("worker_events_total", "Events processed", ["outcome"])
+    STAGE = histogram("worker_stage_seconds", "Time per pipeline stage", ["stage"])
+    USERS = gauge("worker_snapshot_users", "Users in the match snapshot")
+    EVENTS.inc(outcome="ok")
+    USERS.set(len(users))
+    with STAGE.time(stage="match"):
+        ...
+    render()             # body for GET /metrics
+    totals("worker_events_total")  # {("ok",): 12, ...}, merged like render()
+    profile(10)          # GET /debug/profile?seconds=10: collapsed stacks for flamegraph.pl / speedscope
+    serve(METRICS_PORT)  # both endpoints for processes without a web app (worker, mailer, cv_jobs)
+    MongoClient(uri, event_listeners=[mongo_listener(histogram("api_mongo_seconds", ...))])
+
+Each process keeps its own numbers. When several processes answer on one port (gunicorn
+or hypercorn workers), point METRICS_DIR at a directory they share, emptied at startup
+(cv/gunicorn.conf.py does): each process writes its numbers there at most METRICS_FLUSH_SECONDS apart and
+render() adds up every file, including those of processes that have exited. Gauges are
+not added up: render() reports the largest value among processes still running.
+"""
+import bisect
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+# /debug/profile answers only requests carrying a token (X-Profile-Token): PROFILE_TOKEN, or
+# whatever PROFILE_TOKEN_FILE holds when the request comes in. The file is how profiling is
+# turned on (write a token) and off (delete it) in a process already running without one.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_TOKEN_FILE = os.getenv("PROFILE_TOKEN_FILE", "/tmp/profile-token")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+# Seconds; from a Redis round-trip to a slow SMTP send.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = {}
+_lock = threading.Lock()
+_process = {"pid": os.getpid(), "flushed": 0.0}
+_profiling = threading.Lock()
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with _lock:
+            _check_fork()
+            self.values[key] = self.values.get(key, 0) + amount
+        _maybe_flush()
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self.key(labels)
+        with _lock:
+            _check_fork()
+            self.values[key] = value
+        _maybe_flush()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            _check_fork()
+            # per-bucket counts (the last one is +Inf), then the sum
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[i] += 1
+            state[-1] += value
+        _maybe_flush()
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+def _register(cls, name: str, *args, **kwargs):
+    with _lock:
+        if name not in _registry:
+            _registry[name] = cls(name, *args, **kwargs)
+        return _registry[name]
+
+
+def counter(name: str, help: str, labels=()) -> Counter:
+    return _register(Counter, name, help, labels)
+
+
+def gauge(name: str, help: str, labels=()) -> Gauge:
+    return _register(Gauge, name, help, labels)
+
+
+def histogram(name: str, help: str, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+    return _register(Histogram, name, help, labels, buckets)
+
+
+def _check_fork():
+    # A forked child (gunicorn preload) starts from zero; what the parent counted is the parent's.
+    if os.getpid() != _process["pid"]:
+        for metric in _registry.values():
+            metric.values.clear()
+        _process["pid"], _process["flushed"] = os.getpid(), 0.0
+
+
+def snapshot() -> dict:
+    with _lock:
+        _check_fork()
+        return {name: [[list(k), v if isinstance(v, (int, float)) else list(v)] for k, v in m.values.items()]
+                for name, m in _registry.items()}
+
+
+def flush():
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(snapshot(), f)
+    os.replace(tmp, path)
+    _process["flushed"] = time.monotonic()
+
+
+def _maybe_flush():
+    if METRICS_DIR and time.monotonic() - _process["flushed"] > METRICS_FLUSH_SECONDS:
+        try:
+            flush()
+        except OSError as e:
+            print(f"[metrics] flush to {METRICS_DIR} failed: {e}")
+            _process["flushed"] = time.monotonic()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # exists, owned by someone else
+    return True
+
+
+def _collect() -> dict:
+    """{name: {label values: value}} for this process, or summed over METRICS_DIR."""
+    if not METRICS_DIR:
+        snapshots = [(snapshot(), True)]
+    else:
+        flush()
+        snapshots = []
+        for filename in os.listdir(METRICS_DIR):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(METRICS_DIR, filename)) as f:
+                    snap = json.load(f)
+            except (OSError, ValueError):
+                continue  # being replaced right now; counted next scrape
+            pid = filename[:-len(".json")]
+            snapshots.append((snap, not pid.isdigit() or _alive(int(pid))))
+
+    merged = {}
+    for snap, alive in snapshots:
+        for name, series in snap.items():
+            metric = _registry.get(name)
+            gauge = metric is not None and metric.kind == "gauge"
+            if gauge and not alive:
+                continue  # an exited process's last reading is no longer true
+            values = merged.setdefault(name, {})
+            for key, value in series:
+                key = tuple(key)
+                if gauge:
+                    values[key] = max(values.get(key, value), value)
+                elif isinstance(value, list):
+                    prev = values.get(key)
+                    values[key] = value if prev is None else [a + b for a, b in zip(prev, value)]
+                else:
+                    values[key] = values.get(key, 0) + value
+    return merged
+
+
+def totals(name: str) -> dict:
+    """{label values: value} of one metric, merged across processes as render() does."""
+    return _collect().get(name, {})
+
+
+def mongo_listener(hist: Histogram):
+    """pymongo command listener recording each command's server round-trip in
+    hist{command, collection}. Only imports pymongo when called."""
+    from pymongo import monitoring
+
+    class CommandTimer(monitoring.CommandListener):
+        def __init__(self):
+            self.collections = {}
+
+        def started(self, event):
+            target = event.command.get(event.command_name)  # getMore names a cursor id instead
+            self.collections[event.request_id] = target if isinstance(target, str) else event.command.get(
+                "collection", "")
+
+        def succeeded(self, event):
+            self.record(event)
+
+        def failed(self, event):
+            self.record(event)
+
+        def record(self, event):
+            collection = self.collections.pop(event.request_id, "")
+            hist.observe(event.duration_micros / 1e6, command=event.command_name, collection=collection)
+
+    return CommandTimer()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render() -> str:
+    merged = _collect()
+    lines = []
+    for name, metric in list(_registry.items()):
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for key, value in sorted(merged.get(name, {}).items()):
+            if metric.kind in ("counter", "gauge"):
+                lines.append(f"{name}{_labels(metric.labels, key)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ("+Inf",), value[:-1]):
+                cumulative += count
+                le = bound if bound == "+Inf" else _number(float(bound))
+                lines.append(f"{name}_bucket{_labels(metric.labels, key, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(metric.labels, key)} {_number(value[-1])}")
+            lines.append(f"{name}_count{_labels(metric.labels, key)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> str:
+    """Wall-clock samples of every other thread's stack, in collapsed-stack format.
+
+    One line per distinct stack, "thread;outer.py:fn;...;inner.py:fn count", most
+    frequent first. Threads blocked on I/O show up too, which is the point when
+    looking for where a request waits.
+    """
+    me = threading.get_ident()
+    counts = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            key = ";".join(reversed(stack))
+            counts[key] = counts.get(key, 0) + 1
+        time.sleep(interval)
+    return "\n".join(f"{stack} {n}" for stack, n in sorted(counts.items(), key=lambda kv: -kv[1])) + "\n"
+
+
+def profile_token() -> str:
+    """The token /debug/profile wants right now; empty = disabled."""
+    if PROFILE_TOKEN_FILE:
+        try:
+            with open(PROFILE_TOKEN_FILE) as f:
+                token = f.read().strip()
+            if token:
+                return token
+        except OSError:
+            pass
+    return PROFILE_TOKEN
+
+
+def profile(seconds, interval_ms=5, token: str = ""):
+    """(status, body) for GET /debug/profile; one profile per process at a time."""
+    expected = profile_token()
+    if not expected or not hmac.compare_digest(token.encode(), expected.encode()):
+        return 404, "not found\n"
+    try:
+        seconds = float(seconds)
+        interval = float(interval_ms) / 1000
+    except (TypeError, ValueError):
+        return 400, "seconds and interval_ms must be numbers\n"
+    if not 0 < seconds <= PROFILE_MAX_SECONDS or not 0 < interval <= 1:
+        return 400, f"seconds must be in (0, {PROFILE_MAX_SECONDS:g}] and interval_ms in (0, 1000]\n"
+    if not _profiling.acquire(blocking=False):
+        return 409, "a profile is already running in this process\n"
+    try:
+        return 200, sample_stacks(seconds, interval)
+    finally:
+        _profiling.release()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            status, body, content_type = 200, render(), CONTENT_TYPE
+        elif url.path == "/debug/profile":
+            args = {k: v[0] for k, v in parse_qs(url.query).items()}
+            status, body = profile(args.get("seconds", 10), args.get("interval_ms", 5),
+                                   self.headers.get("X-Profile-Token", ""))
+            content_type = "text/plain; charset=utf-8"
+        else:
+            status, body, content_type = 404, "not found\n", "text/plain; charset=utf-8"
+        payload = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port: int):
+    """/metrics and /debug/profile on a daemon thread; 0 = don't serve."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,37 @@
+"""Mongo filters the worker and mailer send, built in one place so api/check_query_plans.py
+explains exactly the shapes those services run.
+
+    users.find(candidate_users_filter(lat, lng, MAX_RADIUS_KM, cell), CANDIDATE_PROJECTION)
+    users.find(snapshot_filter(regions), USER_PROJECTION)
+    notifications.update_many(by_ids(ids), ...)
+"""
+
+EARTH_RADIUS_KM = 6371.0
+
+# What the matcher reads from a user (UserMatcher); the snapshot also tracks notify and geohash.
+CANDIDATE_PROJECTION = {"email": 1, "location": 1, "radius_km": 1, "item_filters": 1}
+USER_PROJECTION = {**CANDIDATE_PROJECTION, "notify": 1, "geohash": 1}
+
+
+def candidate_users_filter(lat: float, lng: float, radius_km: float, cell: str = None) -> dict:
+    """Users with notifications on within radius_km of (lat, lng), served by the notify_geo
+    2dsphere index. With a cell, only users whose geohash is in it."""
+    query = {
+        "notify": True,
+        "geo": {"$geoWithin": {"$centerSphere": [[lng, lat], radius_km / EARTH_RADIUS_KM]}},
+    }
+    if cell:
+        query["geohash"] = {"$regex": f"^{cell}"}
+    return query
+
+
+def snapshot_filter(regions=None) -> dict:
+    """Every user the in-memory snapshot holds, or only those in the given geohash regions."""
+    if not regions:
+        return {"notify": True, "location": {"$ne": None}}
+    # One prefix regex per region so each uses tight bounds on the notify_geohash index.
+    return {"notify": True, "$or": [{"geohash": {"$regex": f"^{cell}"}} for cell in regions]}
+
+
+def by_ids(ids: list) -> dict:
+    return {"_id": {"$in": ids}}
@@ -1,55 +1,217 @@
 import os
-from flask import Flask, jsonify, request
+import time
+from flask import Flask, Response, g, jsonify, request
 import numpy as np
-import onnxruntime as ort
-import cv2
+
+from guardian_common import metrics
+from batcher import MicroBatcher
+from cache import InferenceCache
+from detect import CLASS_NAMES, ImageMeta, decode
+from letterbox import BufferPool, Letterboxer, decode as decode_image
+from runtime import create_nms_session, create_session, variant_path
 
 app = Flask(__name__)
 
-MODEL_PATH = os.environ.get("MODEL_PATH", "/app/models/best.onnx")
+# MODEL_PATH names the base FP32 export; MODEL_VARIANT picks a sibling built by model/build_variants.py.
+MODEL_VARIANT = os.environ.get("MODEL_VARIANT", "fp32")
+MODEL_PATH = variant_path(os.environ.get("MODEL_PATH", "/app/models/best.onnx"), MODEL_VARIANT)
+MODEL_VERSION = os.environ.get("MODEL_VERSION", "produce_bakery_v1")
+
+# The file is read once; under gunicorn (gunicorn.conf.py) that happens in the master before
+# forking, and each worker builds its own session from these bytes after the fork, because an
+# ORT session's thread pools do not survive fork(). Threads and graph optimization level come
+# from ORT_INTRA_OP_THREADS / ORT_INTER_OP_THREADS / ORT_GRAPH_OPT.
+with open(MODEL_PATH, "rb") as f:
+    MODEL_BYTES = f.read()
+SESSION_POST_FORK = os.environ.get("CV_SESSION_POST_FORK", "0") == "1"
+WARMUP_RUNS = int(os.environ.get("WARMUP_RUNS", "2"))
 
-SESSION = ort.InferenceSession(
-    MODEL_PATH,
-    providers=["CPUExecutionProvider"],
-)
+SESSION = None
+NMS_SESSION = None
+INPUT_NAME = None
+DYNAMIC_BATCH = False
 
-INPUT_NAME = SESSION.get_inputs()[0].name
+MAX_BATCH = int(os.environ.get("MAX_BATCH", "16"))
+MICRO_BATCH = False
+MICRO_BATCH_WAIT_MS = float(os.environ.get("MICRO_BATCH_WAIT_MS", "5"))
 
 
-CLASS_NAMES = [
-    "apple", "banana", "orange", "grape", "strawberry",
-    "tomato", "potato", "bell_pepper", "cucumber", "carrot",
-    "broccoli", "bread", "cake", "pastry", "croissant",
-    "doughnut", "muffin", "cookie",
-]
+CONF_THRESHOLD = float(os.environ.get("CONF_THRESHOLD", "0.25"))
+IOU_THRESHOLD = float(os.environ.get("IOU_THRESHOLD", "0.45"))
+MAX_DET = int(os.environ.get("MAX_DET", "100"))
+INPUT_SIZE = 640
 
+# Result cache keyed by image content; the namespace changes with anything that changes results.
+CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "1") == "1"
+CACHE_PERCEPTUAL = os.environ.get("CACHE_PERCEPTUAL", "0") == "1"
+CACHE = InferenceCache(
+    namespace=f"{MODEL_VERSION}:{MODEL_VARIANT}:{CONF_THRESHOLD}:{IOU_THRESHOLD}:{MAX_DET}",
+    lru_size=int(os.environ.get("CACHE_LRU_SIZE", "1024")),
+    redis_url=os.environ.get("CACHE_REDIS_URL", ""),
+    ttl_seconds=int(os.environ.get("CACHE_TTL_SECONDS", "86400")),
+    perceptual_max_delta=int(os.environ.get("CACHE_PERCEPTUAL_MAX_DELTA", "6")),
+) if CACHE_ENABLED else None
 
 PRINT_SHAPE_ONCE = True
 
 
-def preprocess(image_bytes: bytes) -> np.ndarray:
-    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+LETTERBOX = Letterboxer(INPUT_SIZE)
+BATCH_BUFFERS = BufferPool(MAX_BATCH, INPUT_SIZE)
+
+REQUEST_SECONDS = metrics.histogram("cv_request_seconds", "HTTP request time", ["method", "route", "status"])
+# model = from handing the tensor over to getting outputs back
+# (includes the micro-batch wait); session_run = one SESSION.run call, however many images.
+STAGE = metrics.histogram("cv_stage_seconds", "Time per inference pipeline stage", ["stage"])
+BATCH_SIZE = metrics.histogram("cv_session_batch_size", "Images per SESSION.run call",
+                               buckets=(1, 2, 4, 8, 16, 32, 64))
+IMAGES = metrics.counter("cv_images_total", "Images served, by source (onnx, cache, error)", ["source"])
+
+
+def preprocess(image_bytes: bytes, out: np.ndarray = None):
+    """Decode and letterbox into `out` (1, 3, 640, 640), by default a per-thread buffer.
+
+    The returned tensor is only valid until this thread preprocesses its next image.
+    """
+    with STAGE.time(stage="decode"):
+        img, w, h = decode_image(image_bytes, INPUT_SIZE)
     if img is None:
         raise ValueError("Could not decode image. Ensure you uploaded a valid JPG/PNG.")
 
-    img = cv2.resize(img, (640, 640))
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    img = img.astype(np.float32) / 255.0
-    img = np.transpose(img, (2, 0, 1))
-    img = np.expand_dims(img, axis=0)
-    return img
+    if out is None:
+        out = LETTERBOX.default_out()
+    with STAGE.time(stage="letterbox"):
+        meta = LETTERBOX(img, w, h, out)
+    return out, meta
+
+
+def session_run(batch: np.ndarray) -> list:
+    BATCH_SIZE.observe(batch.shape[0])
+    with STAGE.time(stage="session_run"):
+        return SESSION.run(None, {INPUT_NAME: batch})
+
+def run_model(batch: np.ndarray) -> list:
+    """SESSION.run over an NCHW batch, chunked to what the model accepts."""
+    step = MAX_BATCH if DYNAMIC_BATCH else 1
+    if batch.shape[0] <= step:
+        return session_run(batch)
+    chunks = [session_run(batch[i:i + step]) for i in range(0, batch.shape[0], step)]
+    return [np.concatenate(parts, axis=0) for parts in zip(*chunks)]
+
+
+BATCHER = None
+
+
+def load_model():
+    """Build this process's session, then warm it up so the first request doesn't pay for it."""
+    global SESSION, NMS_SESSION, INPUT_NAME, DYNAMIC_BATCH, MICRO_BATCH, BATCHER
+
+    started = time.perf_counter()
+    SESSION = create_session(MODEL_BYTES)
+    NMS_SESSION = create_nms_session()
+    INPUT_NAME = SESSION.get_inputs()[0].name
+    # Batching needs a model exported with a dynamic batch axis (see model/export_onnx.py).
+    DYNAMIC_BATCH = not isinstance(SESSION.get_inputs()[0].shape[0], int)
+    MICRO_BATCH = os.environ.get("MICRO_BATCH", "1") == "1" and DYNAMIC_BATCH
+    BATCHER = MicroBatcher(run_model, MAX_BATCH, MICRO_BATCH_WAIT_MS) if MICRO_BATCH else None
+    loaded = time.perf_counter()
+
+    dummy = np.zeros((1, 3, INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
+    for _ in range(WARMUP_RUNS):
+        SESSION.run(None, {INPUT_NAME: dummy})
+    print(f"[cv] pid {os.getpid()} loaded {MODEL_PATH} (variant={MODEL_VARIANT}) in "
+          f"{(loaded - started) * 1000:.0f} ms, warm-up {(time.perf_counter() - loaded) * 1000:.0f} ms")
+
+
+def infer_tensor(input_tensor: np.ndarray) -> list:
+    with STAGE.time(stage="model"):
+        if BATCHER is not None:
+            return BATCHER.submit(input_tensor)
+        return session_run(input_tensor)
+
+
+def postprocess(outputs, meta: ImageMeta):
+    """Detections for one image: [{label, count, score, boxes: [[x1, y1, x2, y2, score], ...]}]."""
+    with STAGE.time(stage="postprocess"):
+        return decode(outputs[0][0], meta, CLASS_NAMES, CONF_THRESHOLD, IOU_THRESHOLD, MAX_DET, NMS_SESSION)
+
+
+
+class Prepared:
+    """One uploaded image on its way through the cache and the model."""
+    __slots__ = ("items", "tensor", "meta", "keys", "thumb", "started")
+
+    def __init__(self, items=None, tensor=None, meta=None, keys=(), thumb=None, started=0.0):
+        self.items = items
+        self.tensor = tensor
+        self.meta = meta
+        self.keys = list(keys)
+        self.thumb = thumb
+        self.started = started
+
 
-def postprocess(outputs):
-    p = outputs[0][0].T
-    scores = p[:, 4:]
-    cls_id = int(np.argmax(scores.max(axis=0)))
-    return [{"label": CLASS_NAMES[cls_id]}]
+def prepare(image_bytes: bytes, out: np.ndarray = None) -> Prepared:
+    """Serve from the cache if possible, otherwise preprocess for the model."""
+    started = time.perf_counter()
+    keys = []
+    if CACHE is not None:
+        keys.append(CACHE.exact_key(image_bytes))
+        with STAGE.time(stage="cache_lookup"):
+            items = CACHE.lookup(keys[0])
+        if items is not None:
+            return Prepared(items=items)
 
+    tensor, meta = preprocess(image_bytes, out)
+    thumb = None
+    if CACHE is not None:
+        if CACHE_PERCEPTUAL:
+            key, thumb = CACHE.perceptual_key(tensor)
+            keys.append(key)
+            items = CACHE.lookup_perceptual(key, thumb, meta.width, meta.height)
+            if items is not None:
+                return Prepared(items=items)
+        CACHE.record_miss()
+    return Prepared(tensor=tensor, meta=meta, keys=keys, thumb=thumb, started=started)
+
+
+def finish(prep: Prepared, outputs) -> list:
+    prep.items = postprocess(outputs, prep.meta)
+    if CACHE is not None:
+        elapsed_ms = (time.perf_counter() - prep.started) * 1000
+        CACHE.put(prep.keys, prep.items, prep.meta.width, prep.meta.height, elapsed_ms, prep.thumb)
+    return prep.items
+
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    if "started" in g:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - g.started, method=request.method, route=route,
+                                status=response.status_code)
+    return response
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/debug/profile")
+def debug_profile():
+    status, body = metrics.profile(request.args.get("seconds", 10), request.args.get("interval_ms", 5),
+                                   request.headers.get("X-Profile-Token", ""))
+    return Response(body, status=status, mimetype="text/plain")
 
 
 @app.get("/health")
 def health():
-    return {"ok": True}
+    if SESSION is None:
+        return jsonify({"ok": False, "error": "model not loaded"}), 503
+    return {"ok": True, "model_version": MODEL_VERSION, "model_variant": MODEL_VARIANT}
 
 
 @app.post("/infer")
@@ -64,24 +226,97 @@ def infer():
         return jsonify({"error": "empty image upload"}), 400
 
     try:
-        input_tensor = preprocess(image_bytes)
-        outputs = SESSION.run(None, {INPUT_NAME: input_tensor})
+        prep = prepare(image_bytes)
+        source = "cache"
+        if prep.items is None:
+            outputs = infer_tensor(prep.tensor)
 
-        if PRINT_SHAPE_ONCE:
-            print("ONNX output shapes:", [o.shape for o in outputs])
-            PRINT_SHAPE_ONCE = False
+            if PRINT_SHAPE_ONCE:
+                print("ONNX output shapes:", [o.shape for o in outputs])
+                PRINT_SHAPE_ONCE = False
 
-        items = postprocess(outputs)
+            finish(prep, outputs)
+            source = "onnx"
+        IMAGES.inc(source=source)
 
         return jsonify(
             {
-                "items": items,
-                "source": "onnx",
-                "model_version": "produce_bakery_v1",
+                "items": prep.items,
+                "source": source,
+                "model_version": MODEL_VERSION,
             }
         )
+    except Exception as e:
+        IMAGES.inc(source="error")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.post("/infer/batch")
+def infer_batch():
+    """Many images in one multipart request (repeat the 'images' field).
+
+    Results come back in upload order; an image that fails to decode gets an
+    error entry instead of failing the whole batch.
+    """
+    files = request.files.getlist("images") or request.files.getlist("image")
+    if not files:
+        return jsonify({"error": "image files required (form field name: 'images')"}), 400
+
+    results = [None] * len(files)
+    buf = BATCH_BUFFERS.acquire() if DYNAMIC_BATCH else None
+    pending = []
+
+    def flush():
+        batch = buf[:len(pending)] if buf is not None else pending[0][1].tensor
+        outputs = run_model(batch)
+        for k, (i, prep) in enumerate(pending):
+            results[i] = {"items": finish(prep, [o[k:k + 1] for o in outputs]), "source": "onnx"}
+        IMAGES.inc(len(pending), source="onnx")
+        pending.clear()
+
+    try:
+        for i, f in enumerate(files):
+            # Misses are letterboxed straight into the next free slot of the batch buffer.
+            slot = buf[len(pending):len(pending) + 1] if buf is not None else None
+            try:
+                prep = prepare(f.read(), slot)
+            except Exception as e:
+                results[i] = {"error": str(e)}
+                IMAGES.inc(source="error")
+                continue
+            if prep.items is not None:
+                results[i] = {"items": prep.items, "source": "cache"}
+                IMAGES.inc(source="cache")
+                continue
+            pending.append((i, prep))
+            if buf is None or len(pending) == MAX_BATCH:
+                flush()
+        if pending:
+            flush()
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    finally:
+        if buf is not None:
+            BATCH_BUFFERS.release(buf)
+
+    return jsonify(
+        {
+            "results": results,
+            "source": "onnx",
+            "model_version": MODEL_VERSION,
+        }
+    )
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    if CACHE is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **CACHE.stats()})
+
+
+if not SESSION_POST_FORK:
+    load_model()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,62 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """Collects concurrent single-image requests into one NCHW batch.
+
+    The first waiting request opens a window of `max_wait_ms`; everything that
+    arrives before it closes (up to `max_batch` images) goes through `run_fn`
+    together, and each caller gets back its own slice of every output.
+    """
+
+    def __init__(self, run_fn, max_batch: int = 16, max_wait_ms: float = 5.0):
+        self.run_fn = run_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+                self.thread.start()
+
+    def submit(self, tensor: np.ndarray) -> list:
+        """Run a (1, C, H, W) tensor through the model; blocks until its batch is done."""
+        self.start()
+        fut = Future()
+        self.queue.put((tensor, fut))
+        return fut.result()
+
+    def _collect(self) -> list:
+        pending = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(pending) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return pending
+
+    def _loop(self):
+        while True:
+            pending = self._collect()
+            try:
+                batch = np.concatenate([t for t, _ in pending], axis=0)
+                outputs = self.run_fn(batch)
+            except Exception as e:
+                for _, fut in pending:
+                    fut.set_exception(e)
+                continue
+            for i, (_, fut) in enumerate(pending):
+                fut.set_result([o[i:i + 1] for o in outputs])
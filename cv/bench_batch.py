@@ -0,0 +1,91 @@
+"""CPU throughput and latency of batched inference.
+
+Part 1 runs NCHW batches of 1..32 straight through ONNX Runtime.
+Part 2 fires concurrent single-image requests, once through SESSION.run per
+request and once through the dynamic MicroBatcher.
+
+    MODEL_PATH=model/runs_guardian/produce_bakery_yolov8n/weights/best.onnx \\
+        python bench_batch.py --batch-sizes 1 2 4 8 16 32 --concurrency 16
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+
+import app
+from batcher import MicroBatcher
+
+
+def percentile(samples, q):
+    return float(np.percentile(np.asarray(samples), q))
+
+
+def bench_direct(batch_sizes, seconds):
+    print(f"{'batch':>5} | {'images/s':>9} | {'p50 ms':>8} | {'p99 ms':>8}")
+    for bs in batch_sizes:
+        batch = np.random.rand(bs, 3, 640, 640).astype(np.float32)
+        app.run_model(batch)  # warm-up
+        samples = []
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            app.run_model(batch)
+            samples.append((time.perf_counter() - t0) * 1000)
+        ips = bs * len(samples) / (sum(samples) / 1000)
+        print(f"{bs:>5} | {ips:>9.1f} | {percentile(samples, 50):>8.1f} | {percentile(samples, 99):>8.1f}")
+
+
+def bench_concurrent(infer, concurrency, requests_per_thread):
+    tensor = np.random.rand(1, 3, 640, 640).astype(np.float32)
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        local = []
+        for _ in range(requests_per_thread):
+            t0 = time.perf_counter()
+            infer(tensor)
+            local.append((time.perf_counter() - t0) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    return len(latencies) / elapsed, percentile(latencies, 50), percentile(latencies, 99)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    ap.add_argument("--seconds", type=float, default=5.0, help="per batch size")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--requests", type=int, default=20, help="per client thread")
+    ap.add_argument("--wait-ms", type=float, default=app.MICRO_BATCH_WAIT_MS)
+    args = ap.parse_args()
+
+    if not app.DYNAMIC_BATCH:
+        print("Model has a fixed batch axis; re-export with model/export_onnx.py to batch.")
+        args.batch_sizes = [1]
+
+    print("== direct batches ==")
+    bench_direct(args.batch_sizes, args.seconds)
+
+    print(f"\n== {args.concurrency} concurrent single-image clients ==")
+    print(f"{'mode':>13} | {'images/s':>9} | {'p50 ms':>8} | {'p99 ms':>8}")
+    single = lambda t: app.SESSION.run(None, {app.INPUT_NAME: t})
+    print("{:>13} | {:>9.1f} | {:>8.1f} | {:>8.1f}".format(
+        "per-request", *bench_concurrent(single, args.concurrency, args.requests)))
+    if app.DYNAMIC_BATCH:
+        batcher = MicroBatcher(app.run_model, max(args.batch_sizes), args.wait_ms)
+        print("{:>13} | {:>9.1f} | {:>8.1f} | {:>8.1f}".format(
+            "micro-batch", *bench_concurrent(batcher.submit, args.concurrency, args.requests)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Postprocess latency on a synthetic YOLOv8 head output (no model needed).
+
+Builds a (4 + 18, 8400) output with a few clusters of overlapping confident
+boxes over background noise, then times detect.decode with NMS in ORT (what
+the service runs) or in the NumPy greedy loop.
+
+    python bench_postprocess.py --objects 1 10 50 --runs 2000 [--nms greedy]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from detect import ImageMeta, decode
+from runtime import create_nms_session
+
+NUM_CLASSES = 18
+ANCHORS = 8400
+CLASS_NAMES = [f"class_{i}" for i in range(NUM_CLASSES)]
+
+
+def synthetic_output(objects: int, rng: np.random.Generator) -> np.ndarray:
+    out = np.zeros((4 + NUM_CLASSES, ANCHORS), dtype=np.float32)
+    out[0:2] = rng.uniform(0, 640, size=(2, ANCHORS))
+    out[2:4] = rng.uniform(8, 64, size=(2, ANCHORS))
+    out[4:] = rng.uniform(0, 0.05, size=(NUM_CLASSES, ANCHORS))
+    # Each object lights up ~20 neighbouring anchors with jittered boxes.
+    for _ in range(objects):
+        cls = rng.integers(NUM_CLASSES)
+        cx, cy, w, h = rng.uniform(50, 590), rng.uniform(50, 590), rng.uniform(40, 160), rng.uniform(40, 160)
+        idx = rng.choice(ANCHORS, size=20, replace=False)
+        out[0, idx] = cx + rng.normal(0, 3, 20)
+        out[1, idx] = cy + rng.normal(0, 3, 20)
+        out[2, idx] = w + rng.normal(0, 3, 20)
+        out[3, idx] = h + rng.normal(0, 3, 20)
+        out[4 + cls, idx] = rng.uniform(0.4, 0.95, 20)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--objects", type=int, nargs="+", default=[1, 10, 50])
+    ap.add_argument("--runs", type=int, default=2000)
+    ap.add_argument("--nms", choices=["ort", "greedy"], default="ort")
+    args = ap.parse_args()
+
+    session = create_nms_session() if args.nms == "ort" else None
+
+    rng = np.random.default_rng(0)
+    meta = ImageMeta(width=4032, height=3024, scale_x=640 / 4032, scale_y=640 / 3024)
+    print(f"{'objects':>7} | {'detections':>10} | {'p50 ms':>7} | {'p99 ms':>7}")
+    for n in args.objects:
+        out = synthetic_output(n, rng)
+        dets = decode(out, meta, CLASS_NAMES, 0.25, 0.45, 100, session)
+        samples = []
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            decode(out, meta, CLASS_NAMES, 0.25, 0.45, 100, session)
+            samples.append((time.perf_counter() - t0) * 1000)
+        total = sum(d["count"] for d in dets)
+        print(f"{n:>7} | {total:>10} | {np.percentile(samples, 50):>7.3f} | {np.percentile(samples, 99):>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Preprocess cost per image: the original stretch-resize pipeline vs. letterboxing
+into a reused buffer with reduced-resolution JPEG decode. No model needed.
+
+    python bench_preprocess.py ../test_images/*.jpg --phone-size 4032x3024
+"""
+import argparse
+import statistics
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from letterbox import Letterboxer, decode
+
+SIZE = 640
+
+
+def legacy_preprocess(image_bytes: bytes) -> np.ndarray:
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    img = cv2.resize(img, (SIZE, SIZE))
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    img = img.astype(np.float32) / 255.0
+    img = np.transpose(img, (2, 0, 1))
+    return np.expand_dims(img, axis=0)
+
+
+LETTERBOX = Letterboxer(SIZE)
+OUT = np.empty((1, 3, SIZE, SIZE), dtype=np.float32)
+
+
+def letterbox_preprocess(image_bytes: bytes) -> np.ndarray:
+    img, w, h = decode(image_bytes, SIZE)
+    LETTERBOX(img, w, h, OUT)
+    return OUT
+
+
+def measure(fn, data: bytes, runs: int):
+    fn(data)  # warm up thread-local buffers
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn(data)
+        times.append((time.perf_counter() - t0) * 1000)
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    fn(data)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return statistics.median(times), peak
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("images", nargs="*", default=["../test_images/cake.jpg"])
+    ap.add_argument("--phone-size", default="4032x3024", help="also test an upscaled copy of the first image")
+    ap.add_argument("--runs", type=int, default=50)
+    args = ap.parse_args()
+
+    samples = [(path, open(path, "rb").read()) for path in args.images]
+    if args.phone_size:
+        w, h = (int(x) for x in args.phone_size.split("x"))
+        img = cv2.imdecode(np.frombuffer(samples[0][1], np.uint8), cv2.IMREAD_COLOR)
+        ok, enc = cv2.imencode(".jpg", cv2.resize(img, (w, h)), [cv2.IMWRITE_JPEG_QUALITY, 90])
+        samples.append((f"phone {w}x{h}", enc.tobytes()))
+
+    print(f"{'image':>28} | {'legacy ms':>9} {'legacy MB':>9} | {'letterbox ms':>12} {'letterbox MB':>12}")
+    for name, data in samples:
+        old_ms, old_bytes = measure(legacy_preprocess, data, args.runs)
+        new_ms, new_bytes = measure(letterbox_preprocess, data, args.runs)
+        print(f"{name[-28:]:>28} | {old_ms:>9.2f} {old_bytes / 1e6:>9.2f} | {new_ms:>12.2f} {new_bytes / 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
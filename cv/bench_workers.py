@@ -0,0 +1,86 @@
+"""Throughput scaling of the gunicorn deployment with core count.
+
+For each core budget N it starts `gunicorn -c gunicorn.conf.py app:app` with
+the cores split as N workers x 1 ORT thread and as 1 worker x N threads. It
+then drives /infer from concurrent clients over the corpus and reports
+images/s and latency. The result cache is disabled so every request runs
+the model.
+
+    MODEL_PATH=model/runs_guardian/produce_bakery_yolov8n/weights/best.onnx \\
+        python bench_workers.py --cores 1 2 4 8 --clients 32
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import requests
+
+from benchmark import load_corpus, run_concurrent
+
+
+def start_server(port: int, workers: int, intra_threads: int, cores: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "CV_WORKERS": str(workers),
+        "ORT_INTRA_OP_THREADS": str(intra_threads),
+        "CV_BIND": f"127.0.0.1:{port}",
+        "CACHE_ENABLED": "0",
+    }
+    cmd = ["gunicorn", "-c", "gunicorn.conf.py", "app:app"]
+    if sys.platform.startswith("linux"):
+        # Pin the whole server to the first `cores` CPUs so the budget is real.
+        cmd = ["taskset", "-c", f"0-{cores - 1}"] + cmd
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            # 200 only once a worker has built and warmed its session.
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).ok:
+                time.sleep(1)  # let the remaining workers finish warming up
+                return proc
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not become healthy")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cores", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--images", default="../test_images")
+    ap.add_argument("--clients", type=int, default=16)
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--port", type=int, default=8102)
+    args = ap.parse_args()
+
+    available = os.cpu_count() or 1
+    corpus = load_corpus(args.images, 0)
+    url = f"http://127.0.0.1:{args.port}/infer"
+
+    def post(item):
+        files = {"image": (item["name"], item["bytes"], "image/jpeg")}
+        requests.post(url, files=files, timeout=60).raise_for_status()
+
+    print(f"{'cores':>5} | {'layout':>12} | {'images/s':>9} | {'p50 ms':>8} | {'p99 ms':>8}")
+    for cores in args.cores:
+        if cores > available:
+            print(f"{cores:>5} | skipped, only {available} CPUs")
+            continue
+        layouts = [(cores, 1)] + ([(1, cores)] if cores > 1 else [])
+        for workers, threads in layouts:
+            proc = start_server(args.port, workers, threads, cores)
+            try:
+                post(corpus[0])
+                r = run_concurrent(post, corpus, args.clients, args.requests)
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+            layout = f"{workers}w x {threads}t"
+            print(f"{cores:>5} | {layout:>12} | {r['images_per_s']:>9.1f} | {r['p50_ms']:>8.1f} | {r['p99_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""Repeatable speed + accuracy benchmark for the detector, stored as JSON.
+
+Runs a fixed image corpus (sorted, optionally truncated) either in-process
+through the same functions the service uses, or against a live /infer:
+
+    # in-process: per-stage timings, throughput per concurrency, accuracy
+    MODEL_PATH=model/runs_guardian/produce_bakery_yolov8n/weights/best.onnx \\
+        python benchmark.py model --images model/data/openimages_produce_bakery_yolo/val --limit 500
+
+    # live service (start it with CACHE_ENABLED=0, or repeats are served from the cache)
+    python benchmark.py service --url http://localhost:8002 --images ../test_images
+
+    # fail if p95 got >10% slower or mAP50 dropped >0.01 against an earlier run
+    python benchmark.py model ... --baseline bench_results/previous.json
+
+Labels are YOLO txt files (class cx cy w h, normalized), found next to each
+image or in the matching labels/ directory of a YOLOv5 export. Images without
+a label file are timed but left out of the accuracy numbers.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from detect import CLASS_NAMES
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+IOU_MATCH = 0.5
+
+
+# ---------------------------------------------------------------------------
+# Corpus
+# ---------------------------------------------------------------------------
+
+def label_path(image: Path):
+    candidates = [image.with_suffix(".txt")]
+    parts = list(image.parts)
+    if "images" in parts:
+        i = len(parts) - 1 - parts[::-1].index("images")
+        candidates.append(Path(*parts[:i], "labels", *parts[i + 1:]).with_suffix(".txt"))
+    return next((p for p in candidates if p.exists()), None)
+
+
+def read_labels(path: Path, width: int, height: int) -> list:
+    """[(class_name, [x1, y1, x2, y2])] in original image pixels."""
+    boxes = []
+    for line in path.read_text().splitlines():
+        fields = line.split()
+        if len(fields) < 5:
+            continue
+        cls, cx, cy, w, h = int(fields[0]), *map(float, fields[1:5])
+        boxes.append((CLASS_NAMES[cls], [(cx - w / 2) * width, (cy - h / 2) * height,
+                                         (cx + w / 2) * width, (cy + h / 2) * height]))
+    return boxes
+
+
+def load_corpus(root: str, limit: int) -> list:
+    """[{name, bytes, label_file}] in a stable order."""
+    paths = sorted(p for p in Path(root).rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+    if limit:
+        paths = paths[:limit]
+    if not paths:
+        sys.exit(f"No images under {root}")
+    return [{"name": str(p.relative_to(root)), "bytes": p.read_bytes(), "label_file": label_path(p)} for p in paths]
+
+
+def corpus_digest(corpus: list) -> str:
+    h = hashlib.sha256()
+    for item in corpus:
+        h.update(hashlib.sha256(item["bytes"]).digest())
+    return h.hexdigest()[:16]
+
+
+# ---------------------------------------------------------------------------
+# Statistics
+# ---------------------------------------------------------------------------
+
+def summarize(samples: list) -> dict:
+    a = np.asarray(samples, dtype=np.float64)
+    return {
+        "n": int(a.size),
+        "mean_ms": round(float(a.mean()), 3),
+        "p50_ms": round(float(np.percentile(a, 50)), 3),
+        "p95_ms": round(float(np.percentile(a, 95)), 3),
+        "p99_ms": round(float(np.percentile(a, 99)), 3),
+    }
+
+
+def iou(a, b) -> float:
+    w = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    h = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = w * h
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def average_precision(hits: list, n_gt: int) -> float:
+    """All-point interpolated AP from [(score, is_tp)]."""
+    if not n_gt:
+        return 0.0
+    hits = sorted(hits, key=lambda h: -h[0])
+    tp = np.cumsum([h[1] for h in hits])
+    fp = np.cumsum([not h[1] for h in hits])
+    recall = np.concatenate([[0.0], tp / n_gt, [1.0]])
+    precision = np.concatenate([[1.0], tp / np.maximum(tp + fp, 1), [0.0]])
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    return float(np.sum((recall[1:] - recall[:-1]) * precision[1:]))
+
+
+def accuracy(results: list) -> dict:
+    """Precision/recall at the service's thresholds and mAP50 over labelled images.
+
+    Detections are the service output (already confidence-filtered), so mAP50
+    here is the operating-point AP, lower than ultralytics val at conf=0.001.
+    """
+    hits = {name: [] for name in CLASS_NAMES}
+    n_gt = {name: 0 for name in CLASS_NAMES}
+    tp = fp = fn = labelled = 0
+    for r in results:
+        if r.get("truth") is None:
+            continue
+        labelled += 1
+        truth = r["truth"]
+        for name, _ in truth:
+            n_gt[name] += 1
+        matched = set()
+        dets = [(item["label"], b[:4], b[4]) for item in r["items"] for b in item["boxes"]]
+        for label, box, score in sorted(dets, key=lambda d: -d[2]):
+            best, best_j = 0.0, None
+            for j, (name, gt) in enumerate(truth):
+                if name == label and j not in matched:
+                    v = iou(box, gt)
+                    if v > best:
+                        best, best_j = v, j
+            ok = best >= IOU_MATCH
+            if ok:
+                matched.add(best_j)
+            hits[label].append((score, ok))
+            tp += ok
+            fp += not ok
+        fn += len(truth) - len(matched)
+
+    if not labelled:
+        return {"labelled_images": 0}
+    per_class = {name: round(average_precision(hits[name], n_gt[name]), 4) for name in CLASS_NAMES if n_gt[name]}
+    return {
+        "labelled_images": labelled,
+        "precision": round(tp / (tp + fp), 4) if tp + fp else 0.0,
+        "recall": round(tp / (tp + fn), 4) if tp + fn else 0.0,
+        "map50": round(float(np.mean(list(per_class.values()))), 4) if per_class else 0.0,
+        "ap50_per_class": per_class,
+    }
+
+
+def run_concurrent(fn, corpus: list, concurrency: int, requests: int) -> dict:
+    """`requests` calls of fn(item) spread over `concurrency` threads."""
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def client():
+        local = []
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            t0 = time.perf_counter()
+            fn(corpus[i % len(corpus)])
+            local.append((time.perf_counter() - t0) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    return {"concurrency": concurrency, "images_per_s": round(len(latencies) / elapsed, 2), **summarize(latencies)}
+
+
+# ---------------------------------------------------------------------------
+# Targets
+# ---------------------------------------------------------------------------
+
+def bench_model(args, corpus: list) -> dict:
+    import app
+
+    stages = {"decode": [], "preprocess": [], "session_run": [], "postprocess": [], "total": []}
+    results = []
+    out = np.empty((1, 3, app.INPUT_SIZE, app.INPUT_SIZE), dtype=np.float32)
+
+    def pipeline(item, record=None):
+        t0 = time.perf_counter()
+        img, w, h = app.decode_image(item["bytes"], app.INPUT_SIZE)
+        t1 = time.perf_counter()
+        meta = app.LETTERBOX(img, w, h, out)
+        t2 = time.perf_counter()
+        outputs = app.SESSION.run(None, {app.INPUT_NAME: out})
+        t3 = time.perf_counter()
+        items = app.postprocess(outputs, meta)
+        t4 = time.perf_counter()
+        if record is not None:
+            for stage, dt in zip(stages, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t4 - t0)):
+                record[stage].append(dt * 1000)
+        return items, w, h
+
+    for item in corpus[:args.warmup]:
+        pipeline(item)
+    for _ in range(args.repeat):
+        for item in corpus:
+            items, w, h = pipeline(item, stages)
+            if len(results) < len(corpus):
+                truth = read_labels(item["label_file"], w, h) if item["label_file"] else None
+                results.append({"items": items, "truth": truth})
+
+    def serve(item):
+        # What /infer does on a cache miss: per-thread buffer, micro-batcher when enabled.
+        tensor, meta = app.preprocess(item["bytes"])
+        app.postprocess(app.infer_tensor(tensor), meta)
+
+    throughput = [run_concurrent(serve, corpus, c, args.requests) for c in args.concurrency]
+    with open(app.MODEL_PATH, "rb") as f:
+        model_sha = hashlib.sha256(f.read()).hexdigest()[:16]
+    return {
+        "model": {
+            "path": app.MODEL_PATH,
+            "sha256": model_sha,
+            "version": app.MODEL_VERSION,
+            "variant": app.MODEL_VARIANT,
+            "conf_threshold": app.CONF_THRESHOLD,
+            "iou_threshold": app.IOU_THRESHOLD,
+            "micro_batch": app.MICRO_BATCH,
+        },
+        "stages": {name: summarize(samples) for name, samples in stages.items()},
+        "throughput": throughput,
+        "accuracy": accuracy(results),
+    }
+
+
+def bench_service(args, corpus: list) -> dict:
+    import requests
+
+    url = args.url.rstrip("/") + "/infer"
+    local = threading.local()
+    sources = {}
+    lock = threading.Lock()
+
+    def post(item) -> dict:
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        resp = session.post(url, files={"image": (item["name"], item["bytes"], "image/jpeg")}, timeout=60)
+        resp.raise_for_status()
+        body = resp.json()
+        with lock:
+            sources[body.get("source")] = sources.get(body.get("source"), 0) + 1
+        return body
+
+    results, latencies, version = [], [], None
+    for item in corpus:
+        t0 = time.perf_counter()
+        body = post(item)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        version = body.get("model_version", version)
+        truth = None
+        if item["label_file"]:
+            from letterbox import jpeg_size  # header only; the service reports boxes in these pixels
+            size = jpeg_size(item["bytes"])
+            if size is None:
+                import cv2
+                img = cv2.imdecode(np.frombuffer(item["bytes"], np.uint8), cv2.IMREAD_COLOR)
+                size = (img.shape[1], img.shape[0])
+            truth = read_labels(item["label_file"], *size)
+        results.append({"items": body.get("items", []), "truth": truth})
+
+    throughput = [run_concurrent(post, corpus, c, args.requests) for c in args.concurrency]
+    if sources.get("cache"):
+        print(f"warning: {sources['cache']} responses came from the result cache; run the service with CACHE_ENABLED=0")
+    return {
+        "model": {"url": args.url, "version": version},
+        "stages": {"request": summarize(latencies)},
+        "throughput": throughput,
+        "accuracy": accuracy(results),
+        "sources": sources,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def compare(report: dict, baseline: dict, max_slowdown: float, max_map_drop: float) -> list:
+    """Regressions vs. an earlier report, as human-readable strings."""
+    problems = []
+    for stage, cur in report["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if old and cur["p95_ms"] > old["p95_ms"] * (1 + max_slowdown):
+            problems.append(f"{stage} p95 {old['p95_ms']:.2f} -> {cur['p95_ms']:.2f} ms")
+    old_tp = {t["concurrency"]: t for t in baseline.get("throughput", [])}
+    for cur in report["throughput"]:
+        old = old_tp.get(cur["concurrency"])
+        if old and cur["images_per_s"] < old["images_per_s"] / (1 + max_slowdown):
+            problems.append(f"throughput @{cur['concurrency']} {old['images_per_s']} -> {cur['images_per_s']} img/s")
+    old_map = baseline.get("accuracy", {}).get("map50")
+    cur_map = report["accuracy"].get("map50")
+    if old_map is not None and cur_map is not None and cur_map < old_map - max_map_drop:
+        problems.append(f"mAP50 {old_map:.4f} -> {cur_map:.4f}")
+    return problems
+
+
+def print_report(report: dict):
+    print(f"\n{'stage':>12} | {'mean ms':>8} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8}")
+    for name, s in report["stages"].items():
+        print(f"{name:>12} | {s['mean_ms']:>8.2f} | {s['p50_ms']:>8.2f} | {s['p95_ms']:>8.2f} | {s['p99_ms']:>8.2f}")
+    print(f"\n{'conc':>4} | {'images/s':>9} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8}")
+    for t in report["throughput"]:
+        print(f"{t['concurrency']:>4} | {t['images_per_s']:>9.1f} | {t['p50_ms']:>8.1f} | "
+              f"{t['p95_ms']:>8.1f} | {t['p99_ms']:>8.1f}")
+    acc = report["accuracy"]
+    if acc.get("labelled_images"):
+        print(f"\naccuracy on {acc['labelled_images']} labelled images: precision={acc['precision']} "
+              f"recall={acc['recall']} mAP50={acc['map50']}")
+    else:
+        print("\nno label files found; accuracy skipped")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("target", choices=["model", "service"])
+    ap.add_argument("--images", default="../test_images")
+    ap.add_argument("--limit", type=int, default=0, help="first N images of the sorted corpus (0 = all)")
+    ap.add_argument("--url", default="http://localhost:8002")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    ap.add_argument("--requests", type=int, default=200, help="per concurrency level")
+    ap.add_argument("--repeat", type=int, default=3, help="sequential passes for stage timings")
+    ap.add_argument("--warmup", type=int, default=5)
+    ap.add_argument("--out", default="", help="JSON path (default bench_results/<version>-<target>-<time>.json)")
+    ap.add_argument("--baseline", default="", help="earlier JSON report to compare against")
+    ap.add_argument("--max-slowdown", type=float, default=0.10)
+    ap.add_argument("--max-map-drop", type=float, default=0.01)
+    args = ap.parse_args()
+
+    corpus = load_corpus(args.images, args.limit)
+    print(f"{len(corpus)} images, {sum(1 for c in corpus if c['label_file'])} labelled")
+    run = bench_model if args.target == "model" else bench_service
+    report = {
+        "target": args.target,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "corpus": {"root": args.images, "images": len(corpus), "digest": corpus_digest(corpus)},
+        **run(args, corpus),
+    }
+    print_report(report)
+
+    out = Path(args.out or f"bench_results/{report['model'].get('version') or 'unknown'}"
+                          f"-{args.target}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"\nWrote {out}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline.get("corpus", {}).get("digest") != report["corpus"]["digest"]:
+            print("warning: baseline was measured on a different corpus")
+        problems = compare(report, baseline, args.max_slowdown, args.max_map_drop)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        if problems:
+            sys.exit(1)
+        print(f"No regressions vs {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from guardian_common import metrics
+
+try:
+    import redis
+except ImportError:  # the Redis tier is optional
+    redis = None
+
+
+# Side of the grey thumbnail kept with each entry to confirm perceptual hits. Re-encoded and
+# resized copies of the test photos stay within ~5 grey levels of each other at this size;
+# pasting a patch a tenth of the frame wide moves some pixel by 14 or more.
+THUMB_SIZE = 32
+
+# Counted through the shared metrics module, so /cache/stats covers every gunicorn worker
+# writing to METRICS_DIR, not just the one answering.
+LOOKUP_RESULTS = ("hits_lru", "hits_redis", "hits_perceptual", "perceptual_rejected", "misses")
+LOOKUPS = metrics.counter("cv_cache_lookups_total",
+                          "Result cache lookups by result (" + ", ".join(LOOKUP_RESULTS) + ")", ["result"])
+SAVED_SECONDS = metrics.counter("cv_cache_saved_seconds_total", "Model inference time avoided by cache hits")
+
+
+def fingerprint(tensor: np.ndarray):
+    """(64-bit difference hash, THUMB_SIZE^2 uint8 grey thumbnail) of a (1, 3, H, W) model input.
+
+    Computed after decode and resize, so re-encoded or re-sized copies of the
+    same photo usually hash identically. The hash only buckets: many different
+    shelves share one, so a hit is confirmed against the thumbnail.
+    """
+    gray = tensor[0].mean(axis=0)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    thumb = cv2.resize(gray, (THUMB_SIZE, THUMB_SIZE), interpolation=cv2.INTER_AREA) * 255
+    return f"{int(np.packbits(bits).view('>u8')[0]):016x}", np.rint(thumb).clip(0, 255).astype(np.uint8)
+
+
+def rescale_items(items: list, sx: float, sy: float) -> list:
+    out = []
+    for item in items:
+        boxes = [[b[0] * sx, b[1] * sy, b[2] * sx, b[3] * sy, b[4]] for b in item.get("boxes", [])]
+        out.append({**item, "boxes": [[round(v, 1) for v in b[:4]] + [b[4]] for b in boxes]})
+    return out
+
+
+class InferenceCache:
+    """Detection results keyed by image content, in front of the ONNX session.
+
+    Two tiers: an in-process LRU and (when redis_url is set) Redis with a TTL.
+    Keys are namespaced by `namespace` (model version + decode settings), so
+    changing the model invalidates everything without a flush. Lookups try
+    the sha256 of the raw bytes first; `lookup_perceptual` catches
+    re-encoded duplicates after decode, accepting a difference-hash match only
+    when no thumbnail pixel differs by more than `perceptual_max_delta` grey levels.
+    """
+
+    def __init__(self, namespace: str, lru_size: int = 1024, redis_url: str = "", ttl_seconds: int = 86400,
+                 perceptual_max_delta: int = 6):
+        self.namespace = namespace
+        self.perceptual_max_delta = perceptual_max_delta
+        self.lru_size = lru_size
+        self.ttl_seconds = ttl_seconds
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+        self.redis = redis.Redis.from_url(redis_url, decode_responses=True) if redis_url and redis else None
+
+    def exact_key(self, image_bytes: bytes) -> str:
+        return f"cvcache:{self.namespace}:sha:{hashlib.sha256(image_bytes).hexdigest()}"
+
+    def perceptual_key(self, tensor: np.ndarray):
+        """(key, thumbnail) for lookup_perceptual and put."""
+        digest, thumb = fingerprint(tensor)
+        return f"cvcache:{self.namespace}:dh:{digest}", thumb
+
+    def _get(self, key: str):
+        with self.lock:
+            entry = self.lru.get(key)
+            if entry is not None:
+                self.lru.move_to_end(key)
+                return entry, "hits_lru"
+        if self.redis is not None:
+            try:
+                raw = self.redis.get(key)
+            except redis.exceptions.RedisError:
+                raw = None
+            if raw:
+                entry = json.loads(raw)
+                self._remember(key, entry)
+                return entry, "hits_redis"
+        return None, None
+
+    def _remember(self, key: str, entry: dict):
+        with self.lock:
+            self.lru[key] = entry
+            self.lru.move_to_end(key)
+            while len(self.lru) > self.lru_size:
+                self.lru.popitem(last=False)
+
+    def _hit(self, result: str, entry: dict):
+        LOOKUPS.inc(result=result)
+        SAVED_SECONDS.inc(entry.get("infer_ms", 0.0) / 1000)
+
+    def lookup(self, key: str):
+        """Items for an exact-bytes key, or None."""
+        entry, tier = self._get(key)
+        if entry is None:
+            return None
+        self._hit(tier, entry)
+        return entry["items"]
+
+    def lookup_perceptual(self, key: str, thumb: np.ndarray, width: int, height: int):
+        """Items for a perceptual key whose stored thumbnail matches `thumb`, with boxes
+        rescaled to this image's size."""
+        entry, _ = self._get(key)
+        if entry is None:
+            return None
+        if not self._same_picture(entry.get("thumb"), thumb):
+            LOOKUPS.inc(result="perceptual_rejected")
+            return None
+        self._hit("hits_perceptual", entry)
+        sx, sy = width / entry["width"], height / entry["height"]
+        return entry["items"] if (sx, sy) == (1.0, 1.0) else rescale_items(entry["items"], sx, sy)
+
+    def _same_picture(self, stored, thumb: np.ndarray) -> bool:
+        if not stored:
+            return False  # written without a thumbnail
+        other = np.frombuffer(base64.b64decode(stored), dtype=np.uint8)
+        if other.size != thumb.size:
+            return False
+        return int(cv2.absdiff(other.reshape(thumb.shape), thumb).max()) <= self.perceptual_max_delta
+
+    def record_miss(self):
+        LOOKUPS.inc(result="misses")
+
+    def put(self, keys: list, items: list, width: int, height: int, infer_ms: float, thumb: np.ndarray = None):
+        entry = {"items": items, "width": width, "height": height, "infer_ms": round(infer_ms, 2)}
+        if thumb is not None:
+            entry["thumb"] = base64.b64encode(thumb.tobytes()).decode()
+        for key in keys:
+            self._remember(key, entry)
+        if self.redis is not None:
+            raw = json.dumps(entry)
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for key in keys:
+                    pipe.set(key, raw, ex=self.ttl_seconds)
+                pipe.execute()
+            except redis.exceptions.RedisError as e:
+                print(f"[cv-cache] Redis write failed: {e}")
+
+    def stats(self) -> dict:
+        """Lookup counts summed over METRICS_DIR (this process alone without it); lru_entries
+        is always this process's own LRU."""
+        counts = metrics.totals(LOOKUPS.name)
+        c = {result: int(counts.get((result,), 0)) for result in LOOKUP_RESULTS}
+        saved_ms = metrics.totals(SAVED_SECONDS.name).get((), 0.0) * 1000
+        with self.lock:
+            size = len(self.lru)
+        hits = c["hits_lru"] + c["hits_redis"] + c["hits_perceptual"]
+        lookups = hits + c["misses"]
+        return {
+            **c,
+            "saved_ms": round(saved_ms, 1),
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            "scope": "all workers" if metrics.METRICS_DIR else "process",
+            "lru_entries": size,
+            "pid": os.getpid(),
+            "redis": self.redis is not None,
+            "namespace": self.namespace,
+        }
@@ -0,0 +1,119 @@
+from typing import NamedTuple
+
+import numpy as np
+
+# Same order as the training data.yaml (model/download_open_images_food_script.py).
+CLASS_NAMES = [
+    "apple", "banana", "orange", "grape", "strawberry",
+    "tomato", "potato", "bell_pepper", "cucumber", "carrot",
+    "broccoli", "bread", "cake", "pastry", "croissant",
+    "doughnut", "muffin", "cookie",
+]
+
+
+class ImageMeta(NamedTuple):
+    """How an original image maps onto the model input: input = orig * scale + pad."""
+    width: int
+    height: int
+    scale_x: float
+    scale_y: float
+    pad_x: float = 0.0
+    pad_y: float = 0.0
+
+
+def xywh_to_xyxy(b: np.ndarray) -> np.ndarray:
+    out = np.empty_like(b)
+    half_w = b[:, 2] / 2
+    half_h = b[:, 3] / 2
+    out[:, 0] = b[:, 0] - half_w
+    out[:, 1] = b[:, 1] - half_h
+    out[:, 2] = b[:, 0] + half_w
+    out[:, 3] = b[:, 1] + half_h
+    return out
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float, max_det: int) -> np.ndarray:
+    """Greedy NMS over xyxy boxes; returns kept indices, best score first."""
+    order = np.argsort(-scores)
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.maximum(0, x2 - x1) * np.maximum(0, y2 - y1)
+    keep = []
+    while order.size and len(keep) < max_det:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.maximum(0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        h = np.maximum(0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def batched_nms(session, boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray,
+                num_classes: int, iou_threshold: float, max_det: int) -> np.ndarray:
+    """Class-aware NMS in one ORT NonMaxSuppression call; returns kept indices, best score first.
+
+    `session` runs runtime.nms_model(). Each box is scored only under its own class,
+    so boxes suppress boxes of the same class, as in the greedy loop above.
+    """
+    per_class = np.zeros((1, num_classes, scores.size), dtype=np.float32)
+    per_class[0, classes, np.arange(scores.size)] = scores
+    selected = session.run(None, {
+        "boxes": boxes[None].astype(np.float32, copy=False),
+        "scores": per_class,
+        "max_output_boxes_per_class": np.array([max_det], dtype=np.int64),
+        "iou_threshold": np.array([iou_threshold], dtype=np.float32),
+        "score_threshold": np.array([0.0], dtype=np.float32),  # skips the zero-padded classes
+    })[0][:, 2]
+    return selected[np.argsort(-scores[selected], kind="stable")][:max_det]
+
+
+def decode(output: np.ndarray, meta: ImageMeta, class_names: list,
+           conf_threshold: float, iou_threshold: float, max_det: int, nms_session=None) -> list:
+    """Turn one YOLOv8 head output (4 + nc, anchors) into grouped detections.
+
+    Anchors below conf_threshold are dropped before NMS. NMS is class-aware:
+    boxes only suppress boxes of the same class, in ORT (batched_nms) when
+    given nms_session and in the greedy loop otherwise. Boxes are mapped back
+    to original image pixels.
+    """
+    # Work on the (classes, anchors) layout as exported; it is contiguous per class.
+    cls_scores = output[4:]
+    conf = cls_scores.max(axis=0)
+    cand = np.flatnonzero(conf >= conf_threshold)
+    if not cand.size:
+        return []
+
+    conf = conf[cand]
+    cls_ids = cls_scores.take(cand, axis=1).argmax(axis=0)
+    boxes = xywh_to_xyxy(output[:4, cand].T)
+
+    if nms_session is not None:
+        keep = batched_nms(nms_session, boxes, conf, cls_ids, cls_scores.shape[0], iou_threshold, max_det)
+    else:
+        offsets = cls_ids[:, None] * (boxes.max() - boxes.min() + 1)
+        keep = nms(boxes + offsets, conf, iou_threshold, max_det)
+    boxes, conf, cls_ids = boxes[keep], conf[keep], cls_ids[keep]
+
+    xs, ys = boxes[:, 0::2], boxes[:, 1::2]  # views: x1, x2 and y1, y2
+    xs -= meta.pad_x
+    xs /= meta.scale_x
+    np.clip(xs, 0, meta.width, out=xs)
+    ys -= meta.pad_y
+    ys /= meta.scale_y
+    np.clip(ys, 0, meta.height, out=ys)
+
+    # Round in NumPy; the loop below only groups plain lists.
+    rows = np.concatenate([np.round(boxes.astype(np.float64), 1),
+                           np.round(conf.astype(np.float64), 4)[:, None]], axis=1).tolist()
+    items = {}
+    for row, cls_id in zip(rows, cls_ids.tolist()):
+        label = class_names[cls_id]
+        item = items.get(label)
+        if item is None:
+            # kept boxes come best first, so a class's first box has its top score
+            item = items[label] = {"label": label, "count": 0, "score": row[4], "boxes": []}
+        item["count"] += 1
+        item["boxes"].append(row)
+    return sorted(items.values(), key=lambda x: -x["score"])
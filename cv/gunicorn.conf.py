@@ -0,0 +1,47 @@
+"""Production server for the CV service:  gunicorn -c gunicorn.conf.py app:app
+
+The app module (imports, model bytes, caches) is loaded once in the master and
+shared copy-on-write by the forked workers. The ONNX Runtime session is not
+fork-safe, so each worker builds its own from the preloaded bytes in
+post_worker_init, then warms it up before accepting requests.
+
+Cores are split between workers: CV_WORKERS processes x ORT_INTRA_OP_THREADS
+threads each should not exceed the CPU count. Request threads per worker
+(CV_THREADS) only wait on the model; they let the micro-batcher fill batches.
+"""
+import os
+import shutil
+
+cores = os.cpu_count() or 1
+workers = int(os.environ.get("CV_WORKERS", "0")) or max(1, min(4, cores))
+intra_threads = int(os.environ.get("ORT_INTRA_OP_THREADS", "0")) or max(1, cores // workers)
+
+# Read by app.py at import time, which happens after this file runs.
+os.environ["ORT_INTRA_OP_THREADS"] = str(intra_threads)
+os.environ["CV_SESSION_POST_FORK"] = "1"
+
+bind = os.environ.get("CV_BIND", "0.0.0.0:8002")
+preload_app = True
+worker_class = "gthread"
+threads = int(os.environ.get("CV_THREADS", "4"))
+timeout = int(os.environ.get("CV_TIMEOUT", "60"))
+graceful_timeout = 30
+accesslog = os.environ.get("CV_ACCESS_LOG") or None
+
+
+def on_starting(server):
+    # Worker processes write their metrics here (guardian_common/metrics.py); start from an empty directory.
+    metrics_dir = os.environ.get("METRICS_DIR")
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+
+def when_ready(server):
+    server.log.info(f"[cv] {workers} workers x {intra_threads} ORT threads on {cores} cores")
+
+
+def post_worker_init(worker):
+    import app
+
+    app.load_model()
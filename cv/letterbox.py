@@ -0,0 +1,130 @@
+import queue
+import struct
+import threading
+
+import cv2
+import numpy as np
+
+from detect import ImageMeta
+
+PAD_VALUE = 114  # YOLOv8 letterbox grey
+INV_255 = np.float32(1.0 / 255.0)
+
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(data: bytes):
+    """(width, height) from a JPEG's SOF header without decoding, or None."""
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    n = len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if marker in _SOF_MARKERS:
+            h, w = struct.unpack(">HH", data[i + 5:i + 9])
+            return w, h
+        i += 2 + length
+    return None
+
+
+def decode(image_bytes: bytes, target: int):
+    """Decode to BGR, letting libjpeg downscale by 2/4/8 when the photo is much
+    larger than `target`. Returns (image, original_width, original_height)."""
+    size = jpeg_size(image_bytes)
+    flag = cv2.IMREAD_COLOR
+    if size is not None:
+        longest = max(size)
+        for factor, reduced in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if longest // factor >= target:
+                flag = reduced
+                break
+
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flag)
+    if img is None:
+        return None, 0, 0
+
+    h, w = img.shape[:2]
+    if size is None:
+        return img, w, h
+    w0, h0 = size
+    # imdecode applies EXIF rotation; the header still has the sensor orientation.
+    if (h > w) != (h0 > w0):
+        w0, h0 = h0, w0
+    return img, w0, h0
+
+
+class Letterboxer:
+    """Aspect-preserving resize to size x size, written straight into an NCHW float32 slot.
+
+    Each thread keeps one uint8 canvas; the only per-image allocation left is
+    the decoded image itself.
+    """
+
+    def __init__(self, size: int = 640):
+        self.size = size
+        self.local = threading.local()
+
+    def _canvas(self) -> np.ndarray:
+        canvas = getattr(self.local, "canvas", None)
+        if canvas is None:
+            canvas = self.local.canvas = np.empty((self.size, self.size, 3), dtype=np.uint8)
+        return canvas
+
+    def default_out(self) -> np.ndarray:
+        out = getattr(self.local, "tensor", None)
+        if out is None:
+            out = self.local.tensor = np.empty((1, 3, self.size, self.size), dtype=np.float32)
+        return out
+
+    def __call__(self, img: np.ndarray, orig_w: int, orig_h: int, out: np.ndarray) -> ImageMeta:
+        """Fill out (1, 3, size, size) from a BGR image; returns how to map boxes back."""
+        s = self.size
+        r = min(s / orig_w, s / orig_h)
+        nw, nh = max(1, round(orig_w * r)), max(1, round(orig_h * r))
+        left, top = (s - nw) // 2, (s - nh) // 2
+
+        canvas = self._canvas()
+        canvas[:top] = PAD_VALUE
+        canvas[top + nh:] = PAD_VALUE
+        canvas[top:top + nh, :left] = PAD_VALUE
+        canvas[top:top + nh, left + nw:] = PAD_VALUE
+        cv2.resize(img, (nw, nh), dst=canvas[top:top + nh, left:left + nw], interpolation=cv2.INTER_LINEAR)
+
+        # BGR -> RGB, HWC -> CHW and /255 in one strided pass per channel.
+        for c in range(3):
+            np.multiply(canvas[:, :, 2 - c], INV_255, out=out[0, c], casting="unsafe")
+
+        return ImageMeta(width=orig_w, height=orig_h, scale_x=nw / orig_w, scale_y=nh / orig_h,
+                         pad_x=float(left), pad_y=float(top))
+
+
+class BufferPool:
+    """Reusable (batch, 3, size, size) float32 buffers for batched requests."""
+
+    def __init__(self, batch: int, size: int = 640, keep: int = 2):
+        self.shape = (batch, 3, size, size)
+        self.free = queue.Queue(maxsize=keep)
+
+    def acquire(self) -> np.ndarray:
+        try:
+            return self.free.get_nowait()
+        except queue.Empty:
+            return np.empty(self.shape, dtype=np.float32)
+
+    def release(self, buf: np.ndarray):
+        try:
+            self.free.put_nowait(buf)
+        except queue.Full:
+            pass
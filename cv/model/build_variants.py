@@ -0,0 +1,202 @@
+"""Build the serving variants of best.onnx and report accuracy vs. latency.
+
+    best.onnx       FP32, as exported by export_onnx.py (the current model)
+    best.opt.onnx   FP32 with ORT's extended graph optimizations applied offline
+    best.int8.onnx  INT8 static QDQ quantization, calibrated on the val split
+
+The CV service picks one with MODEL_VARIANT=fp32|opt|int8. The report runs
+ultralytics val on each ONNX file (mAP50 against the YOLO val labels) and
+times ORT inference at each thread count, then writes variants_report.json
+next to the weights.
+
+    python build_variants.py                      # build + report
+    python build_variants.py --skip-build --threads 1 2 4
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from onnxruntime.quantization import CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPT_DIR.parent))  # the service's own preprocessing and session setup
+
+from letterbox import Letterboxer, decode  # noqa: E402
+from runtime import create_session, session_options, variant_path  # noqa: E402
+
+WEIGHTS_DIR = SCRIPT_DIR / "runs_guardian" / "produce_bakery_yolov8n" / "weights"
+BEST_ONNX = WEIGHTS_DIR / "best.onnx"
+DATA_YAML = SCRIPT_DIR / "data" / "openimages_produce_bakery_yolo" / "data.yaml"
+VAL_DIR = SCRIPT_DIR / "data" / "openimages_produce_bakery_yolo" / "val"
+REPORT = WEIGHTS_DIR / "variants_report.json"
+
+IMGSZ = 640
+CALIB_METHODS = {
+    "minmax": CalibrationMethod.MinMax,
+    "entropy": CalibrationMethod.Entropy,
+    "percentile": CalibrationMethod.Percentile,
+}
+
+
+def val_images(limit: int, seed: int = 0) -> list:
+    paths = sorted(p for p in VAL_DIR.rglob("*") if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    if not paths:
+        raise FileNotFoundError(f"No images under {VAL_DIR}\nRun download_open_images_food_script.py first.")
+    random.Random(seed).shuffle(paths)
+    return paths[:limit]
+
+
+def load_tensor(path: Path, letterbox: Letterboxer) -> np.ndarray:
+    """Exactly what the service feeds the model for this file."""
+    data = path.read_bytes()
+    img, w, h = decode(data, IMGSZ)
+    out = np.empty((1, 3, IMGSZ, IMGSZ), dtype=np.float32)
+    letterbox(img, w, h, out)
+    return out
+
+
+class ValCalibrationReader(CalibrationDataReader):
+    def __init__(self, input_name: str, paths: list):
+        self.input_name = input_name
+        self.paths = iter(paths)
+        self.letterbox = Letterboxer(IMGSZ)
+
+    def get_next(self):
+        path = next(self.paths, None)
+        if path is None:
+            return None
+        return {self.input_name: load_tensor(path, self.letterbox)}
+
+
+def head_postprocess_nodes(model_path: Path) -> list:
+    """Nodes of the YOLOv8 Detect head after its conv branches (DFL, concat, box decode).
+
+    These mix box coordinates in pixels with class probabilities in one
+    tensor; an 8-bit scale for both wipes out the scores, so they stay FP32.
+    """
+    import onnx
+
+    graph = onnx.load(str(model_path)).graph
+    heads = sorted({n.name.split("/")[1] for n in graph.node if n.name.startswith("/model.")},
+                   key=lambda s: int(s.split(".")[1]))
+    if not heads:
+        return []
+    head = f"/{heads[-1]}/"
+    return [n.name for n in graph.node
+            if n.name.startswith(head) and not n.name.startswith((head + "cv2", head + "cv3"))]
+
+
+def build_opt(src: Path, dst: Path):
+    opts = session_options(graph_opt="extended")
+    opts.optimized_model_filepath = str(dst)
+    create_session(str(src), opts)
+    print(f"Wrote {dst}")
+
+
+def build_int8(src: Path, dst: Path, calib_images: int, method: str, quantize_head: bool):
+    prepped = dst.with_suffix(".prep.onnx")
+    quant_pre_process(str(src), str(prepped))
+
+    input_name = create_session(str(prepped), session_options(graph_opt="disable")).get_inputs()[0].name
+    paths = val_images(calib_images)
+    print(f"Calibrating on {len(paths)} val images ({method})")
+    quantize_static(
+        str(prepped),
+        str(dst),
+        ValCalibrationReader(input_name, paths),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        calibrate_method=CALIB_METHODS[method],
+        nodes_to_exclude=[] if quantize_head else head_postprocess_nodes(prepped),
+    )
+    prepped.unlink(missing_ok=True)
+    print(f"Wrote {dst}")
+
+
+def evaluate_map50(path: Path, conf: float) -> float:
+    from ultralytics import YOLO
+
+    with tempfile.TemporaryDirectory() as tmp:  # ultralytics writes a run dir per val call
+        metrics = YOLO(str(path), task="detect").val(
+            data=str(DATA_YAML), imgsz=IMGSZ, batch=1, device="cpu", conf=conf,
+            plots=False, verbose=False, project=tmp,
+        )
+    return float(metrics.box.map50)
+
+
+def measure_latency(path: Path, threads: int, inputs: list, runs: int) -> dict:
+    sess = create_session(str(path), session_options(intra_threads=threads))
+    name = sess.get_inputs()[0].name
+    for x in inputs[:3]:
+        sess.run(None, {name: x})
+    samples = []
+    for i in range(runs):
+        x = inputs[i % len(inputs)]
+        t0 = time.perf_counter()
+        sess.run(None, {name: x})
+        samples.append((time.perf_counter() - t0) * 1000)
+    return {
+        "p50_ms": round(float(np.percentile(samples, 50)), 2),
+        "p95_ms": round(float(np.percentile(samples, 95)), 2),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--skip-build", action="store_true")
+    ap.add_argument("--skip-map", action="store_true", help="latency only (no ultralytics needed)")
+    ap.add_argument("--calib-images", type=int, default=300)
+    ap.add_argument("--calib-method", choices=sorted(CALIB_METHODS), default="minmax")
+    ap.add_argument("--quantize-head", action="store_true", help="also quantize the Detect head post-processing")
+    ap.add_argument("--threads", type=int, nargs="+", default=[0, 1, 2, 4], help="intra-op threads; 0 = all cores")
+    ap.add_argument("--runs", type=int, default=100)
+    ap.add_argument("--conf", type=float, default=0.001, help="val confidence floor (0.001 is the usual mAP setting)")
+    args = ap.parse_args()
+
+    if not BEST_ONNX.exists():
+        raise FileNotFoundError(f"Couldn't find {BEST_ONNX}\nRun export_onnx.py first.")
+
+    paths = {v: Path(variant_path(str(BEST_ONNX), v)) for v in ("fp32", "opt", "int8")}
+    if not args.skip_build:
+        build_opt(paths["fp32"], paths["opt"])
+        build_int8(paths["fp32"], paths["int8"], args.calib_images, args.calib_method, args.quantize_head)
+
+    letterbox = Letterboxer(IMGSZ)
+    inputs = [load_tensor(p, letterbox) for p in val_images(20, seed=1)]
+
+    report = []
+    for variant, path in paths.items():
+        if not path.exists():
+            print(f"Skipping {variant}: {path} not built")
+            continue
+        row = {"variant": variant, "file": path.name, "size_mb": round(path.stat().st_size / 1e6, 2)}
+        if not args.skip_map:
+            row["map50"] = round(evaluate_map50(path, args.conf), 4)
+        row["latency"] = {str(t): measure_latency(path, t, inputs, args.runs) for t in args.threads}
+        report.append(row)
+        print(json.dumps(row))
+
+    base = report[0] if report and report[0]["variant"] == "fp32" else None
+    print(f"\n{'variant':>7} | {'MB':>6} | {'mAP50':>6} | {'dmAP50':>7} | "
+          + " | ".join(f"{'p50 ms @' + (str(t) if t else 'all'):>10}" for t in args.threads))
+    for row in report:
+        m = row.get("map50")
+        dm = m - base["map50"] if base and m is not None and "map50" in base else None
+        lat = " | ".join(f"{row['latency'][str(t)]['p50_ms']:>10.2f}" for t in args.threads)
+        print(f"{row['variant']:>7} | {row['size_mb']:>6.2f} | "
+              f"{'-' if m is None else f'{m:.4f}':>6} | {'-' if dm is None else f'{dm:+.4f}':>7} | {lat}")
+
+    REPORT.write_text(json.dumps({"conf": args.conf, "calib_method": args.calib_method, "variants": report}, indent=2))
+    print(f"\nReport: {REPORT}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+from pathlib import Path
+import onnx
+from ultralytics import YOLO
+
+# Paths
+SCRIPT_DIR = Path(__file__).resolve().parent
+WEIGHTS_DIR = SCRIPT_DIR / "runs_guardian" / "produce_bakery_yolov8n" / "weights"
+BEST_PT = WEIGHTS_DIR / "best.pt"
+
+# Export parameters
+IMGSZ = 640
+OPSET = 12
+
+
+def main():
+    if not BEST_PT.exists():
+        raise FileNotFoundError(f"Couldn't find {BEST_PT}\nRun train_yolo.py first.")
+
+    model = YOLO(str(BEST_PT))
+    # dynamic=True gives the input a symbolic batch axis, which the CV service's
+    # /infer/batch endpoint and micro-batcher need. Spatial axes stay dynamic too,
+    # but the service always feeds IMGSZ x IMGSZ.
+    out = model.export(format="onnx", imgsz=IMGSZ, dynamic=True, opset=OPSET, simplify=True)
+
+    graph = onnx.load(out).graph
+    dims = [d.dim_param or d.dim_value for d in graph.input[0].type.tensor_type.shape.dim]
+    print("Exported:", out)
+    print("Input shape:", dims)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import os
+
+import onnxruntime as ort
+
+# Files written by model/build_variants.py next to the base export.
+VARIANTS = {
+    "fp32": "{stem}.onnx",
+    "opt": "{stem}.opt.onnx",     # ORT graph optimizations applied offline (fusions, constant folding)
+    "int8": "{stem}.int8.onnx",   # static QDQ quantization calibrated on the val split
+}
+
+GRAPH_OPT_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def variant_path(model_path: str, variant: str) -> str:
+    """Path of `variant` for a base model path like .../best.onnx."""
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown MODEL_VARIANT {variant!r}; expected one of {sorted(VARIANTS)}")
+    folder, name = os.path.split(model_path)
+    stem = name[:-len(".onnx")] if name.endswith(".onnx") else name
+    return os.path.join(folder, VARIANTS[variant].format(stem=stem))
+
+
+def session_options(intra_threads: int = 0, inter_threads: int = 0,
+                    graph_opt: str = "all", parallel: bool = False) -> ort.SessionOptions:
+    """SessionOptions from plain settings; 0 threads means ORT's default (one per core)."""
+    if graph_opt not in GRAPH_OPT_LEVELS:
+        raise ValueError(f"Unknown graph optimization level {graph_opt!r}; expected one of {sorted(GRAPH_OPT_LEVELS)}")
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = intra_threads
+    opts.inter_op_num_threads = inter_threads
+    opts.graph_optimization_level = GRAPH_OPT_LEVELS[graph_opt]
+    opts.execution_mode = ort.ExecutionMode.ORT_PARALLEL if parallel else ort.ExecutionMode.ORT_SEQUENTIAL
+    return opts
+
+
+def options_from_env() -> ort.SessionOptions:
+    return session_options(
+        intra_threads=int(os.environ.get("ORT_INTRA_OP_THREADS", "0")),
+        inter_threads=int(os.environ.get("ORT_INTER_OP_THREADS", "0")),
+        graph_opt=os.environ.get("ORT_GRAPH_OPT", "all"),
+        parallel=os.environ.get("ORT_PARALLEL", "0") == "1",
+    )
+
+
+def create_session(model, opts: ort.SessionOptions = None) -> ort.InferenceSession:
+    """InferenceSession on CPU from a path or the serialized model bytes."""
+    return ort.InferenceSession(model, sess_options=opts or options_from_env(),
+                                providers=["CPUExecutionProvider"])
+
+
+def nms_model() -> bytes:
+    """A graph holding just ONNX NonMaxSuppression, for detect.batched_nms.
+
+    Inputs: boxes (1, N, 4) corners, scores (1, classes, N), max_output_boxes_per_class,
+    iou_threshold, score_threshold; output: selected (K, 3) [batch, class, box].
+    ONNX documents corners as y1, x1, y2, x2; IoU is the same with x and y swapped,
+    so x1, y1, x2, y2 boxes work unchanged.
+    """
+    from onnx import TensorProto, helper
+
+    inputs = [
+        helper.make_tensor_value_info("boxes", TensorProto.FLOAT, [1, "n", 4]),
+        helper.make_tensor_value_info("scores", TensorProto.FLOAT, [1, "classes", "n"]),
+        helper.make_tensor_value_info("max_output_boxes_per_class", TensorProto.INT64, [1]),
+        helper.make_tensor_value_info("iou_threshold", TensorProto.FLOAT, [1]),
+        helper.make_tensor_value_info("score_threshold", TensorProto.FLOAT, [1]),
+    ]
+    node = helper.make_node("NonMaxSuppression", [i.name for i in inputs], ["selected"])
+    graph = helper.make_graph([node], "class_aware_nms", inputs,
+                              [helper.make_tensor_value_info("selected", TensorProto.INT64, ["k", 3])])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model.ir_version = 8  # what opset 17 shipped with; older ORT builds refuse newer IR versions
+    return model.SerializeToString()
+
+
+def create_nms_session() -> ort.InferenceSession:
+    """Session for nms_model(); one thread, since each call is a few hundred boxes."""
+    return create_session(nms_model(), session_options(intra_threads=1, inter_threads=1))
@@ -0,0 +1,79 @@
+"""Consumer-group throughput with 1..8 worker processes against a local Redis.
+
+Each process runs worker.consume with a simulated per-event cost standing in
+for matching and Mongo writes, so the numbers isolate the stream mechanics
+(adaptive reads, batched acks, group fan-out).
+
+    REDIS_URL=redis://localhost:6379/0 python bench_consumers.py --events 20000 --work-ms 1
+"""
+import argparse
+import multiprocessing as mp
+import os
+import threading
+import time
+
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+os.environ.setdefault("EVENT_STREAM", "bench:events:surplus")
+os.environ.setdefault("EVENT_GROUP", "bench-group")
+os.environ.setdefault("USER_SNAPSHOT", "0")
+os.environ.setdefault("CLAIM_INTERVAL_SECONDS", "3600")
+os.environ.setdefault("BLOCK_MS", "200")
+
+import worker  # noqa: E402
+
+
+def simulated_handler(work_ms: float):
+    def handler(messages):
+        time.sleep(work_ms * len(messages) / 1000)
+    return handler
+
+
+def run_consumer(name: str, work_ms: float):
+    worker.consume(name, threading.Event(), simulated_handler(work_ms))
+
+
+def seed(n: int):
+    r = worker.r
+    r.delete(worker.STREAM_KEY)
+    worker.ensure_group()
+    pipe = r.pipeline(transaction=False)
+    for i in range(n):
+        pipe.xadd(worker.STREAM_KEY, {"store_id": f"store_{i % 50}", "items": '["bread"]', "timestamp": i})
+        if i % 1000 == 999:
+            pipe.execute()
+    pipe.execute()
+
+
+def drained() -> bool:
+    for g in worker.r.xinfo_groups(worker.STREAM_KEY):
+        if g["name"] == worker.GROUP:
+            return g["pending"] == 0 and (g.get("lag") or 0) == 0
+    return False
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=20000)
+    ap.add_argument("--consumers", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--work-ms", type=float, default=1.0, help="simulated cost per event")
+    args = ap.parse_args()
+
+    print(f"{'consumers':>9} | {'events/s':>9} | {'seconds':>7}")
+    for k in args.consumers:
+        seed(args.events)
+        procs = [mp.Process(target=run_consumer, args=(f"bench-{k}-{i}", args.work_ms), daemon=True) for i in range(k)]
+        t0 = time.perf_counter()
+        for p in procs:
+            p.start()
+        while not drained():
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - t0
+        for p in procs:
+            p.terminate()
+        print(f"{k:>9} | {args.events / elapsed:>9.0f} | {elapsed:>7.2f}")
+
+    worker.r.delete(worker.STREAM_KEY)
+
+
+if __name__ == "__main__":
+    main()
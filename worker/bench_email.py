@@ -0,0 +1,71 @@
+"""SMTP throughput: connection-per-email vs. pooled persistent senders.
+
+Starts a local aiosmtpd sink (no TLS, no auth) and pushes messages through
+SmtpConnection the way the old inline path and email_sender.py do.
+
+    pip install aiosmtpd
+    python bench_email.py --messages 500 --senders 1 4 8
+"""
+import argparse
+import threading
+import time
+
+from aiosmtpd.controller import Controller
+
+from email_client import SmtpConnection, build_match_message
+
+
+class CountingSink:
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    async def handle_DATA(self, server, session, envelope):
+        with self.lock:
+            self.count += 1
+        return "250 OK"
+
+
+def run(host, port, messages: int, senders: int, pooled: bool) -> float:
+    per_sender = messages // senders
+
+    def work():
+        conn = SmtpConnection(host=host, port=port, starttls=False, username="", password="")
+        for i in range(per_sender):
+            conn.send(build_match_message(f"user{i}@bench.local", "Bench Market", "bread", 1.2))
+            if not pooled:
+                conn.close()
+        conn.close()
+
+    threads = [threading.Thread(target=work) for _ in range(senders)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return per_sender * senders / (time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=500)
+    ap.add_argument("--senders", type=int, nargs="+", default=[1, 4, 8])
+    ap.add_argument("--port", type=int, default=8025)
+    args = ap.parse_args()
+
+    sink = CountingSink()
+    controller = Controller(sink, hostname="127.0.0.1", port=args.port)
+    controller.start()
+    try:
+        print(f"{'senders':>7} | {'per-email conn msg/s':>20} | {'pooled msg/s':>12}")
+        for n in args.senders:
+            single = run("127.0.0.1", args.port, args.messages, n, pooled=False)
+            pooled = run("127.0.0.1", args.port, args.messages, n, pooled=True)
+            print(f"{n:>7} | {single:>20.0f} | {pooled:>12.0f}")
+    finally:
+        controller.stop()
+    print(f"sink received {sink.count} messages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Per-event matching latency: full users scan vs. the 2dsphere candidate query.
+
+Seeds a scratch database with N synthetic users spread over the continental US,
+then times the user-selection + radius/filter step of `process` for random stores.
+
+    MONGO_URI=mongodb://localhost:27017 python bench_geo.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+from pymongo import MongoClient
+
+import worker
+
+BENCH_DB = os.getenv("BENCH_DB", "guardian_bench")
+ITEMS = ["apple", "bread", "cake", "banana", "tomato", "cookie"]
+
+LAT_RANGE = (25.0, 49.0)
+LNG_RANGE = (-124.0, -67.0)
+
+
+def seed_users(db, n: int, batch: int = 10000):
+    db["users"].drop()
+    rnd = random.Random(n)
+    for start in range(0, n, batch):
+        docs = []
+        for i in range(start, min(n, start + batch)):
+            lat = rnd.uniform(*LAT_RANGE)
+            lng = rnd.uniform(*LNG_RANGE)
+            docs.append({
+                "email": f"user{i}@bench.local",
+                "notify": True,
+                "location": {"lat": lat, "lng": lng},
+                "geo": {"type": "Point", "coordinates": [lng, lat]},
+                "radius_km": rnd.choice([1, 2, 5, 10, 25]),
+                "item_filters": rnd.sample(ITEMS, rnd.randint(0, 3)),
+            })
+        db["users"].insert_many(docs, ordered=False)
+    db["users"].create_index([("notify", 1), ("geo", "2dsphere")], name="notify_geo")
+
+
+def scan_all_users(db, s_lat, s_lng, items):
+    """The pre-index matching loop: every notify user, one haversine at a time."""
+    out = []
+    for user in db["users"].find({"notify": True, "location": {"$ne": None}}):
+        loc = user.get("location") or {}
+        try:
+            u_lat = float(loc["lat"])
+            u_lng = float(loc["lng"])
+        except Exception:
+            continue
+        radius_km = float(user.get("radius_km", 5) or 5)
+        dist = worker.haversine_km(u_lat, u_lng, s_lat, s_lng)
+        if dist > radius_km:
+            continue
+        filters = [str(x).strip().lower() for x in user.get("item_filters", []) or [] if str(x).strip()]
+        for item in items:
+            if filters and item not in filters:
+                continue
+            out.append((user, item, dist))
+    return out
+
+
+def timed(fn, stores, repeat):
+    samples = []
+    for s_lat, s_lng in stores[:repeat]:
+        t0 = time.perf_counter()
+        fn(s_lat, s_lng)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    ap.add_argument("--events", type=int, default=50)
+    ap.add_argument("--scan-events", type=int, default=5, help="full scans are slow; use fewer samples")
+    args = ap.parse_args()
+
+    db = MongoClient(worker.MONGO_URI)[BENCH_DB]
+    worker.db = db
+    worker.snapshot = None  # measure the per-event Mongo path
+
+    rnd = random.Random(0)
+    stores = [(rnd.uniform(*LAT_RANGE), rnd.uniform(*LNG_RANGE)) for _ in range(args.events)]
+    items = ["bread", "cake"]
+
+    print(f"{'users':>9} | {'scan p50 ms':>11} {'scan p95 ms':>11} | {'geo p50 ms':>10} {'geo p95 ms':>10}")
+    for n in args.sizes:
+        seed_users(db, n)
+        scan = timed(lambda la, ln: scan_all_users(db, la, ln, items), stores, args.scan_events)
+        geo = timed(lambda la, ln: list(worker.match_users(la, ln, items)), stores, args.events)
+        print(f"{n:>9} | {scan[0]:>11.1f} {scan[1]:>11.1f} | {geo[0]:>10.1f} {geo[1]:>10.1f}")
+
+    db.client.drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Micro-benchmark: scalar haversine loop vs. the vectorized UserMatcher.
+
+Runs entirely in memory (no Redis/MongoDB needed).
+
+    python bench_matcher.py --users 10000 100000 1000000 --items 3
+"""
+import argparse
+import random
+import statistics
+import time
+
+from matcher import CLASS_NAMES, UserMatcher, normalize_items
+from worker import haversine_km
+
+
+def make_users(n: int, rnd: random.Random) -> list:
+    users = []
+    for i in range(n):
+        users.append({
+            "_id": f"u{i}",
+            "email": f"user{i}@bench.local",
+            "location": {"lat": rnd.uniform(37.0, 38.5), "lng": rnd.uniform(-123.0, -121.5)},
+            "radius_km": rnd.choice([1, 2, 5, 10, 25]),
+            "item_filters": rnd.sample(CLASS_NAMES, rnd.randint(0, 4)),
+        })
+    return users
+
+
+def scalar_match(users, s_lat, s_lng, items):
+    """The per-user loop the worker used before UserMatcher."""
+    out = []
+    for user in users:
+        loc = user.get("location") or {}
+        u_lat = float(loc["lat"])
+        u_lng = float(loc["lng"])
+        radius_km = float(user.get("radius_km", 5) or 5)
+        dist = haversine_km(u_lat, u_lng, s_lat, s_lng)
+        if dist > radius_km:
+            continue
+        filters = normalize_items(user.get("item_filters"))
+        for item in items:
+            if filters and item not in filters:
+                continue
+            out.append((str(user["_id"]), item, dist))
+    return out
+
+
+def bench(fn, stores):
+    samples = []
+    for s_lat, s_lng in stores:
+        t0 = time.perf_counter()
+        fn(s_lat, s_lng)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, nargs="+", default=[10000, 100000, 1000000])
+    ap.add_argument("--items", type=int, default=3, help="items per event")
+    ap.add_argument("--events", type=int, default=20)
+    args = ap.parse_args()
+
+    rnd = random.Random(0)
+    items = rnd.sample(CLASS_NAMES, args.items)
+    stores = [(rnd.uniform(37.0, 38.5), rnd.uniform(-123.0, -121.5)) for _ in range(args.events)]
+
+    print(f"{'users':>9} | {'build ms':>9} | {'scalar ms':>10} | {'vector ms':>10} | {'speedup':>8}")
+    for n in args.users:
+        users = make_users(n, rnd)
+        t0 = time.perf_counter()
+        matcher = UserMatcher(users)
+        build_ms = (time.perf_counter() - t0) * 1000
+
+        s_lat, s_lng = stores[0]
+        expected = {(u, i) for u, i, _ in scalar_match(users, s_lat, s_lng, items)}
+        got = {(matcher.user_ids[row], i) for row, i, _ in matcher.match(s_lat, s_lng, items)}
+        assert expected == got, "vectorized matcher disagrees with the scalar loop"
+
+        scalar = bench(lambda la, ln: scalar_match(users, la, ln, items), stores[:5])
+        vector = bench(lambda la, ln: matcher.match(la, ln, items), stores)
+        print(f"{n:>9} | {build_ms:>9.1f} | {scalar:>10.2f} | {vector:>10.2f} | {scalar / vector:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,61 +5,161 @@ from email.mime.multipart import MIMEMultipart
 
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
 SENDER_EMAIL = os.getenv("SENDER_EMAIL", "")
 SENDER_PASSWORD = os.getenv("SENDER_PASSWORD", "")
 SENDER_NAME = os.getenv("SENDER_NAME", "Guardian")
 
-def send_match_notification(
-    recipient_email: str,
-    store_name: str,
-    item: str,
-    distance_km: float
-) -> bool:
-    """Send email when surplus food matches user preferences"""
-    if not SENDER_EMAIL or not SENDER_PASSWORD:
-        print(f"[worker-email] SMTP not configured, skipping email to {recipient_email}")
-        return False
-    
-    try:
-        subject = f"🎉 {store_name} has {item}!"
-        
-        html_body = f"""
+
+def smtp_configured() -> bool:
+    return bool(SENDER_EMAIL and SENDER_PASSWORD)
+
+
+class SmtpConnection:
+    """A reusable, authenticated SMTP session.
+
+    Connects lazily, keeps the session open between messages and reconnects
+    once if the server dropped it while idle.
+    """
+
+    def __init__(self, host=None, port=None, starttls=None, username=None, password=None, timeout=30):
+        self.host = host or SMTP_SERVER
+        self.port = port or SMTP_PORT
+        self.starttls = SMTP_STARTTLS if starttls is None else starttls
+        self.username = SENDER_EMAIL if username is None else username
+        self.password = SENDER_PASSWORD if password is None else password
+        self.timeout = timeout
+        self.server = None
+
+    def connect(self):
+        self.close()
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            server.starttls()
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        self.server = server
+
+    def send(self, msg):
+        if self.server is None:
+            self.connect()
+        try:
+            self.server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self.connect()
+            self.server.send_message(msg)
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+
+def build_match_message(recipient_email: str, store_name: str, item: str, distance_km: float) -> MIMEMultipart:
+    subject = f"🎉 {store_name} has {item}!"
+
+    html_body = f"""
         <html>
             <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
                 <h2 style="color: #2ecc71;">Surplus food alert!</h2>
-                
+
                 <div style="background-color: #f5f5f5; padding: 20px; border-radius: 8px; margin: 20px 0;">
                     <p><strong>Store:</strong> {store_name}</p>
                     <p><strong>Item:</strong> <span style="font-size: 1.2em; color: #e74c3c;">{item.title()}</span></p>
                     <p><strong>Distance:</strong> {distance_km:.1f} km away</p>
                 </div>
-                
+
                 <p>This item matches your preferences and is within your search radius!</p>
-                
+
                 <p style="color: #7f8c8d; font-size: 0.9em; margin-top: 30px;">
                     Guardian • Surplus Food Network
                 </p>
             </body>
         </html>
         """
-        
-        msg = MIMEMultipart("alternative")
-        msg["Subject"] = subject
-        msg["From"] = f"{SENDER_NAME} <{SENDER_EMAIL}>"
-        msg["To"] = recipient_email
-        
-        text_body = f"Surplus food alert!\n\nStore: {store_name}\nItem: {item}\nDistance: {distance_km:.1f} km away"
-        msg.attach(MIMEText(text_body, "plain"))
-        msg.attach(MIMEText(html_body, "html"))
-        
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.send_message(msg)
-        
+
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = subject
+    msg["From"] = f"{SENDER_NAME} <{SENDER_EMAIL}>"
+    msg["To"] = recipient_email
+
+    text_body = f"Surplus food alert!\n\nStore: {store_name}\nItem: {item}\nDistance: {distance_km:.1f} km away"
+    msg.attach(MIMEText(text_body, "plain"))
+    msg.attach(MIMEText(html_body, "html"))
+    return msg
+
+
+def build_digest_message(recipient_email: str, matches: list) -> MIMEMultipart:
+    """One email listing several matches: dicts with store_name, item and distance_km."""
+    if len(matches) == 1:
+        m = matches[0]
+        return build_match_message(recipient_email, m["store_name"], m["item"], float(m["distance_km"]))
+
+    stores = sorted({m["store_name"] for m in matches})
+    subject = f"🎉 {len(matches)} surplus matches near you"
+    if len(stores) == 1:
+        subject = f"🎉 {stores[0]} has {len(matches)} items you like!"
+
+    rows = "".join(
+        f"<tr><td style=\"padding: 6px 12px;\">{m['store_name']}</td>"
+        f"<td style=\"padding: 6px 12px;\">{m['item'].title()}</td>"
+        f"<td style=\"padding: 6px 12px;\">{float(m['distance_km']):.1f} km</td></tr>"
+        for m in matches
+    )
+    html_body = f"""
+        <html>
+            <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+                <h2 style="color: #2ecc71;">Surplus food alert!</h2>
+
+                <table style="background-color: #f5f5f5; border-radius: 8px; margin: 20px 0; width: 100%;">
+                    <tr><th align="left" style="padding: 6px 12px;">Store</th>
+                        <th align="left" style="padding: 6px 12px;">Item</th>
+                        <th align="left" style="padding: 6px 12px;">Distance</th></tr>
+                    {rows}
+                </table>
+
+                <p>These items match your preferences and are within your search radius!</p>
+
+                <p style="color: #7f8c8d; font-size: 0.9em; margin-top: 30px;">
+                    Guardian • Surplus Food Network
+                </p>
+            </body>
+        </html>
+        """
+
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = subject
+    msg["From"] = f"{SENDER_NAME} <{SENDER_EMAIL}>"
+    msg["To"] = recipient_email
+
+    lines = "\n".join(f"- {m['store_name']}: {m['item']} ({float(m['distance_km']):.1f} km away)" for m in matches)
+    msg.attach(MIMEText(f"Surplus food alert!\n\n{lines}", "plain"))
+    msg.attach(MIMEText(html_body, "html"))
+    return msg
+
+
+def send_match_notification(
+    recipient_email: str,
+    store_name: str,
+    item: str,
+    distance_km: float
+) -> bool:
+    """Send email when surplus food matches user preferences"""
+    if not smtp_configured():
+        print(f"[worker-email] SMTP not configured, skipping email to {recipient_email}")
+        return False
+
+    conn = SmtpConnection()
+    try:
+        conn.send(build_match_message(recipient_email, store_name, item, distance_km))
         print(f"[worker-email] Email sent to {recipient_email}: {item} from {store_name}")
         return True
-    
+
     except Exception as e:
         print(f"[worker-email] Failed to send to {recipient_email}: {str(e)}")
         return False
+    finally:
+        conn.close()
@@ -0,0 +1,366 @@
+"""Email delivery stage.
+
+The worker appends one entry per notification to EMAIL_STREAM; this process
+drains it with a pool of sender threads. Each sender is its own consumer in
+EMAIL_GROUP and keeps one authenticated SMTP session open, so matching never
+waits on SMTP and a slow provider only stalls the senders talking to it.
+"""
+import json
+import os
+import random
+import smtplib
+import socket
+import threading
+import time
+
+import redis
+from bson import ObjectId
+from pymongo import MongoClient
+
+from guardian_common import metrics
+from guardian_common.queries import by_ids
+from email_client import SmtpConnection, build_digest_message, build_match_message, smtp_configured
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://db:27017")
+MONGO_DB = os.getenv("MONGO_DB", "guardian")
+
+EMAIL_STREAM = os.getenv("EMAIL_STREAM", "notify:email")
+EMAIL_DEAD_STREAM = os.getenv("EMAIL_DEAD_STREAM", "notify:email:dead")
+EMAIL_GROUP = os.getenv("EMAIL_GROUP", "email-group")
+
+EMAIL_SENDERS = int(os.getenv("EMAIL_SENDERS", "4"))
+EMAIL_BATCH = int(os.getenv("EMAIL_BATCH", "20"))
+BLOCK_MS = int(os.getenv("BLOCK_MS", "5000"))
+
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+EMAIL_BACKOFF_SECONDS = float(os.getenv("EMAIL_BACKOFF_SECONDS", "1"))
+EMAIL_BACKOFF_MAX_SECONDS = float(os.getenv("EMAIL_BACKOFF_MAX_SECONDS", "60"))
+
+# Pending emails idle this long belong to a sender that died (consumer names include the
+# pid, so nobody would read them again) and are reclaimed. Keep it above the time one
+# batch can take with retries and rate limiting, or live senders' emails get claimed too.
+EMAIL_CLAIM_IDLE_MS = int(os.getenv("EMAIL_CLAIM_IDLE_MS", "900000"))
+EMAIL_CLAIM_INTERVAL_SECONDS = int(os.getenv("EMAIL_CLAIM_INTERVAL_SECONDS", "60"))
+# Deliveries of one entry (crashes mid-send, not SMTP retries) before it is dead-lettered.
+EMAIL_MAX_DELIVERIES = int(os.getenv("EMAIL_MAX_DELIVERIES", "3"))
+
+# Messages per second per recipient domain, e.g. "gmail.com=5,outlook.com=3".
+EMAIL_RATE_DEFAULT = float(os.getenv("EMAIL_RATE_DEFAULT", "10"))
+EMAIL_RATE_LIMITS = {
+    domain.strip().lower(): float(rate)
+    for domain, _, rate in (x.partition("=") for x in os.getenv("EMAIL_RATE_LIMITS", "").split(",") if "=" in x)
+}
+
+# "immediate" sends one email per match; "digest" coalesces a user's matches for
+# DIGEST_WINDOW_SECONDS (counted from their first buffered match) into one email.
+EMAIL_MODE = os.getenv("EMAIL_MODE", "immediate")
+DIGEST_WINDOW_SECONDS = int(os.getenv("DIGEST_WINDOW_SECONDS", "300"))
+DIGEST_BUFFER_PREFIX = "digest:buf:"
+DIGEST_SENDING_PREFIX = "digest:sending:"
+DIGEST_DUE_KEY = "digest:due"
+# A claimed digest stays in DIGEST_DUE_KEY, due again this far ahead, until it has been sent;
+# if the mailer dies mid-send the lease runs out and the next flush sends it. Keep it above
+# one send with all its retries and rate limiting.
+DIGEST_LEASE_SECONDS = int(os.getenv("DIGEST_LEASE_SECONDS", "600"))
+EMAIL_METRICS_KEY = "metrics:email"
+# GET /metrics and /debug/profile (guardian_common/metrics.py); 0 = off.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9101"))
+
+SEND_SECONDS = metrics.histogram("mailer_send_seconds", "SMTP send time per attempt, by outcome", ["outcome"])
+EMAILS = metrics.counter("mailer_emails_total", "Emails by final outcome (sent, rejected, dead)", ["outcome"])
+THROTTLE_SECONDS = metrics.histogram("mailer_throttle_seconds", "Time waiting on the per-domain rate limit")
+DIGEST_MATCHES = metrics.histogram("mailer_digest_matches", "Matches per digest email", buckets=metrics.COUNT_BUCKETS)
+
+r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+# KEYS: due zset, buffer, sending list; ARGV: user, now, lease end. Claims a due digest by
+# pushing its due time to the lease end, then moves the buffer onto the sending list (which
+# still holds the matches of a send that never finished) and returns the sending list.
+claim_digest = r.register_script("""
+local due = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not due or tonumber(due) > tonumber(ARGV[2]) then return false end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+while redis.call('RPOPLPUSH', KEYS[2], KEYS[3]) do end
+return redis.call('LRANGE', KEYS[3], 0, -1)
+""")
+# KEYS: due zset, buffer, sending list; ARGV: user, next due time. Drops the sent matches;
+# matches buffered during the send start a new window, otherwise the user leaves the zset.
+finish_digest = r.register_script("""
+redis.call('DEL', KEYS[3])
+if redis.call('EXISTS', KEYS[2]) == 1 then
+  redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+else
+  redis.call('ZREM', KEYS[1], ARGV[1])
+end
+""")
+db = MongoClient(MONGO_URI, event_listeners=[metrics.mongo_listener(
+    metrics.histogram("mailer_mongo_seconds", "Mongo command round-trip", ["command", "collection"]))])[MONGO_DB]
+
+
+class ProviderRateLimiter:
+    """Token bucket per recipient domain, shared by all sender threads."""
+
+    def __init__(self, default_rate: float, rates: dict):
+        self.default_rate = default_rate
+        self.rates = rates
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, recipient: str):
+        domain = recipient.rpartition("@")[2].lower()
+        rate = self.rates.get(domain, self.default_rate)
+        if rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                tokens, last = self.buckets.get(domain, (rate, now))
+                tokens = min(rate, tokens + (now - last) * rate)
+                if tokens >= 1:
+                    self.buckets[domain] = (tokens - 1, now)
+                    return
+                self.buckets[domain] = (tokens, now)
+                wait = (1 - tokens) / rate
+            time.sleep(wait)
+
+
+limiter = ProviderRateLimiter(EMAIL_RATE_DEFAULT, EMAIL_RATE_LIMITS)
+
+
+def ensure_group():
+    try:
+        r.xgroup_create(EMAIL_STREAM, EMAIL_GROUP, id="0", mkstream=True)
+        print(f"[email-sender] Created group={EMAIL_GROUP} stream={EMAIL_STREAM}")
+    except redis.exceptions.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def backoff_seconds(attempt: int) -> float:
+    delay = min(EMAIL_BACKOFF_MAX_SECONDS, EMAIL_BACKOFF_SECONDS * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def deliver(conn: SmtpConnection, recipient: str, msg) -> bool:
+    """Send one message, retrying transient failures with backoff.
+
+    Returns False when the message was given up on; the caller dead-letters it.
+    """
+    for attempt in range(EMAIL_MAX_ATTEMPTS):
+        with THROTTLE_SECONDS.time():
+            limiter.acquire(recipient)
+        started = time.perf_counter()
+        try:
+            conn.send(msg)
+            SEND_SECONDS.observe(time.perf_counter() - started, outcome="sent")
+            EMAILS.inc(outcome="sent")
+            return True
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused) as e:
+            SEND_SECONDS.observe(time.perf_counter() - started, outcome="rejected")
+            EMAILS.inc(outcome="rejected")
+            print(f"[email-sender] Rejected {recipient}: {e}")
+            return False
+        except (smtplib.SMTPException, OSError) as e:
+            SEND_SECONDS.observe(time.perf_counter() - started, outcome="error")
+            conn.close()
+            delay = backoff_seconds(attempt)
+            print(f"[email-sender] Send to {recipient} failed (attempt {attempt + 1}): {e}; retry in {delay:.1f}s")
+            time.sleep(delay)
+    EMAILS.inc(outcome="dead")
+    return False
+
+
+def send_immediate(conn: SmtpConnection, fields: dict) -> bool:
+    recipient = fields.get("recipient", "")
+    msg = build_match_message(
+        recipient_email=recipient,
+        store_name=fields.get("store_name", "Unknown Store"),
+        item=fields.get("item", ""),
+        distance_km=float(fields.get("distance_km") or 0),
+    )
+    ok = deliver(conn, recipient, msg)
+    if ok:
+        r.hincrby(EMAIL_METRICS_KEY, "emails_sent", 1)
+        r.hincrby(EMAIL_METRICS_KEY, "matches_emailed", 1)
+    return ok
+
+
+def buffer_for_digest(messages: list):
+    """Append matches to their user's digest buffer; the first one starts the window."""
+    due = time.time() + DIGEST_WINDOW_SECONDS
+    pipe = r.pipeline(transaction=True)
+    for _, fields in messages:
+        user = fields.get("user_id") or fields.get("recipient", "")
+        pipe.rpush(DIGEST_BUFFER_PREFIX + user, json.dumps(fields))
+        pipe.zadd(DIGEST_DUE_KEY, {user: due}, nx=True)
+    pipe.hincrby(EMAIL_METRICS_KEY, "matches_buffered", len(messages))
+    pipe.execute()
+
+
+def flush_digest(conn: SmtpConnection, user: str):
+    # The claim decides which mailer owns this flush when several are running.
+    keys = [DIGEST_DUE_KEY, DIGEST_BUFFER_PREFIX + user, DIGEST_SENDING_PREFIX + user]
+    now = time.time()
+    raw = claim_digest(keys=keys, args=[user, now, now + DIGEST_LEASE_SECONDS])
+    if raw is None:
+        return
+    matches = [json.loads(x) for x in raw]
+    if not matches:
+        finish_digest(keys=keys, args=[user, now + DIGEST_WINDOW_SECONDS])
+        return
+
+    recipient = matches[0].get("recipient", "")
+    DIGEST_MATCHES.observe(len(matches))
+    sent = deliver(conn, recipient, build_digest_message(recipient, matches))
+    if not sent:
+        for fields in matches:
+            r.xadd(EMAIL_DEAD_STREAM, fields)
+    # The sending list goes only once its matches are sent or on the dead stream.
+    finish_digest(keys=keys, args=[user, time.time() + DIGEST_WINDOW_SECONDS])
+    if not sent:
+        return
+
+    pipe = r.pipeline(transaction=False)
+    pipe.hincrby(EMAIL_METRICS_KEY, "emails_sent", 1)
+    pipe.hincrby(EMAIL_METRICS_KEY, "matches_emailed", len(matches))
+    pipe.execute()
+
+    ids = []
+    for m in matches:
+        try:
+            ids.append(ObjectId(m.get("notification_id")))
+        except Exception:
+            continue
+    if ids:
+        db["notifications"].update_many(
+            by_ids(ids),
+            {"$set": {"emailed_at": int(time.time()), "digest_size": len(matches)}},
+        )
+
+
+def coalescing_stats() -> dict:
+    """Matches per email sent; 1.0 means no coalescing happened."""
+    raw = r.hgetall(EMAIL_METRICS_KEY)
+    emails = int(raw.get("emails_sent", 0))
+    matches = int(raw.get("matches_emailed", 0))
+    return {
+        "emails_sent": emails,
+        "matches_emailed": matches,
+        "matches_buffered": int(raw.get("matches_buffered", 0)),
+        "coalescing_ratio": round(matches / emails, 2) if emails else None,
+    }
+
+
+def flusher_loop(stop: threading.Event):
+    conn = SmtpConnection()
+    last_report = time.time()
+    try:
+        while not stop.is_set():
+            try:
+                for user in r.zrangebyscore(DIGEST_DUE_KEY, "-inf", time.time(), start=0, num=100):
+                    flush_digest(conn, user)
+            except Exception as e:
+                print(f"[email-sender] digest flush failed: {e}")
+                stop.wait(1)
+                continue
+            if time.time() - last_report > 60:
+                print(f"[email-sender] digest stats: {coalescing_stats()}")
+                last_report = time.time()
+            stop.wait(1)
+    finally:
+        conn.close()
+
+
+def handle(name: str, conn: SmtpConnection, messages: list):
+    """Send or buffer a batch. Immediate emails are acked one by one as they go out, so a
+    failure part-way only leaves the unsent ones pending; they are reclaimed later."""
+    try:
+        if EMAIL_MODE == "digest":
+            buffer_for_digest(messages)
+            r.xack(EMAIL_STREAM, EMAIL_GROUP, *[msg_id for msg_id, _ in messages])
+            return
+        for msg_id, fields in messages:
+            if not send_immediate(conn, fields):
+                r.xadd(EMAIL_DEAD_STREAM, fields)
+            r.xack(EMAIL_STREAM, EMAIL_GROUP, msg_id)
+    except Exception as e:
+        print(f"[email-sender] {name}: batch of {len(messages)} failed, leaving pending: {e}")
+
+
+def reclaim(name: str, conn: SmtpConnection):
+    """XAUTOCLAIM emails idle longer than EMAIL_CLAIM_IDLE_MS and send them from here.
+
+    Entries delivered more than EMAIL_MAX_DELIVERIES times go to the dead stream.
+    """
+    cursor = "0-0"
+    while True:
+        cursor, messages, *_ = r.xautoclaim(EMAIL_STREAM, EMAIL_GROUP, name, min_idle_time=EMAIL_CLAIM_IDLE_MS,
+                                            start_id=cursor, count=EMAIL_BATCH)
+        messages = [(i, f) for i, f in messages if i and f]
+        if messages:
+            ids = [i for i, _ in messages]
+            pending = r.xpending_range(EMAIL_STREAM, EMAIL_GROUP, min=ids[0], max=ids[-1], count=len(ids),
+                                       consumername=name)
+            deliveries = {p["message_id"]: p["times_delivered"] for p in pending}
+            poison = [(i, f) for i, f in messages if deliveries.get(i, 0) > EMAIL_MAX_DELIVERIES]
+            for _, fields in poison:
+                r.xadd(EMAIL_DEAD_STREAM, fields)
+            if poison:
+                r.xack(EMAIL_STREAM, EMAIL_GROUP, *[i for i, _ in poison])
+                EMAILS.inc(len(poison), outcome="dead")
+                print(f"[email-sender] {name}: dead-lettered {len(poison)} emails")
+            retry = [(i, f) for i, f in messages if deliveries.get(i, 0) <= EMAIL_MAX_DELIVERIES]
+            if retry:
+                print(f"[email-sender] {name}: reclaimed {len(retry)} stale emails")
+                handle(name, conn, retry)
+        if cursor == "0-0":
+            return
+
+
+def sender_loop(name: str, stop: threading.Event):
+    conn = SmtpConnection()
+    next_claim = 0.0
+    try:
+        while not stop.is_set():
+            try:
+                if time.time() >= next_claim:
+                    reclaim(name, conn)
+                    next_claim = time.time() + EMAIL_CLAIM_INTERVAL_SECONDS
+                resp = r.xreadgroup(EMAIL_GROUP, name, {EMAIL_STREAM: ">"}, count=EMAIL_BATCH, block=BLOCK_MS)
+            except redis.exceptions.RedisError as e:
+                print(f"[email-sender] {name}: {e}; retrying in 1s")
+                stop.wait(1)
+                continue
+            for _, messages in resp or []:
+                handle(name, conn, messages)
+    finally:
+        conn.close()
+
+
+def main():
+    metrics.serve(METRICS_PORT)
+    ensure_group()
+    if not smtp_configured():
+        print(f"[email-sender] SMTP not configured (SENDER_EMAIL/SENDER_PASSWORD); leaving {EMAIL_STREAM} queued")
+        return
+
+    stop = threading.Event()
+    prefix = f"{socket.gethostname()}-{os.getpid()}"
+    threads = [
+        threading.Thread(target=sender_loop, args=(f"{prefix}-{i}", stop), daemon=True)
+        for i in range(EMAIL_SENDERS)
+    ]
+    if EMAIL_MODE == "digest":
+        threads.append(threading.Thread(target=flusher_loop, args=(stop,), daemon=True))
+    for t in threads:
+        t.start()
+    print(f"[email-sender] {EMAIL_SENDERS} senders consuming {EMAIL_STREAM} mode={EMAIL_MODE}")
+    try:
+        while any(t.is_alive() for t in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop.set()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# Must match CLASS_NAMES in cv/app.py (the labels the CV service can emit).
+CLASS_NAMES = [
+    "apple", "banana", "orange", "grape", "strawberry",
+    "tomato", "potato", "bell_pepper", "cucumber", "carrot",
+    "broccoli", "bread", "cake", "pastry", "croissant",
+    "doughnut", "muffin", "cookie",
+]
+CLASS_INDEX = {name: i for i, name in enumerate(CLASS_NAMES)}
+
+
+def normalize_items(values) -> list:
+    return [str(x).strip().lower() for x in values or [] if str(x).strip()]
+
+
+def parse_location(user: dict):
+    loc = user.get("location") or {}
+    try:
+        return float(loc["lat"]), float(loc["lng"])
+    except Exception:
+        return None
+
+
+class UserMatcher:
+    """Columnar view of matchable users for one-pass radius and item matching.
+
+    Locations and radii live in contiguous float64 arrays; item filters are a
+    precomputed item -> user bitmap (one bool row per CLASS_NAMES entry, True
+    where the user accepts that item). Users without filters accept everything.
+    Rows can be upserted and removed in place, so the same matcher can back a
+    long-lived snapshot.
+    """
+
+    def __init__(self, users=(), capacity: int = 1024):
+        self.user_ids = []
+        self.emails = []
+        self.rows = {}
+        self.free_rows = []
+        self.n = 0
+        self._allocate(capacity)
+        for user in users:
+            self.upsert(user)
+
+    def _allocate(self, capacity: int):
+        old_n = self.n
+        fields = {
+            "lat": np.float64, "lng": np.float64, "cos_lat": np.float64, "radius_km": np.float64,
+            "active": bool, "accepts_all": bool,
+        }
+        for name, dtype in fields.items():
+            arr = np.zeros(capacity, dtype=dtype)
+            if old_n:
+                arr[:old_n] = getattr(self, name)[:old_n]
+            setattr(self, name, arr)
+
+        bitmap = np.zeros((len(CLASS_NAMES), capacity), dtype=bool)
+        if old_n:
+            bitmap[:, :old_n] = self.item_bitmap[:, :old_n]
+        self.item_bitmap = bitmap
+
+        # Filters that name something outside CLASS_NAMES get their own row.
+        extra = {}
+        for item, mask in getattr(self, "extra_items", {}).items():
+            extra[item] = np.zeros(capacity, dtype=bool)
+            extra[item][:old_n] = mask[:old_n]
+        self.extra_items = extra
+        self.capacity = capacity
+
+    @property
+    def size(self) -> int:
+        return len(self.rows)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.lat, self.lng, self.cos_lat, self.radius_km, self.active, self.accepts_all, self.item_bitmap]
+        return sum(a.nbytes for a in arrays) + sum(m.nbytes for m in self.extra_items.values())
+
+    def upsert(self, user: dict) -> bool:
+        """Insert or replace a user's row. Returns False (and drops the row) if unmatchable."""
+        user_id = str(user["_id"])
+        point = parse_location(user)
+        if point is None:
+            self.remove(user_id)
+            return False
+
+        row = self.rows.get(user_id)
+        if row is None:
+            if self.free_rows:
+                row = self.free_rows.pop()
+            else:
+                if self.n == self.capacity:
+                    self._allocate(max(1024, self.capacity * 2))
+                row = self.n
+                self.n += 1
+                self.user_ids.append(None)
+                self.emails.append(None)
+            self.rows[user_id] = row
+
+        self.user_ids[row] = user_id
+        self.emails[row] = user.get("email")
+        self.lat[row] = np.radians(point[0])
+        self.lng[row] = np.radians(point[1])
+        self.cos_lat[row] = np.cos(self.lat[row])
+        self.radius_km[row] = float(user.get("radius_km", 5) or 5)
+        self.active[row] = True
+
+        filters = normalize_items(user.get("item_filters"))
+        self.accepts_all[row] = not filters
+        self.item_bitmap[:, row] = not filters
+        for mask in self.extra_items.values():
+            mask[row] = False
+        for item in filters:
+            idx = CLASS_INDEX.get(item)
+            if idx is not None:
+                self.item_bitmap[idx, row] = True
+            else:
+                if item not in self.extra_items:
+                    self.extra_items[item] = np.zeros(self.capacity, dtype=bool)
+                self.extra_items[item][row] = True
+        return True
+
+    def remove(self, user_id: str):
+        row = self.rows.pop(user_id, None)
+        if row is None:
+            return
+        self.active[row] = False
+        self.user_ids[row] = None
+        self.emails[row] = None
+        self.free_rows.append(row)
+
+    def distances_km(self, s_lat: float, s_lng: float) -> np.ndarray:
+        n = self.n
+        phi = np.radians(s_lat)
+        lam = np.radians(s_lng)
+        a = np.sin((self.lat[:n] - phi) / 2) ** 2 + self.cos_lat[:n] * np.cos(phi) * np.sin((self.lng[:n] - lam) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def item_rows(self, items: list, cols: np.ndarray) -> np.ndarray:
+        """(len(items), len(cols)) bool matrix: which of the users in cols accept each item."""
+        rows = np.empty((len(items), cols.size), dtype=bool)
+        accepts_all = self.accepts_all[cols]
+        for k, item in enumerate(items):
+            idx = CLASS_INDEX.get(item)
+            if idx is not None:
+                rows[k] = self.item_bitmap[idx, cols]
+            elif item in self.extra_items:
+                np.logical_or(accepts_all, self.extra_items[item][cols], out=rows[k])
+            else:
+                rows[k] = accepts_all
+        return rows
+
+    def match(self, s_lat: float, s_lng: float, items: list) -> list:
+        """Return (row, item, distance_km) for every in-radius user accepting an item.
+
+        All items of the event are matched in the same pass; rows index
+        user_ids/emails.
+        """
+        items = list(dict.fromkeys(normalize_items(items)))
+        if not self.size or not items:
+            return []
+
+        dist = self.distances_km(s_lat, s_lng)
+        in_range = np.flatnonzero((dist <= self.radius_km[:self.n]) & self.active[:self.n])
+        if not in_range.size:
+            return []
+
+        hits = self.item_rows(items, in_range)
+        cand_idx, item_idx = np.nonzero(hits.T)
+        rows = in_range[cand_idx]
+        return [(int(row), items[k], float(dist[row])) for row, k in zip(rows, item_idx)]
@@ -0,0 +1,207 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import redis
+from bson import ObjectId
+
+from guardian_common import metrics
+from guardian_common.queries import USER_PROJECTION, by_ids, snapshot_filter
+from matcher import UserMatcher
+
+SNAPSHOT_USERS = metrics.gauge("worker_snapshot_users", "Users in the in-memory match snapshot")
+SNAPSHOT_BYTES = metrics.gauge("worker_snapshot_bytes", "Size of the snapshot's match arrays")
+# Unix times; staleness is time() - worker_snapshot_synced_timestamp_seconds.
+SNAPSHOT_LOADED = metrics.gauge("worker_snapshot_loaded_timestamp_seconds", "Last full snapshot load")
+SNAPSHOT_SYNCED = metrics.gauge("worker_snapshot_synced_timestamp_seconds",
+                                "Last time pending user changes were applied to the snapshot")
+
+
+class RWLock:
+    """Many readers or one writer. A waiting writer holds off new readers so prefs
+    updates aren't starved by a steady stream of matches."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.readers = 0
+        self.writing = False
+        self.writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self.cond:
+            while self.writing or self.writers_waiting:
+                self.cond.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.readers -= 1
+                if not self.readers:
+                    self.cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self.cond:
+            self.writers_waiting += 1
+            while self.writing or self.readers:
+                self.cond.wait()
+            self.writers_waiting -= 1
+            self.writing = True
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.writing = False
+                self.cond.notify_all()
+
+
+class UserSnapshot:
+    """In-memory copy of every matchable user, backed by a UserMatcher.
+
+    Loaded once from Mongo, then kept current from the user ids that
+    routes/prefs.py publishes on `channel`. Pub/sub is fire-and-forget, so the
+    snapshot also reloads in full every `reload_seconds` and after losing its
+    subscription.
+
+    With `regions` (geohash prefixes), only users located in those cells are
+    kept, so a regional worker's snapshot scales with its region.
+
+    Consumer threads match concurrently (NumPy releases the GIL for the
+    array work); updates wait for running matches and are applied alone.
+    """
+
+    __slots__ = (
+        "db", "r", "channel", "reload_seconds", "regions", "matcher", "cells", "lock", "refresh_lock",
+        "pubsub", "loaded_at", "synced_at", "updates_applied",
+    )
+
+    def __init__(self, db, r: redis.Redis, channel: str, reload_seconds: int = 3600, regions=None):
+        self.db = db
+        self.r = r
+        self.channel = channel
+        self.reload_seconds = reload_seconds
+        self.regions = tuple(regions) if regions else None
+        self.matcher = UserMatcher()
+        self.cells = {}  # user_id -> geohash, for per-cell matching
+        self.lock = RWLock()
+        # Consumer threads share one pub/sub connection; only one drains it at a time.
+        self.refresh_lock = threading.Lock()
+        self.pubsub = None
+        self.loaded_at = 0.0
+        self.synced_at = 0.0
+        self.updates_applied = 0
+
+    def load(self):
+        # Subscribe before reading so changes made during the load are replayed after it.
+        self._subscribe()
+        started = time.time()
+        query = snapshot_filter(self.regions)
+        cells = {}
+
+        def tracked(docs):
+            for doc in docs:
+                cells[str(doc["_id"])] = doc.get("geohash") or ""
+                yield doc
+
+        matcher = UserMatcher(tracked(self.db["users"].find(query, USER_PROJECTION)))
+        with self.lock.write():
+            self.matcher = matcher
+            self.cells = cells
+            self.loaded_at = started
+            self.synced_at = started
+        self._export()
+        SNAPSHOT_LOADED.set(started)
+        SNAPSHOT_SYNCED.set(started)
+        print(f"[worker] User snapshot loaded: {self.stats()}")
+
+    def _subscribe(self):
+        if self.pubsub is not None:
+            try:
+                self.pubsub.close()
+            except Exception:
+                pass
+        self.pubsub = self.r.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(self.channel)
+
+    def refresh(self):
+        """Apply pending user changes; cheap no-op when nothing was published."""
+        if not self.refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._refresh()
+        finally:
+            self.refresh_lock.release()
+
+    def _refresh(self):
+        if time.time() - self.loaded_at > self.reload_seconds:
+            self.load()
+            return
+
+        changed = set()
+        try:
+            while True:
+                msg = self.pubsub.get_message(timeout=0)
+                if msg is None:
+                    break
+                if msg.get("type") == "message" and msg.get("data"):
+                    changed.add(msg["data"])
+        except redis.exceptions.ConnectionError as e:
+            print(f"[worker] Lost {self.channel} subscription ({e}); reloading user snapshot")
+            self.load()
+            return
+
+        now = time.time()
+        if changed:
+            self.apply(changed)
+        self.synced_at = now
+        SNAPSHOT_SYNCED.set(now)
+
+    def apply(self, user_ids):
+        oids = []
+        for uid in user_ids:
+            try:
+                oids.append(ObjectId(uid))
+            except Exception:
+                continue
+        docs = {str(d["_id"]): d for d in self.db["users"].find(by_ids(oids), USER_PROJECTION)}
+
+        with self.lock.write():
+            for uid in user_ids:
+                doc = docs.get(uid)
+                if doc is None or not doc.get("notify") or not self.owns(doc.get("geohash")):
+                    self.matcher.remove(uid)
+                    self.cells.pop(uid, None)
+                else:
+                    self.matcher.upsert(doc)
+                    self.cells[uid] = doc.get("geohash") or ""
+            self.updates_applied += len(user_ids)
+            self._export()
+
+    def _export(self):
+        SNAPSHOT_USERS.set(self.matcher.size)
+        SNAPSHOT_BYTES.set(self.matcher.nbytes)
+
+    def owns(self, geohash) -> bool:
+        return self.regions is None or (geohash or "").startswith(self.regions)
+
+    def match(self, s_lat: float, s_lng: float, items: list, cell: str = None) -> list:
+        """(user_id, email, item, distance_km) for every matching user, only those in `cell` if given."""
+        with self.lock.read():
+            m = self.matcher
+            matches = [(m.user_ids[row], m.emails[row], item, dist) for row, item, dist in m.match(s_lat, s_lng, items)]
+            if cell:
+                matches = [x for x in matches if self.cells.get(x[0], "").startswith(cell)]
+            return matches
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "users": self.matcher.size,
+            "capacity": self.matcher.capacity,
+            "array_bytes": self.matcher.nbytes,
+            "age_s": round(now - self.loaded_at, 1),
+            "staleness_s": round(now - self.synced_at, 1),
+            "updates_applied": self.updates_applied,
+        }
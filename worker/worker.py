@@ -1,7 +1,13 @@
-import os, json, time, math
+import os, json, time, math, socket, threading
+from datetime import datetime, timezone
 import redis
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+from guardian_common import metrics
+from guardian_common.queries import CANDIDATE_PROJECTION, candidate_users_filter
 from email_client import send_match_notification
+from matcher import UserMatcher, EARTH_RADIUS_KM
+from user_snapshot import UserSnapshot
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://db:27017")
@@ -9,26 +15,108 @@ MONGO_DB = os.getenv("MONGO_DB", "guardian")
 
 STREAM_KEY = os.getenv("EVENT_STREAM", "events:surplus")
 GROUP = os.getenv("EVENT_GROUP", "worker-group")
-CONSUMER = os.getenv("EVENT_CONSUMER", "worker-1")
+# Consumer names default to <hostname>-<pid>[-<thread>] so replicas never collide.
+CONSUMER = os.getenv("EVENT_CONSUMER") or f"{socket.gethostname()}-{os.getpid()}"
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "1"))
+DEAD_STREAM_KEY = os.getenv("EVENT_DEAD_STREAM", f"{STREAM_KEY}:dead")
+
+# The API publishes each event to <STREAM_KEY>:<cell> for every geohash cell within
+# MAX_RADIUS_KM of the store (api/core/events.py) and registers the cell in REGIONS_KEY.
+# WORKER_REGIONS lists the cells this worker owns: it reads only their streams and only
+# loads users whose geohash starts with one of them. "*" owns every registered cell plus
+# the unsharded STREAM_KEY.
+WORKER_REGIONS = [c.strip() for c in os.getenv("WORKER_REGIONS", "*").split(",") if c.strip()]
+REGIONS_KEY = os.getenv("EVENT_REGIONS_KEY", f"{STREAM_KEY}:regions")
+REGION_REFRESH_SECONDS = int(os.getenv("REGION_REFRESH_SECONDS", "30"))
+OWNS_ALL_REGIONS = WORKER_REGIONS in ([], ["*"])
 
 DEDUP_TTL_SECONDS = int(os.getenv("DEDUP_TTL_SECONDS", "900"))
 BLOCK_MS = int(os.getenv("BLOCK_MS", "5000"))
+# XREADGROUP COUNT grows while reads come back full and shrinks when they don't.
+READ_COUNT_MIN = int(os.getenv("READ_COUNT_MIN", "10"))
+READ_COUNT_MAX = int(os.getenv("READ_COUNT_MAX", "500"))
+BUSY_BLOCK_MS = int(os.getenv("BUSY_BLOCK_MS", "100"))
+
+# Pending entries idle this long belong to a dead or stuck consumer and are reclaimed.
+CLAIM_IDLE_MS = int(os.getenv("CLAIM_IDLE_MS", "60000"))
+CLAIM_INTERVAL_SECONDS = int(os.getenv("CLAIM_INTERVAL_SECONDS", "30"))
+MAX_DELIVERIES = int(os.getenv("MAX_DELIVERIES", "5"))
+# Same as the API's EVENT_RETENTION_SECONDS. The API trims a stream on every XADD; the
+# worker trims its streams each claim cycle so a region that has gone quiet ages out too.
+EVENT_RETENTION_SECONDS = int(os.getenv("EVENT_RETENTION_SECONDS", "86400"))
+
+# Upper bound on any user's radius_km (routes/prefs.py caps it at 100). Used as the
+# search radius for the geo candidate query; each user's own radius is checked after.
+MAX_RADIUS_KM = float(os.getenv("MAX_RADIUS_KM", "100"))
+
+# Match against an in-memory user snapshot instead of querying Mongo per event.
+USER_SNAPSHOT = os.getenv("USER_SNAPSHOT", "1") == "1"
+USER_CHANGES_CHANNEL = os.getenv("USER_CHANGES_CHANNEL", "users:changed")
+SNAPSHOT_RELOAD_SECONDS = int(os.getenv("SNAPSHOT_RELOAD_SECONDS", "3600"))
+STORE_CACHE_TTL_SECONDS = int(os.getenv("STORE_CACHE_TTL_SECONDS", "60"))
+
+# "stream" hands emails to email_sender.py via EMAIL_STREAM; "inline" sends from this loop.
+EMAIL_DELIVERY = os.getenv("EMAIL_DELIVERY", "stream")
+EMAIL_STREAM = os.getenv("EMAIL_STREAM", "notify:email")
+
+# Live dashboard push: each notification is appended to feed:<user_id> (what the API's SSE
+# endpoint replays from Last-Event-ID) and the user id is published on FEED_CHANNEL to wake it.
+FEED_CHANNEL = os.getenv("FEED_CHANNEL", "feed:events")
+FEED_MAXLEN = int(os.getenv("FEED_MAXLEN", "200"))
+FEED_TTL_SECONDS = int(os.getenv("FEED_TTL_SECONDS", "86400"))
+
+# GET /metrics (Prometheus text) and /debug/profile on this port; 0 = off.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+EVENTS = metrics.counter("worker_events_total", "Stream entries handled, by outcome (ok, failed, dead)", ["outcome"])
+STAGE = metrics.histogram("worker_stage_seconds", "Time per batch spent in each processing stage", ["stage"])
+MATCHES = metrics.histogram("worker_matches_per_event", "Candidate notifications per event, before dedup",
+                            buckets=metrics.COUNT_BUCKETS)
+NOTIFICATIONS = metrics.counter("worker_notifications_total", "Matches by dedup outcome (new, duplicate)",
+                                ["outcome"])
+MONGO_SECONDS = metrics.histogram("worker_mongo_seconds", "Mongo command round-trip", ["command", "collection"])
 
 r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
-mongo = MongoClient(MONGO_URI)
+# The API seeds notif:unread:<user_id> from Mongo with a short TTL (UNREAD_TTL_SECONDS); an INCR
+# on a missing key would restart it at 1, so only an existing counter is bumped.
+incr_unread = r.register_script(
+    "if redis.call('EXISTS', KEYS[1]) == 1 then return redis.call('INCR', KEYS[1]) end return false")
+mongo = MongoClient(MONGO_URI, event_listeners=[metrics.mongo_listener(MONGO_SECONDS)])
 db = mongo[MONGO_DB]
 
-def ensure_group():
+snapshot = (UserSnapshot(db, r, USER_CHANGES_CHANNEL, SNAPSHOT_RELOAD_SECONDS,
+                         regions=None if OWNS_ALL_REGIONS else WORKER_REGIONS)
+            if USER_SNAPSHOT else None)
+_store_cache = {}
+_streams = {"keys": [], "at": 0.0}
+_streams_lock = threading.Lock()
+
+def ensure_group(stream: str = STREAM_KEY):
     try:
-        r.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
-        print(f"[worker] Created group={GROUP} stream={STREAM_KEY}")
+        r.xgroup_create(stream, GROUP, id="0", mkstream=True)
+        print(f"[worker] Created group={GROUP} stream={stream}")
     except redis.exceptions.ResponseError as e:
         if "BUSYGROUP" not in str(e):
             raise
 
 
+def owned_streams() -> list:
+    """Streams this worker reads, re-listing registered regions every REGION_REFRESH_SECONDS."""
+    with _streams_lock:
+        if _streams["keys"] and time.time() - _streams["at"] < REGION_REFRESH_SECONDS:
+            return _streams["keys"]
+        if OWNS_ALL_REGIONS:
+            keys = [STREAM_KEY] + [f"{STREAM_KEY}:{cell}" for cell in sorted(r.smembers(REGIONS_KEY))]
+        else:
+            keys = [f"{STREAM_KEY}:{cell}" for cell in WORKER_REGIONS]
+        for key in set(keys) - set(_streams["keys"]):
+            ensure_group(key)
+        _streams["keys"], _streams["at"] = keys, time.time()
+        return keys
+
+
 def haversine_km(lat1, lon1, lat2, lon2) -> float:
-    R = 6371.0
+    R = EARTH_RADIUS_KM
     phi1 = math.radians(lat1)
     phi2 = math.radians(lat2)
     dphi = math.radians(lat2 - lat1)
@@ -37,10 +125,43 @@ def haversine_km(lat1, lon1, lat2, lon2) -> float:
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
     return R * c
 
-def process(event_id: str, fields: dict):
+
+def candidate_users(s_lat: float, s_lng: float, cell: str = None):
+    """Users with notifications on whose location is within MAX_RADIUS_KM of the store.
+
+    Served by the notify_geo 2dsphere index instead of scanning every user. With a cell,
+    only users whose geohash is in it (the region the event was routed to)."""
+    return db["users"].find(candidate_users_filter(s_lat, s_lng, MAX_RADIUS_KM, cell), CANDIDATE_PROJECTION)
+
+
+def match_users(s_lat: float, s_lng: float, items: list, cell: str = None):
+    """Return (user_id, email, item, distance_km) for every user whose radius and filters match."""
+    if snapshot is not None:
+        snapshot.refresh()
+        return snapshot.match(s_lat, s_lng, items, cell)
+
+    matcher = UserMatcher(candidate_users(s_lat, s_lng, cell))
+    return [(matcher.user_ids[row], matcher.emails[row], item, dist)
+            for row, item, dist in matcher.match(s_lat, s_lng, items)]
+
+
+def get_store(store_id: str):
+    cached = _store_cache.get(store_id)
+    if cached and time.time() - cached[0] < STORE_CACHE_TTL_SECONDS:
+        return cached[1]
+    store = db["stores"].find_one({"_id": store_id})
+    if store:
+        _store_cache[store_id] = (time.time(), store)
+    return store
+
+
+def match_event(event_id: str, fields: dict) -> list:
+    """Candidate notifications for one event, before dedup."""
     store_id = fields.get("store_id")
     items = fields.get("items", "[]")
     ts = fields.get("timestamp") or int(time.time())
+    # Region stream the event was read from; the same event reaches each cell's users once.
+    cell = fields.get("cell")
 
     if isinstance(items, str):
         try:
@@ -50,78 +171,283 @@ def process(event_id: str, fields: dict):
 
     if not store_id or not isinstance(items, list):
         print(f"[worker] Bad event {event_id}: {fields}")
-        return
+        return []
 
-    store = db["stores"].find_one({"_id": store_id})
+    store = get_store(store_id)
     if not store or not store.get("location"):
         print(f"[worker] Store not found or missing location: {store_id}")
-        return
+        return []
 
     s_lat = float(store["location"]["lat"])
     s_lng = float(store["location"]["lng"])
+    store_name = store.get("name", "Unknown Store")
+
+    created_at = datetime.now(timezone.utc)
+    matches = []
+    for user_id, user_email, item, dist in match_users(s_lat, s_lng, items, cell):
+        matches.append({
+            "notif": {
+                "user_id": user_id,
+                "store_id": store_id,
+                "item": item,
+                "event_id": event_id,
+                "timestamp": int(ts),
+                "distance_km": dist,
+                "read": False,
+                "created_at": created_at,
+            },
+            "email": user_email,
+            "store_name": store_name,
+        })
+    return matches
 
-    users = db["users"].find({"notify": True, "location": {"$ne": None}})
 
-    for user in users:
-        user_id = str(user["_id"])
-        loc = user.get("location") or {}
-        try:
-            u_lat = float(loc["lat"])
-            u_lng = float(loc["lng"])
-        except Exception:
-            continue
+def commit_matches(matches: list) -> list:
+    """Claim dedup keys in one pipeline and persist survivors with one insert_many.
 
-        radius_km = float(user.get("radius_km", 5) or 5)
-        dist = haversine_km(u_lat, u_lng, s_lat, s_lng)
-        if dist > radius_km:
-            continue
+    If the insert fails, the claims of the unwritten notifications are released
+    and the error propagates, so the events stay unacked and are redelivered.
+    Notifications that were written are announced and emailed before that.
+    """
+    if not matches:
+        return []
 
-        filters = user.get("item_filters", []) or []
-        filters = [str(x).strip().lower() for x in filters if str(x).strip()]
-        for item in items:
-            item = str(item).strip().lower()
-            if not item:
-                continue
-            if filters and item not in filters:
-                continue
+    keys = [f"dedup:{m['notif']['user_id']}:{m['notif']['store_id']}:{m['notif']['item']}" for m in matches]
+    pipe = r.pipeline(transaction=False)
+    for key in keys:
+        pipe.set(key, "1", nx=True, ex=DEDUP_TTL_SECONDS)
+    with STAGE.time(stage="dedup"):
+        claimed = pipe.execute()
+
+    survivors = [m for m, ok in zip(matches, claimed) if ok]
+    survivor_keys = [k for k, ok in zip(keys, claimed) if ok]
+    if not survivors:
+        return []
+
+    try:
+        with STAGE.time(stage="insert"):
+            db["notifications"].insert_many([m["notif"] for m in survivors], ordered=False)
+    except BulkWriteError as e:
+        failed = {err["index"] for err in e.details.get("writeErrors", [])}
+        if failed:
+            r.delete(*[survivor_keys[i] for i in failed])
+        # The written ones are deduped on redelivery, so this is their only chance to go out.
+        written = [m for i, m in enumerate(survivors) if i not in failed]
+        announce(written)
+        enqueue_emails(written)
+        raise
+    except Exception:
+        r.delete(*survivor_keys)
+        raise
+    with STAGE.time(stage="announce"):
+        announce(survivors)
+    return survivors
 
-            dedup_key = f"dedup:{user_id}:{store_id}:{item}"
-            if not r.set(dedup_key, "1", nx=True, ex=DEDUP_TTL_SECONDS):
-                print(f"[worker] Dedup hit {dedup_key}")
+
+def announce(written: list):
+    """Bump the per-user unread counters that exist and push the notifications to the users' live feeds."""
+    if not written:
+        return
+    pipe = r.pipeline(transaction=False)
+    for m in written:
+        notif = m["notif"]
+        incr_unread(keys=[f"notif:unread:{notif['user_id']}"], client=pipe)
+
+        feed = f"feed:{notif['user_id']}"
+        pipe.xadd(feed, {
+            "notification_id": str(notif.get("_id", "")),
+            "store_id": notif["store_id"],
+            "store_name": m["store_name"],
+            "item": notif["item"],
+            "distance_km": notif["distance_km"],
+            "timestamp": notif["timestamp"],
+        }, maxlen=FEED_MAXLEN, approximate=True)
+        pipe.expire(feed, FEED_TTL_SECONDS)
+    for user_id in {m["notif"]["user_id"] for m in written}:
+        pipe.publish(FEED_CHANNEL, user_id)
+    pipe.execute()
+
+
+def process_batch(messages: list):
+    """Match, dedup and persist a batch of (event_id, fields) stream messages together."""
+    matches = []
+    with STAGE.time(stage="match"):
+        for event_id, fields in messages:
+            found = match_event(event_id, fields)
+            MATCHES.observe(len(found))
+            matches.extend(found)
+
+    survivors = commit_matches(matches)
+    NOTIFICATIONS.inc(len(survivors), outcome="new")
+    NOTIFICATIONS.inc(len(matches) - len(survivors), outcome="duplicate")
+    print(f"[worker] batch events={len(messages)} matches={len(matches)} "
+          f"dedup_hits={len(matches) - len(survivors)} notified={len(survivors)}")
+
+    with STAGE.time(stage="email"):
+        enqueue_emails(survivors)
+
+
+def enqueue_emails(survivors: list):
+    with_email = [m for m in survivors if m["email"]]
+    if not with_email:
+        return
+
+    if EMAIL_DELIVERY == "inline":
+        for m in with_email:
+            send_match_notification(
+                recipient_email=m["email"],
+                store_name=m["store_name"],
+                item=m["notif"]["item"],
+                distance_km=m["notif"]["distance_km"]
+            )
+        return
+
+    pipe = r.pipeline(transaction=False)
+    for m in with_email:
+        notif = m["notif"]
+        pipe.xadd(EMAIL_STREAM, {
+            "recipient": m["email"],
+            "user_id": notif["user_id"],
+            "store_name": m["store_name"],
+            "item": notif["item"],
+            "distance_km": notif["distance_km"],
+            "notification_id": str(notif.get("_id", "")),
+        })
+    pipe.execute()
+
+
+def process(event_id: str, fields: dict):
+    process_batch([(event_id, fields)])
+
+
+def handle(name: str, messages: list, handler=None, stream: str = STREAM_KEY) -> bool:
+    """Run one batch through the handler and ack it with a single XACK.
+
+    If the batch fails, its events are retried one at a time so a single bad event
+    doesn't keep the rest pending (and dead-letter them with it): the ones that go
+    through are acked, the ones that fail stay pending and are reclaimed. Redoing the
+    events that were already committed is safe; their matches are deduped.
+    """
+    handler = handler or process_batch
+    live = [(event_id, fields) for event_id, fields in messages if fields]
+    try:
+        if live:
+            handler(live)
+    except Exception as e:
+        if len(live) == 1:
+            print(f"[worker] {name}: event {live[0][0]} from {stream} failed, leaving pending: {e}")
+            EVENTS.inc(outcome="failed")
+            return False
+        print(f"[worker] {name}: batch of {len(live)} from {stream} failed, retrying one at a time: {e}")
+        done = [event_id for event_id, fields in messages if not fields]
+        for event_id, fields in live:
+            try:
+                handler([(event_id, fields)])
+            except Exception as e:
+                print(f"[worker] {name}: event {event_id} from {stream} failed, leaving pending: {e}")
+                EVENTS.inc(outcome="failed")
                 continue
+            done.append(event_id)
+            EVENTS.inc(outcome="ok")
+        if done:
+            r.xack(stream, GROUP, *done)
+        return len(done) == len(messages)
+    r.xack(stream, GROUP, *[event_id for event_id, _ in messages])
+    EVENTS.inc(len(live), outcome="ok")
+    return True
 
-            notif = {
-                "user_id": user_id,
-                "store_id": store_id,
-                "item": item,
-                "event_id": event_id,
-                "timestamp": int(ts),
-                "distance_km": dist
-            }
-            db["notifications"].insert_one(notif)
-            print(f"[worker] MATCH -> notify stub: {notif}")
-
-            user_email = user.get("email")
-            store_name = store.get("name", "Unknown Store")
-            if user_email:
-                send_match_notification(
-                    recipient_email=user_email,
-                    store_name=store_name,
-                    item=item,
-                    distance_km=dist
-                )
 
-def main():
-    ensure_group()
-    print("[worker] loop starting...")
+def reclaim(name: str, count: int, handler=None, stream: str = STREAM_KEY):
+    """XAUTOCLAIM entries idle longer than CLAIM_IDLE_MS and process them here.
+
+    Entries delivered more than MAX_DELIVERIES times are moved to the dead stream.
+    """
+    cursor = "0-0"
     while True:
-        resp = r.xreadgroup(GROUP, CONSUMER, {STREAM_KEY: ">"}, count=10, block=BLOCK_MS)
+        resp = r.xautoclaim(stream, GROUP, name, min_idle_time=CLAIM_IDLE_MS, start_id=cursor, count=count)
+        cursor, messages = resp[0], [(i, f) for i, f in resp[1] if i]
+        if messages:
+            ids = [event_id for event_id, _ in messages]
+            pending = r.xpending_range(stream, GROUP, min=ids[0], max=ids[-1], count=len(ids), consumername=name)
+            deliveries = {p["message_id"]: p["times_delivered"] for p in pending}
+            poison = [(i, f) for i, f in messages if deliveries.get(i, 0) > MAX_DELIVERIES]
+            for event_id, fields in poison:
+                r.xadd(DEAD_STREAM_KEY, {**(fields or {}), "event_id": event_id, "stream": stream})
+            if poison:
+                r.xack(stream, GROUP, *[i for i, _ in poison])
+                EVENTS.inc(len(poison), outcome="dead")
+                print(f"[worker] {name}: dead-lettered {len(poison)} events from {stream}")
+            retry = [(i, f) for i, f in messages if deliveries.get(i, 0) <= MAX_DELIVERIES]
+            if retry:
+                print(f"[worker] {name}: reclaimed {len(retry)} stale events from {stream}")
+                handle(name, retry, handler, stream)
+        if cursor == "0-0":
+            return
+
+
+def trim(stream: str):
+    """Drop entries older than EVENT_RETENTION_SECONDS (approximate: whole macro-nodes only)."""
+    minid = f"{int((time.time() - EVENT_RETENTION_SECONDS) * 1000)}-0"
+    trimmed = r.xtrim(stream, minid=minid, approximate=True)
+    if trimmed:
+        print(f"[worker] trimmed {trimmed} events older than {EVENT_RETENTION_SECONDS}s from {stream}")
+
+
+def consume(name: str, stop: threading.Event, handler=None):
+    count = READ_COUNT_MIN
+    block = BLOCK_MS
+    next_claim = 0.0
+    while not stop.is_set():
+        streams = owned_streams()
+        if time.time() >= next_claim:
+            for stream in streams:
+                reclaim(name, READ_COUNT_MAX, handler, stream)
+                trim(stream)
+            next_claim = time.time() + CLAIM_INTERVAL_SECONDS
+
+        resp = r.xreadgroup(GROUP, name, {stream: ">" for stream in streams}, count=count, block=block)
         if not resp:
+            count = READ_COUNT_MIN
+            block = BLOCK_MS
+            if snapshot is not None:
+                snapshot.refresh()
             continue
-        for _, messages in resp:
-            for event_id, fields in messages:
-                process(event_id, fields)
-                r.xack(STREAM_KEY, GROUP, event_id)
+
+        for stream, messages in resp:
+            # Ack only after the whole batch is persisted (at-least-once).
+            handle(name, messages, handler, stream)
+            if len(messages) >= count:
+                count = min(READ_COUNT_MAX, count * 2)
+            elif len(messages) < count // 4:
+                count = max(READ_COUNT_MIN, count // 2)
+        # Backlog: keep reads short so claims and snapshot refreshes stay timely.
+        block = BUSY_BLOCK_MS
+
+
+def consumer_names() -> list:
+    if WORKER_CONCURRENCY == 1:
+        return [CONSUMER]
+    return [f"{CONSUMER}-{i}" for i in range(WORKER_CONCURRENCY)]
+
+
+def main():
+    metrics.serve(METRICS_PORT)
+    streams = owned_streams()
+    if snapshot is not None:
+        snapshot.load()
+
+    stop = threading.Event()
+    names = consumer_names()
+    threads = [threading.Thread(target=consume, args=(name, stop), daemon=True) for name in names]
+    for t in threads:
+        t.start()
+    print(f"[worker] loop starting: consumers={names} group={GROUP} regions={','.join(WORKER_REGIONS)} "
+          f"streams={len(streams)} metrics=:{METRICS_PORT}")
+    try:
+        while any(t.is_alive() for t in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop.set()
 
 if __name__ == "__main__":
     main()